@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# compare shipping records to analyze, list of dicts vs column batches: pickled size & data frame construction
+import argparse
+import os
+import pickle
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+from deep_log.columnar import ColumnBuilder, concat_batches
+from deep_log.handler import TypeLogHandler
+from deep_log.parser import DefaultLogParser
+
+PATTERN = r'\[(?P<time>.*?)\] \[(?P<level>.*?)\] worker (?P<worker>\d+) latency (?P<latency>\d+) (?P<message>.*)'
+
+
+def generate(file_name, lines):
+    levels = ['error', 'notice', 'warn']
+    with open(file_name, 'w') as f:
+        for index in range(lines):
+            f.write('[Sun Dec 04 04:52:15 2005] [{}] worker {} latency {} env in error state {}\n'.format(
+                random.choice(levels), index % 50, random.randint(0, 1000), random.randint(0, 10)))
+
+
+def load(file_name):
+    parser = DefaultLogParser(pattern=PATTERN)
+    handler = TypeLogHandler(definitions=[{'field': 'worker', 'type': 'int'}, {'field': 'latency', 'type': 'int'},
+                                          {'field': 'time', 'type': 'datetime', 'format': '%a %b %d %H:%M:%S %Y'}])
+    with open(file_name) as f:
+        return [handler.handle(one) for one in parser.parse_file(f)]
+
+
+def measure_records(records, batch_size):
+    start = time.perf_counter()
+    payloads = [pickle.dumps(records[index:index + batch_size], pickle.HIGHEST_PROTOCOL)
+                for index in range(0, len(records), batch_size)]
+    df = pd.DataFrame([one for payload in payloads for one in pickle.loads(payload)])
+    return sum(len(one) for one in payloads), time.perf_counter() - start, len(df)
+
+
+def measure_columns(records, file_name, batch_size):
+    start = time.perf_counter()
+    payloads = [pickle.dumps(one, pickle.HIGHEST_PROTOCOL)
+                for one in ColumnBuilder(file_name, batch_size).build(records)]
+    df = concat_batches([pickle.loads(one) for one in payloads])
+    return sum(len(one) for one in payloads), time.perf_counter() - start, len(df)
+
+
+def main():
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument('--lines', type=int, default=200000, help='lines of generated log')
+    args_parser.add_argument('--batch-size', type=int, default=1000, help='records per shipped batch')
+    args = args_parser.parse_args()
+
+    file_name = os.path.join(tempfile.mkdtemp(), 'bench.log')
+    generate(file_name, args.lines)
+    records = load(file_name)
+
+    results = {}
+    for name, measure in (('records', lambda: measure_records(records, args.batch_size)),
+                          ('columnar', lambda: measure_columns(records, file_name, args.batch_size))):
+        size, elapsed, rows = measure()
+        results[name] = (size, elapsed)
+        print('{:<10} {:>10} rows {:>12.1f} KB shipped {:>8.3f}s'.format(name, rows, size / 1024, elapsed))
+
+    print('shipped    {:.2f}x smaller, {:.2f}x faster'.format(results['records'][0] / results['columnar'][0],
+                                                              results['records'][1] / results['columnar'][1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# compare reading gzip compressed log, zcat | grep vs DefaultLogParser over CompressedFile (whole file & by seek points)
+import argparse
+import gzip
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+from deep_log.compression import CompressedFile, SeekPointStore
+from deep_log.parser import DefaultLogParser
+
+PATTERN = r'\[(?P<time>.*?)\] \[(?P<level>.*?)\] (?P<message>.*)'
+NEEDLE = 'state 7'
+
+
+def generate(file_name, lines, member_size):
+    # gzip file, a new member every member size (bytes) of log, single member if member size is 0
+    levels = ['error', 'notice', 'warn']
+    content = []
+    for index in range(lines):
+        content.append('[Sun Dec 04 04:52:15 2005] [{}] worker {} env in error state {}\n'.format(
+            random.choice(levels), index, random.randint(0, 10)))
+    data = ''.join(content).encode()
+    with open(file_name, 'wb') as f:
+        start = 0
+        while start < len(data):
+            end = data.find(b'\n', start + member_size) + 1 if member_size else 0
+            end = end if end > 0 else len(data)
+            f.write(gzip.compress(data[start:end]))
+            start = end
+
+
+def measure_zcat(file_name):
+    if not shutil.which('zcat'):
+        return None, None
+    start = time.perf_counter()
+    output = subprocess.run('zcat {} | grep -c "{}"'.format(file_name, NEEDLE), shell=True, stdout=subprocess.PIPE)
+    return int(output.stdout.strip() or 0), time.perf_counter() - start
+
+
+def measure_parser(file_name, ranges, seek_points):
+    parser = DefaultLogParser(pattern=PATTERN)
+    start = time.perf_counter()
+    count = 0
+    for begin, end in ranges:
+        with CompressedFile(file_name, 'gzip', seek_points) as f:
+            count = count + sum(1 for one in parser.parse_file(f, begin, end) if NEEDLE in one.get('message'))
+    return count, time.perf_counter() - start
+
+
+def main():
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument('--lines', type=int, default=500000, help='lines of generated log')
+    args_parser.add_argument('--member-size', type=int, default=4, help='MB of log per gzip member of multi member file')
+    args_parser.add_argument('--shard-size', type=int, default=8, help='MB of log per shard')
+    args = args_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    store = SeekPointStore(os.path.join(work_dir, 'seekpoints'))
+    parser = DefaultLogParser(pattern=PATTERN)
+    for name, member_size in (('single', 0), ('multi', args.member_size * 1024 * 1024)):
+        file_name = os.path.join(work_dir, name + '.log.gz')
+        generate(file_name, args.lines, member_size)
+
+        count, elapsed = measure_zcat(file_name)
+        if elapsed is not None:
+            print('{:<8} {:<18} {:>10} matched {:>8.3f}s'.format(name, 'zcat | grep', count, elapsed))
+
+        # first read records seek points
+        with store.open(file_name, 'gzip', binary=True) as f:
+            while f.read(1024 * 1024):
+                pass
+        count, elapsed = measure_parser(file_name, [(0, None)], None)
+        print('{:<8} {:<18} {:>10} matched {:>8.3f}s'.format(name, 'deep-log', count, elapsed))
+
+        loaded = store.load(file_name)
+        ranges = store.split(file_name, 'gzip', parser, args.shard_size * 1024 * 1024)
+        count, elapsed = measure_parser(file_name, ranges, loaded[0] if loaded else None)
+        # shards run sequentially here, elapsed / shards approximates time with one worker per shard
+        print('{:<8} {:<18} {:>10} matched {:>8.3f}s {:>4} shards, {:.3f}s per shard'.format(
+            name, 'deep-log shards', count, elapsed, len(ranges), elapsed / len(ranges)))
+
+    shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# compare dispatching file tasks to pool workers by file count: bound engine method pickled for every task
+# (chunk size 1) vs engine sent once per worker by pool initializer, tasks in adaptive chunks
+import argparse
+import multiprocessing as mp
+import os
+import pickle
+import random
+import tempfile
+import time
+
+from deep_log.analyzer import LogAnalyzer
+from deep_log.config import LogConfig
+from deep_log.engine import LogEngine
+from deep_log.miner import DeepLogMiner
+from deep_log.record_writer import LogRecordWriterFactory
+
+CONFIG = '''
+root:
+  parser:
+    name: DefaultLogParser
+    params:
+      pattern: '\\[(?P<time>.*?)\\] \\[(?P<level>.*?)\\] (?P<message>.*)'
+  path: /
+loggers:
+  - name: bench
+    path: {}
+'''
+
+
+def generate(log_dir, files, lines):
+    levels = ['error', 'notice', 'warn']
+    for index in range(files):
+        with open(os.path.join(log_dir, 'f{}.log'.format(index)), 'w') as f:
+            for line in range(lines):
+                f.write('[Sun Dec 04 04:52:15 2005] [{}] worker {} env in error state {}\n'.format(
+                    random.choice(levels), line, random.randint(0, 10)))
+
+
+def create_engine(work_dir, log_dir, workers):
+    config_dir = os.path.join(work_dir, 'config')
+    os.makedirs(config_dir, exist_ok=True)
+    with open(os.path.join(config_dir, 'config.yaml'), 'w') as f:
+        f.write(CONFIG.format(log_dir))
+    analyzer = LogAnalyzer(group_by='level', agg='count')
+    return LogEngine(DeepLogMiner(LogConfig(config_dir)), analyzer, LogRecordWriterFactory.create(None, False),
+                     targets=[log_dir], workers=workers)
+
+
+def measure_per_task(engine):
+    start = time.perf_counter()
+    tasks = [(task_id, *one) for task_id, one in enumerate(engine.log_miner.split_files(
+        engine.log_miner.get_target_files(engine.targets), engine.shard_size))]
+    with mp.Pool(processes=engine.workers) as pool:
+        groups = [result for result, stats in pool.imap(engine.aggregate_files, tasks, chunksize=1)]
+    return len(groups), time.perf_counter() - start
+
+
+def measure_initializer(engine):
+    start = time.perf_counter()
+    groups = list(engine.map_shards(engine.aggregate_files))
+    return len(groups), time.perf_counter() - start
+
+
+def main():
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument('--files', default='10,100,1000,5000', help='file counts separated by comma')
+    args_parser.add_argument('--lines', type=int, default=20, help='lines per file')
+    args_parser.add_argument('--workers', type=int, default=4, help='pool workers')
+    args = args_parser.parse_args()
+
+    for files in [int(one) for one in args.files.split(',')]:
+        work_dir = tempfile.mkdtemp()
+        log_dir = os.path.join(work_dir, 'logs')
+        os.makedirs(log_dir)
+        generate(log_dir, files, args.lines)
+        engine = create_engine(work_dir, log_dir, args.workers)
+
+        task_size = len(pickle.dumps(engine.aggregate_files))
+        tasks, per_task = measure_per_task(engine)
+        _, initializer = measure_initializer(engine)
+        print('{:>6} files {:>6} tasks  per task {:>8.3f}s ({} bytes sent per task)  initializer {:>8.3f}s  '
+              '{:.2f}x'.format(files, tasks, per_task, task_size, initializer, per_task / initializer))
+
+
+if __name__ == '__main__':
+    main()
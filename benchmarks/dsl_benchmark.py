@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# multi filter query, filters evaluated one by one with eval vs one fused compiled predicate
+import argparse
+import time
+
+from deep_log import dsl
+from deep_log.filter import DslFilter
+from filter_benchmark import build_records
+
+QUERIES = [
+    ["level == 'error'"],
+    ["level == 'error'", "'worker' in _record"],
+    ["level == 'error'", "'worker' in _record", "time.timestamp() - 1133661135 > 0", "tags & {'important'} or True"],
+]
+
+
+def measure(run, rounds):
+    best = None
+    for one in range(rounds):
+        start = time.perf_counter()
+        count = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count, best
+
+
+def main():
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument('--records', type=int, default=100000, help='records count')
+    args_parser.add_argument('--rounds', type=int, default=3, help='rounds per query, best one reported')
+    args = args_parser.parse_args()
+
+    records = build_records(args.records)
+    print('{:>8} {:>14} {:>14} {:>8}'.format('filters', 'eval rec/s', 'fused rec/s', 'speedup'))
+    for query in QUERIES:
+        filters = [DslFilter(one) for one in query]
+        predicate = dsl.fuse_filters(filters)
+
+        def run_eval():
+            results = records
+            for one_filter in filters:
+                results = [one for one in results if one_filter.filter(one)]
+            return len(results)
+
+        def run_fused():
+            return len([one for one in records if predicate(one)])
+
+        eval_count, eval_elapsed = measure(run_eval, args.rounds)
+        fused_count, fused_elapsed = measure(run_fused, args.rounds)
+        assert eval_count == fused_count
+        print('{:>8} {:>14.0f} {:>14.0f} {:>7.1f}x'.format(len(query), len(records) / eval_elapsed,
+                                                           len(records) / fused_elapsed,
+                                                           eval_elapsed / fused_elapsed))
+
+
+if __name__ == '__main__':
+    main()
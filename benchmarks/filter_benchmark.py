@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# records per second of one DslFilter, copy & merge globals (previous implementation) vs record namespace
+import argparse
+import copy
+import datetime
+import time
+
+from deep_log import utils
+from deep_log.filter import DslFilter
+from deep_log.utils import get_fileinfo
+
+EXPRESSIONS = [
+    "level == 'error'",
+    "'worker 42' in _record",
+    "tags & {'important'}",
+    "time.timestamp() - 1133661135 > 0",
+]
+
+
+class CopyDslFilter(DslFilter):
+    def filter(self, one_log_item):
+        try:
+            clone_item = copy.deepcopy(one_log_item)
+            return eval(self.dsl, {**clone_item, **utils.built_function})
+        except Exception as error:
+            return self.pass_on_exception
+
+
+def build_records(count):
+    fileinfo = get_fileinfo(__file__)
+    start = datetime.datetime(2005, 12, 4, 4, 52, 15)
+    return [{'_line_number': index * 80, 'time': start + datetime.timedelta(seconds=index),
+             'level': ['error', 'notice', 'warn'][index % 3], 'message': 'worker {} in error state'.format(index),
+             '_record': '[Sun Dec 04 04:52:15 2005] [error] worker {} in error state\n'.format(index),
+             'tags': set(), **fileinfo} for index in range(count)]
+
+
+def measure(log_filter, records, rounds):
+    best = None
+    for one in range(rounds):
+        start = time.perf_counter()
+        for record in records:
+            log_filter.filter(record)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(records) / best
+
+
+def main():
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument('--records', type=int, default=100000, help='records count')
+    args_parser.add_argument('--rounds', type=int, default=3, help='rounds per filter, best one reported')
+    args = args_parser.parse_args()
+
+    records = build_records(args.records)
+    print('{:<40} {:>14} {:>14} {:>8}'.format('expression', 'copy rec/s', 'view rec/s', 'speedup'))
+    for expression in EXPRESSIONS:
+        copied = measure(CopyDslFilter(expression), records, args.rounds)
+        viewed = measure(DslFilter(expression), records, args.rounds)
+        print('{:<40} {:>14.0f} {:>14.0f} {:>7.1f}x'.format(expression, copied, viewed, viewed / copied))
+
+
+if __name__ == '__main__':
+    main()
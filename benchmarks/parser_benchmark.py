@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# compare DefaultLogParser backends, readline (text mode) vs mmap (bytes)
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from deep_log.parser import DefaultLogParser
+
+PATTERN = r'\[(?P<time>.*?)\] \[(?P<level>.*?)\] (?P<message>.*)'
+
+
+def generate(file_name, lines):
+    levels = ['error', 'notice', 'warn']
+    with open(file_name, 'w') as f:
+        for index in range(lines):
+            f.write('[Sun Dec 04 04:52:15 2005] [{}] worker {} env in error state {}\n'.format(
+                random.choice(levels), index, random.randint(0, 10)))
+            if index % 100 == 0:
+                f.write('    at continuation line of record {}\n'.format(index))
+
+
+def measure(file_name, backend, rounds):
+    parser = DefaultLogParser(pattern=PATTERN, backend=backend)
+    best = None
+    count = 0
+    for one in range(rounds):
+        start = time.perf_counter()
+        with open(file_name) as f:
+            count = sum(1 for item in parser.parse_file(f))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count, best
+
+
+def main():
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument('--lines', type=int, default=500000, help='lines of generated log')
+    args_parser.add_argument('--rounds', type=int, default=3, help='rounds per backend, best one reported')
+    args_parser.add_argument('--file', help='existing log file, match pattern {}'.format(PATTERN))
+    args = args_parser.parse_args()
+
+    file_name = args.file
+    if not file_name:
+        file_name = os.path.join(tempfile.mkdtemp(), 'bench.log')
+        generate(file_name, args.lines)
+
+    results = {}
+    for backend in ('readline', 'mmap'):
+        count, elapsed = measure(file_name, backend, args.rounds)
+        results[backend] = elapsed
+        print('{:<10} {:>10} records {:>8.3f}s {:>12.0f} records/s'.format(backend, count, elapsed, count / elapsed))
+
+    print('speedup    {:.2f}x'.format(results['readline'] / results['mmap']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# startup cost of dl: import time of modules by python -X importtime, and time to first record of a query,
+# with config snapshot missing (first run) and present
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIG = '''
+variables:
+  log_root: {}
+root:
+  parser:
+    name: DefaultLogParser
+    params:
+      pattern: (?P<content>.*?)
+  path: /
+loggers:
+  - name: bench
+    path: '{{log_root}}'
+    template: bench
+'''
+TEMPLATE = '''
+name: bench
+parser:
+  name: DefaultLogParser
+  params:
+    pattern: '\\[(?P<time>.*?)\\] \\[(?P<level>.*?)\\] (?P<message>.*)'
+handlers:
+  - name: TypeLogHandler
+    params:
+      definitions:
+        - field: time
+          format: '%a %b %d %H:%M:%S %Y'
+          type: datetime
+'''
+IMPORT_PATTERN = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def prepare(work_dir, lines):
+    log_dir = os.path.join(work_dir, 'logs')
+    config_dir = os.path.join(work_dir, 'config')
+    os.makedirs(log_dir)
+    os.makedirs(os.path.join(config_dir, 'templates'))
+    with open(os.path.join(config_dir, 'config.yaml'), 'w') as f:
+        f.write(CONFIG.format(log_dir))
+    with open(os.path.join(config_dir, 'templates', 'bench.yaml'), 'w') as f:
+        f.write(TEMPLATE)
+    with open(os.path.join(log_dir, 'bench.log'), 'w') as f:
+        for index in range(lines):
+            f.write('[Sun Dec 04 04:52:15 2005] [error] worker {} env in error state\n'.format(index))
+    return config_dir, log_dir
+
+
+def command(config_dir, log_dir):
+    return [sys.executable, '-m', 'deep_log.main', '-c', config_dir, '-l', "level=='error'", '-m', '{message}',
+            '--limit', '1', '--target', log_dir]
+
+
+def measure_imports(args, top):
+    # cumulative import time (us) of top level modules imported by query
+    output = subprocess.run([sys.executable, '-X', 'importtime'] + args[1:], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True).stderr
+    modules = []
+    for line in output.splitlines():
+        matched = IMPORT_PATTERN.match(line)
+        if matched and not matched.group(2).strip(' '):
+            modules.append((int(matched.group(1)), matched.group(3)))
+    return sum(one for one, name in modules), sorted(modules, reverse=True)[:top]
+
+
+def measure_first_record(args):
+    start = time.perf_counter()
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    process.stdout.readline()
+    first = time.perf_counter() - start
+    process.wait()
+    return first, time.perf_counter() - start
+
+
+def main():
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument('--lines', type=int, default=100000, help='lines of generated log')
+    args_parser.add_argument('--runs', type=int, default=5, help='runs of each measure')
+    args_parser.add_argument('--top', type=int, default=8, help='slowest top level imports to list')
+    args = args_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    config_dir, log_dir = prepare(work_dir, args.lines)
+    query = command(config_dir, log_dir)
+    snapshot_dir = os.path.join(config_dir, 'cache', 'config')
+
+    total, modules = measure_imports(query, args.top)
+    print('imports {:>8.1f} ms'.format(total / 1000))
+    for one, name in modules:
+        print('  {:<40} {:>8.1f} ms'.format(name, one / 1000))
+
+    for name, snapshot in (('no snapshot', False), ('snapshot', True)):
+        results = []
+        for index in range(args.runs):
+            if not snapshot:
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+            results.append(measure_first_record(query))
+        first = sorted(one for one, total in results)[len(results) // 2]
+        total = sorted(total for one, total in results)[len(results) // 2]
+        print('{:<12} first record {:>8.1f} ms, exit {:>8.1f} ms (median of {})'.format(
+            name, first * 1000, total * 1000, args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# compare shipping record batches from a worker, pickled through queue vs shared memory segments:
+# consumer time to receive & decode batches and read fields of records (_record only as printed by default, or all
+# fields), and memory of batches held before decoding
+import argparse
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from deep_log.parser import DefaultLogParser
+from deep_log.transport import load_batch, share_batch, start_transport
+
+PATTERN = r'\[(?P<time>.*?)\] \[(?P<level>.*?)\] worker (?P<worker>\d+) latency (?P<latency>\d+) (?P<message>.*)'
+
+
+def generate(file_name, lines):
+    levels = ['error', 'notice', 'warn']
+    with open(file_name, 'w') as f:
+        for index in range(lines):
+            f.write('[Sun Dec 04 04:52:15 2005] [{}] worker {} latency {} env in error state {}\n'.format(
+                random.choice(levels), index % 50, random.randint(0, 1000), random.randint(0, 10)))
+
+
+def produce(file_name, batch_size, session, queue):
+    batch = []
+    with open(file_name) as f:
+        for one in DefaultLogParser(pattern=PATTERN).parse_file(f):
+            batch.append(one)
+            if len(batch) >= batch_size:
+                queue.put(share_batch(batch, session) if session else batch)
+                batch = []
+    if batch:
+        queue.put(share_batch(batch, session) if session else batch)
+    queue.put(None)
+
+
+def measure(file_name, batch_size, shared, trace, fields=('_record',)):
+    queue = mp.Queue(maxsize=4)
+    session = start_transport() if shared else None
+    process = mp.Process(target=produce, args=(file_name, batch_size, session, queue))
+    process.start()
+
+    # cpu time of consumer receiving (pickled batches are decoded by queue), decoding & reading fields.
+    # waiting for producer is not counted
+    received = 0
+    held = []
+    if trace:
+        # traced allocations are slow, memory is measured in a separate pass
+        tracemalloc.start()
+    start = time.process_time()
+    while True:
+        batch = queue.get()
+        if batch is None:
+            break
+        held.append(batch)
+    consumer = time.process_time() - start
+    held_memory = tracemalloc.get_traced_memory()[0] if trace else 0
+    tracemalloc.stop()
+    segments = sum(len(one) for one in held) if shared else 0
+
+    start = time.process_time()
+    for one in held:
+        for record in load_batch(one):
+            received = received + 1
+            for name in fields if fields else record:
+                record[name]
+    consumer = consumer + time.process_time() - start
+    process.join()
+    return received, consumer, held_memory, segments
+
+
+def main():
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument('--lines', type=int, default=200000, help='lines of generated log')
+    args_parser.add_argument('--batch-size', type=int, default=1000, help='records per shipped batch')
+    args = args_parser.parse_args()
+
+    file_name = os.path.join(tempfile.mkdtemp(), 'bench.log')
+    generate(file_name, args.lines)
+
+    for name, shared in (('queue', False), ('shared', True)):
+        received, consumer, _, segments = measure(file_name, args.batch_size, shared, False)
+        _, consumer_all, _, _ = measure(file_name, args.batch_size, shared, False, None)
+        _, _, held_memory, _ = measure(file_name, args.batch_size, shared, True)
+        print('{:<8} {:>8} records, consumer cpu {:>7.3f}s (_record) {:>7.3f}s (all fields), '
+              'held batches {:>9.1f} KB + {:>9.1f} KB segments'.format(
+                  name, received, consumer, consumer_all, held_memory / 1024, segments / 1024))
+
+if __name__ == '__main__':
+    main()
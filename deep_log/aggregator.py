@@ -0,0 +1,175 @@
+import math
+import re
+from datetime import datetime, timedelta
+
+AGGREGATION_PATTERN = re.compile(r'^\s*(count|sum|avg|min|max)\s*(?:\(\s*([\w.]*)\s*\))?\s*$')
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def parse_aggregations(spec):
+    # [(column, function, field)], e.g. 'count,avg(latency)'
+    aggregations = []
+    for one in spec.split(',') if spec else []:
+        matched = AGGREGATION_PATTERN.match(one)
+        if not matched or (matched.group(1) != 'count' and not matched.group(2)):
+            raise Exception("unsupported aggregation {}".format(one))
+        aggregations.append((one.strip(), matched.group(1), matched.group(2) or None))
+    return aggregations
+
+
+def parse_group_by(spec):
+    # [(field, bucket)], bucket is timedelta for time fields ('time:5m'), number for number fields ('latency:100')
+    group_by = []
+    for one in spec.split(',') if spec else []:
+        field, _, bucket = one.strip().partition(':')
+        if not bucket:
+            group_by.append((field, None))
+        elif bucket[-1].lower() in DURATION_UNITS and bucket[:-1].isdigit():
+            group_by.append((field, timedelta(seconds=int(bucket[:-1]) * DURATION_UNITS[bucket[-1].lower()])))
+        else:
+            try:
+                group_by.append((field, float(bucket) if '.' in bucket else int(bucket)))
+            except ValueError:
+                raise Exception("unsupported bucket {}".format(one)) from None
+    return group_by
+
+
+def bucket_value(value, bucket):
+    # start of the bucket value falls in
+    if bucket is None or value is None:
+        return value
+    if isinstance(value, datetime) and isinstance(bucket, timedelta):
+        return value - (value - datetime(1970, 1, 1, tzinfo=value.tzinfo)) % bucket
+    if isinstance(value, (int, float)) and not isinstance(bucket, timedelta):
+        return math.floor(value / bucket) * bucket
+    return value
+
+
+def to_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def order_key(value):
+    """
+    key of min & max, values of any type are comparable by it: numbers and numeric strings by value, then
+    datetimes by time, then other values as strings
+    """
+    number = to_number(value)
+    if number is not None and number == number:
+        return 0, number, ''
+    if isinstance(value, datetime):
+        try:
+            return 1, value.timestamp(), ''
+        except (OverflowError, OSError, ValueError):
+            pass
+    return 2, 0, str(value)
+
+
+def group_value(value):
+    # values of group key must be hashable, such as lists of tags
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+class Aggregator:
+    """
+    partial aggregates of records grouped by fields, memory is bound to groups count.
+    states of one group: count -> records, sum -> total, avg -> [total, count], min/max -> (order key, value).
+    partial states of workers are merged into one aggregator.
+    """
+
+    def __init__(self, group_by, aggregations):
+        self.group_by = group_by
+        self.aggregations = aggregations
+        # group key -> states
+        self.groups = {}
+
+    def _new_states(self):
+        return [[0, 0] if function == 'avg' else (0 if function in ('count', 'sum') else None)
+                for column, function, field in self.aggregations]
+
+    def add(self, record):
+        key = tuple([group_value(bucket_value(record.get(field), bucket)) for field, bucket in self.group_by])
+        states = self.groups.get(key)
+        if states is None:
+            states = self.groups[key] = self._new_states()
+
+        for index, (column, function, field) in enumerate(self.aggregations):
+            if function == 'count':
+                if field is None or record.get(field) is not None:
+                    states[index] = states[index] + 1
+                continue
+            value = record.get(field)
+            if value is None:
+                continue
+            if function in ('min', 'max'):
+                order = order_key(value)
+                if states[index] is None or (order < states[index][0] if function == 'min'
+                                             else order > states[index][0]):
+                    states[index] = (order, value)
+                continue
+            value = to_number(value)
+            if value is None:
+                continue
+            if function == 'sum':
+                states[index] = states[index] + value
+            else:
+                states[index][0] = states[index][0] + value
+                states[index][1] = states[index][1] + 1
+
+    def extend(self, records):
+        for one in records:
+            self.add(one)
+
+    def merge(self, groups):
+        # merge partial states of another aggregator
+        for key, other in groups.items():
+            states = self.groups.get(key)
+            if states is None:
+                self.groups[key] = other
+                continue
+            for index, (column, function, field) in enumerate(self.aggregations):
+                if function in ('count', 'sum'):
+                    states[index] = states[index] + other[index]
+                elif function == 'avg':
+                    states[index] = [states[index][0] + other[index][0], states[index][1] + other[index][1]]
+                elif other[index] is not None:
+                    if states[index] is None or (other[index][0] < states[index][0] if function == 'min'
+                                                 else other[index][0] > states[index][0]):
+                        states[index] = other[index]
+
+    def drain(self):
+        # partial states since last drain
+        groups = self.groups
+        self.groups = {}
+        return groups
+
+    def results(self, keys=None):
+        # one row per group, group by fields and aggregation columns
+        keys = list(self.groups) if keys is None else keys
+        try:
+            keys = sorted(keys)
+        except TypeError:
+            # values of different types, keep first seen order
+            pass
+
+        rows = []
+        for key in keys:
+            row = {field: value for (field, bucket), value in zip(self.group_by, key)}
+            for (column, function, field), state in zip(self.aggregations, self.groups[key]):
+                if function == 'avg':
+                    row[column] = state[0] / state[1] if state[1] else None
+                elif function in ('min', 'max'):
+                    row[column] = state[1] if state is not None else None
+                else:
+                    row[column] = state
+            rows.append(row)
+        return rows
@@ -1,6 +1,10 @@
+import heapq
 import logging
 from string import Formatter
 
+from deep_log.aggregator import Aggregator, parse_aggregations, parse_group_by
+from deep_log.sorter import ExternalSorter, merge_runs
+
 
 class LogFormatter:
     def __init__(self, format_string=None):
@@ -27,13 +31,42 @@ class LogFormatter:
 
 
 class LogAnalyzer:
-    def __init__(self, order_by=None, analyze=None, reverse=None):
+    def __init__(self, order_by=None, analyze=None, reverse=None, group_by=None, agg=None):
         self.order_by = order_by
         self.reverse = reverse
         self.analyze_dsl = analyze if analyze else None
+        self.group_by = parse_group_by(group_by)
+        # records are counted by default if only grouped
+        self.aggregations = parse_aggregations(agg if agg or not group_by else 'count')
 
     def need_reduce(self):
-        return self.order_by or self.analyze_dsl
+        return self.order_by or self.analyze_dsl or self.aggregations
+
+    def get_columns(self):
+        # columns of aggregated rows
+        return [field for field, bucket in self.group_by] + [column for column, function, field in self.aggregations]
+
+    def create_aggregator(self):
+        return Aggregator(self.group_by, self.aggregations)
+
+    def _order_key(self, record):
+        return record.get(self.order_by)
+
+    def top(self, content, limit):
+        # first limit records in order by, same as sorted content, only limit records are held in a heap
+        if self.reverse:
+            return heapq.nlargest(limit, content, key=self._order_key)
+        return heapq.nsmallest(limit, content, key=self._order_key)
+
+    def create_sorter(self, max_memory=None, temp_dir=None):
+        # sorter in order by, spill sorted runs to temp dir when records take more than max memory
+        return ExternalSorter(self._order_key, self.reverse, max_memory, temp_dir)
+
+    def merge_runs(self, runs):
+        return merge_runs(runs, self._order_key, self.reverse)
+
+    def analyze_frame(self, df):
+        return eval(self.analyze_dsl, {'df': df})
 
     # def _build_formatter(self, format_string=None):
     #     return LogFormatter(format_string)
@@ -47,6 +80,6 @@ class LogAnalyzer:
         elif self.analyze_dsl:
             import pandas as pd
             df = pd.DataFrame(content)
-            return eval(self.analyze_dsl, {'df': df})
+            return self.analyze_frame(df)
         else:
             return content
@@ -0,0 +1,119 @@
+import os
+
+from binaryornot.check import is_binary
+
+from deep_log import utils
+from deep_log.compression import detect_compression
+
+
+class FileCatalog:
+    """
+    persistent catalog of target files.
+    directory listings are reused while directory mtime is unchanged, compression, binary verdict and resolved logger
+    nodes of a file are reused while its inode, size and mtime are unchanged.
+    """
+
+    def __init__(self, cache_file, loggers_fingerprint):
+        self.cache_file = cache_file
+        self.loggers_fingerprint = loggers_fingerprint
+        self.directories = {}
+        self.files = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        content = utils.load_cache(self.cache_file, 'catalog')
+        if content is None:
+            return
+
+        self.directories = content.get('directories', {})
+        self.files = content.get('files', {})
+        if content.get('loggers') != self.loggers_fingerprint:
+            # logger definitions changed, resolved nodes are stale
+            for one in self.files.values():
+                one.pop('nodes', None)
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        utils.save_cache(self.cache_file,
+                         {'loggers': self.loggers_fingerprint, 'directories': self.directories, 'files': self.files})
+        self.dirty = False
+
+    def _list_directory(self, directory):
+        files = []
+        dirs = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    files.append(entry.path)
+                elif not entry.is_symlink():
+                    # same as os.walk, symbolic links to directories are not followed
+                    dirs.append(entry.path)
+        return files, dirs
+
+    def walk(self, folder):
+        # file paths under folder, unchanged directories are not listed again
+        stack = [folder]
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+                entry = self.directories.get(directory)
+                if entry is None or entry.get('mtime') != mtime:
+                    files, dirs = self._list_directory(directory)
+                    if entry is not None:
+                        # forget removed files
+                        for one in set(entry.get('files')) - set(files):
+                            self.files.pop(one, None)
+                    entry = {'mtime': mtime, 'files': files, 'dirs': dirs}
+                    self.directories[directory] = entry
+                    self.dirty = True
+            except OSError as e:
+                self.directories.pop(directory, None)
+                continue
+
+            for one in entry.get('files'):
+                yield one
+            stack.extend(reversed(entry.get('dirs')))
+
+    def _get_entry(self, file_name):
+        # cached entry of file, reset if file changed
+        stat = os.stat(file_name)
+        identity = [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+        entry = self.files.get(file_name)
+        if entry is None or entry.get('identity') != identity:
+            entry = {'identity': identity}
+            self.files[file_name] = entry
+            self.dirty = True
+        return entry
+
+    def get_compression(self, file_name):
+        # compression of file by magic bytes, None for plain file
+        entry = self._get_entry(file_name)
+        if 'compression' not in entry:
+            entry['compression'] = detect_compression(file_name)
+            self.dirty = True
+        return entry['compression']
+
+    def is_binary(self, file_name):
+        entry = self._get_entry(file_name)
+        if 'binary' not in entry:
+            entry['binary'] = is_binary(file_name)
+            self.dirty = True
+        return entry['binary']
+
+    def get_nodes(self, file_name, resolve):
+        # resolved logger node paths of file, resolve(file_name) is called if not cached
+        entry = self.files.get(file_name)
+        if entry is None:
+            entry = self._get_entry(file_name)
+        if 'nodes' not in entry:
+            entry['nodes'] = list(resolve(file_name))
+            self.dirty = True
+        return tuple(entry['nodes'])
@@ -0,0 +1,146 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from deep_log.record import LogRecord
+from deep_log.utils import get_fileinfo
+
+# string columns with less distinct values than this ratio of rows are stored as categoricals
+CATEGORY_RATIO = 0.5
+
+
+def _object_array(values):
+    # keep values (sets, lists) as they are, numpy would nest them
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def to_column(values):
+    # typed array of values: numbers, bools & datetimes as numpy arrays, repeated strings as categoricals
+    types = set(map(type, values))
+    has_null = type(None) in types
+    types.discard(type(None))
+    try:
+        if types == {bool} and not has_null:
+            return np.array(values, dtype=bool)
+        if types == {int} and not has_null:
+            return np.array(values, dtype=np.int64)
+        if types and types <= {int, float}:
+            return np.array([np.nan if one is None else one for one in values], dtype=np.float64)
+        if types == {datetime} and all(one.tzinfo is None for one in values if one is not None):
+            return np.array(values, dtype='datetime64[us]')
+        if types == {str} and len(set(values)) <= len(values) * CATEGORY_RATIO:
+            return pd.Categorical(values)
+    except (OverflowError, TypeError, ValueError):
+        pass
+    return _object_array(values)
+
+
+class ColumnBatch:
+    """
+    records of one file in columns, fields of file info are kept once as constants
+    """
+
+    def __init__(self, size, columns, constants):
+        self.size = size
+        self.columns = columns
+        self.constants = constants
+
+    def get(self, name):
+        # column of name, None if missing in batch
+        if name in self.columns:
+            return self.columns.get(name)
+        if name in self.constants:
+            value = self.constants.get(name)
+            if isinstance(value, str):
+                return pd.Categorical.from_codes(np.zeros(self.size, dtype=np.int8), [value])
+            return np.repeat(to_column([value]), self.size)
+        return None
+
+
+class ColumnBuilder:
+    """
+    build column batches of records of one file, every batch size records
+    """
+
+    def __init__(self, file_name, batch_size):
+        self.fileinfo = get_fileinfo(file_name)
+        self.batch_size = batch_size
+        self.rows = []
+
+    def flush(self):
+        if not self.rows:
+            return None
+        rows = self.rows
+        self.rows = []
+
+        fileinfo = self.fileinfo
+        # values of fields missing in rows
+        defaults = {}
+        first = rows[0]
+        if isinstance(first, LogRecord) and all(type(one) is LogRecord and one.file is first.file for one in rows):
+            # file info shared by records, only parsed fields are collected
+            fileinfo = first.file.values
+            rows = [one.fields for one in rows]
+            defaults = fileinfo
+
+        keys = rows[0].keys()
+        if not all(one.keys() == keys for one in rows):
+            # fields missing in some records
+            keys = dict.fromkeys(key for one in rows for key in one)
+
+        columns = {}
+        constants = {key: value for key, value in defaults.items() if key not in keys}
+        for key in keys:
+            default = defaults.get(key)
+            values = [one.get(key, default) for one in rows]
+            if key == 'tags':
+                values = [set() if one is None else one for one in values]
+            if key in fileinfo and values.count(fileinfo.get(key)) == len(values):
+                # not changed by handlers
+                constants[key] = fileinfo.get(key)
+            else:
+                columns[key] = to_column(values)
+        return ColumnBatch(len(rows), columns, constants)
+
+    def build(self, records):
+        for one in records:
+            self.rows.append(one)
+            if len(self.rows) >= self.batch_size:
+                yield self.flush()
+        batch = self.flush()
+        if batch is not None:
+            yield batch
+
+
+def _concat(parts):
+    if all(isinstance(one, pd.Categorical) for one in parts):
+        try:
+            # categories sorted as values of object columns would be, e.g. groups of group by come in same order
+            return union_categoricals(parts, sort_categories=True)
+        except TypeError:
+            pass
+    elif all(isinstance(one, np.ndarray) for one in parts):
+        # numbers are upcast, mixed types become objects
+        return np.concatenate(parts)
+    return _object_array([value for one in parts for value in (one.tolist() if hasattr(one, 'tolist') else one)])
+
+
+def concat_batches(batches):
+    # data frame of batches, column by column
+    names = {}
+    for batch in batches:
+        names.update(dict.fromkeys(batch.columns))
+        names.update(dict.fromkeys(batch.constants))
+
+    columns = {}
+    for name in names:
+        parts = []
+        for batch in batches:
+            part = batch.get(name)
+            parts.append(part if part is not None else _object_array([None] * batch.size))
+        columns[name] = _concat(parts) if len(parts) != 1 else parts[0]
+    return pd.DataFrame(columns, copy=False)
@@ -0,0 +1,285 @@
+import bz2
+import io
+import logging
+import lzma
+import os
+import zlib
+
+from deep_log import utils
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGICS = [
+    ('gzip', b'\x1f\x8b'),
+    ('bz2', b'BZh'),
+    ('xz', b'\xfd7zXZ\x00'),
+    ('zstd', b'\x28\xb5\x2f\xfd'),
+]
+CHUNK_SIZE = 256 * 1024
+# uncompressed bytes between kept seek points
+SEEK_SPACING = 4 * 1024 * 1024
+
+
+def detect_compression(file_name):
+    # compression by magic bytes, None for plain file
+    with open(file_name, 'rb') as f:
+        head = f.read(6)
+    for compression, magic in MAGICS:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def is_supported(compression):
+    return compression != 'zstd' or zstandard is not None
+
+
+class _Decompressor:
+    # one compressed member (gzip member, bz2/xz stream or zstd frame), output bounded by max length
+    def __init__(self, compression):
+        self.compression = compression
+        if compression == 'gzip':
+            self.decompressor = zlib.decompressobj(31)
+        elif compression == 'bz2':
+            self.decompressor = bz2.BZ2Decompressor()
+        elif compression == 'xz':
+            self.decompressor = lzma.LZMADecompressor()
+        elif zstandard is not None:
+            self.decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            raise IOError('zstandard is required for zstd compressed file')
+
+    def needs_input(self):
+        if self.compression == 'gzip':
+            return not self.decompressor.unconsumed_tail
+        elif self.compression in ('bz2', 'xz'):
+            return self.decompressor.needs_input
+        return True
+
+    def decompress(self, data, max_length):
+        if self.compression == 'gzip':
+            return self.decompressor.decompress(self.decompressor.unconsumed_tail + data, max_length)
+        elif self.compression in ('bz2', 'xz'):
+            return self.decompressor.decompress(data, max_length)
+        return self.decompressor.decompress(data)
+
+    @property
+    def eof(self):
+        return getattr(self.decompressor, 'eof', False)
+
+    @property
+    def unused_data(self):
+        return getattr(self.decompressor, 'unused_data', b'')
+
+
+class DecompressReader(io.RawIOBase):
+    """
+    decompress members one by one from a member start, (compressed offset, uncompressed offset) of every member
+    start is recorded as seek point
+    """
+
+    def __init__(self, raw, compression, compressed_offset=0, uncompressed_offset=0):
+        self.raw = raw
+        self.raw.seek(compressed_offset)
+        self.compression = compression
+        self.magic = dict(MAGICS)[compression]
+        self.decompressor = _Decompressor(compression)
+        self.fed = compressed_offset
+        self.uncompressed = uncompressed_offset
+        self.members = [(compressed_offset, uncompressed_offset)]
+        self.pending = b''
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def _next_chunk(self):
+        if self.decompressor.eof:
+            data = self.decompressor.unused_data + self.raw.read(len(self.magic))
+            self.fed = self.fed + len(data) - len(self.decompressor.unused_data)
+            if not data.startswith(self.magic):
+                # end of file, trailing padding is ignored
+                self.finished = True
+                return b''
+            # next member
+            self.members.append((self.fed - len(data), self.uncompressed))
+            self.decompressor = _Decompressor(self.compression)
+            return self.decompressor.decompress(data, CHUNK_SIZE)
+
+        if self.decompressor.needs_input():
+            data = self.raw.read(CHUNK_SIZE)
+            if not data:
+                if not self.decompressor.eof:
+                    logging.warning("compressed file {} is truncated".format(getattr(self.raw, 'name', '')))
+                self.finished = True
+                return b''
+            self.fed = self.fed + len(data)
+        else:
+            data = b''
+        return self.decompressor.decompress(data, CHUNK_SIZE)
+
+    def readinto(self, buffer):
+        while not self.pending and not self.finished:
+            self.pending = self._next_chunk()
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        self.uncompressed = self.uncompressed + size
+        return size
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+class CompressedFile:
+    """
+    file like object over decompressed content, positions are uncompressed offsets.
+    seek is done by decompressing from nearest seek point before the position.
+    """
+    compressed = True
+
+    def __init__(self, file_name, compression, seek_points=None, binary=False, on_complete=None):
+        self.name = file_name
+        self.compression = compression
+        self.seek_points = seek_points if seek_points else [(0, 0)]
+        self.binary = binary
+        self.encoding = 'utf-8'
+        # called with recorded seek points after reading whole file from start
+        self.on_complete = on_complete
+        self.reader = None
+        self.stream = None
+        self.position = 0
+        self._open_at(self.seek_points[0])
+
+    def _open_at(self, seek_point):
+        if self.reader is not None:
+            self.reader.close()
+        self.reader = DecompressReader(open(self.name, 'rb'), self.compression, *seek_point)
+        self.stream = io.BufferedReader(self.reader, CHUNK_SIZE)
+        self.position = seek_point[1]
+        self.from_start = seek_point == (0, 0)
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        if whence != 0:
+            raise io.UnsupportedOperation('compressed file only seeks from start')
+        if offset < self.position or (self.position < offset and self._nearest(offset)[1] > self.position):
+            self._open_at(self._nearest(offset))
+        while self.position < offset:
+            data = self.stream.read(min(offset - self.position, CHUNK_SIZE))
+            if not data:
+                break
+            self.position = self.position + len(data)
+        return self.position
+
+    def _nearest(self, offset):
+        return max((one for one in self.seek_points if one[1] <= offset), key=lambda x: x[1])
+
+    def _check_complete(self):
+        if self.on_complete is not None and self.from_start and self.reader.finished and not self.reader.pending:
+            self.on_complete(self.reader.members, self.reader.uncompressed)
+            self.on_complete = None
+
+    def readline(self):
+        line = self.stream.readline()
+        self.position = self.position + len(line)
+        if not line:
+            self._check_complete()
+        return line if self.binary else line.decode(self.encoding, 'replace')
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.position = self.position + len(data)
+        if size < 0 or len(data) < size:
+            self._check_complete()
+        return data if self.binary else data.decode(self.encoding, 'replace')
+
+    def close(self):
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SeekPointStore:
+    """
+    seek points of compressed files under cache dir, recorded when a file is read through from start.
+    only files with more than one member (e.g. bgzip, pigz, concatenated rotations) get seek points.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def _index_file(self, file_name):
+        return utils.get_cache_file(self.cache_dir, file_name)
+
+    @staticmethod
+    def _identity(file_name):
+        stat = os.stat(file_name)
+        return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+    def load(self, file_name):
+        # (seek points, uncompressed size), None if not recorded or file changed
+        index = utils.load_cache(self._index_file(file_name), 'seek points')
+        if index is None or index.get('identity') != self._identity(file_name):
+            return None
+        return [tuple(one) for one in index.get('points')], index.get('size')
+
+    def save(self, file_name, members, size):
+        if len(members) <= 1:
+            return
+        points = [members[0]]
+        for one in members[1:]:
+            if one[1] - points[-1][1] >= SEEK_SPACING:
+                points.append(one)
+        utils.save_cache(self._index_file(file_name),
+                         {'file': file_name, 'identity': self._identity(file_name), 'points': points, 'size': size})
+
+    def open(self, file_name, compression, binary=False):
+        # compressed file positioned at start, seek points are recorded if not known
+        loaded = self.load(file_name)
+        if loaded is not None:
+            return CompressedFile(file_name, compression, loaded[0], binary)
+
+        def complete(members, size):
+            try:
+                self.save(file_name, members, size)
+            except Exception as e:
+                logging.warning("failed to save seek points of {}: {}".format(file_name, e))
+
+        return CompressedFile(file_name, compression, None, binary, complete)
+
+    def split(self, file_name, compression, parser, shard_size, start=0):
+        """
+        (start, end) uncompressed ranges on record starts after seek points, whole file if no seek points known.
+        same as parser.split_file for plain files
+        """
+        loaded = self.load(file_name)
+        if not shard_size or loaded is None:
+            return [(start, None)]
+        points, size = loaded
+        if size - start <= shard_size:
+            return [(start, None)]
+
+        boundaries = [start]
+        with CompressedFile(file_name, compression, points, binary=True) as file:
+            for one in points:
+                if one[1] - boundaries[-1] < shard_size:
+                    continue
+                boundary = parser.find_record_start(file, one[1])
+                if boundary is None:
+                    break
+                if boundary > boundaries[-1]:
+                    boundaries.append(boundary)
+
+        return [(one, boundaries[index + 1] if index + 1 < len(boundaries) else None)
+                for index, one in enumerate(boundaries)]
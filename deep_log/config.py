@@ -1,13 +1,13 @@
 import fnmatch
+import hashlib
 import json
 import logging
 import os
+import pickle
+import tempfile
 from collections import OrderedDict
 from os import path
 
-# trie node
-import pkg_resources
-
 from deep_log import utils
 
 from deep_log import parser
@@ -15,7 +15,11 @@ from deep_log import handler
 
 from deep_log import filter
 from deep_log import meta_filter
-import yaml
+from deep_log.pipeline import LogPipeline, pipeline_cache
+
+PIPELINE_KEYS = ('parser', 'handlers', 'filters', 'meta_filters')
+# bumped when layout of settings or loggers changes, older snapshots are ignored
+SNAPSHOT_VERSION = 1
 
 
 class Logger:
@@ -87,9 +91,32 @@ class Loggers:
 
         return current_value
 
+    def resolve(self, name, keys):
+        # walk trie once, find nearest node defining each key
+        current_node = self.root
+        root_value = current_node.get_value()
+        resolved = {key: root_value for key in keys}
+        path = name.split("/")
+        for path_node in path:
+            if path_node is None or not path_node.strip():
+                continue
+            current_node = current_node.get_child(path_node)
+            if current_node is None:
+                break
+            else:
+                node_value = current_node.get_value()
+                if node_value is not None:
+                    for key in keys:
+                        if key in node_value:
+                            resolved[key] = node_value
+
+        return resolved
+
 
 class TemplateRepo:
     def __init__(self, template_dir=None):
+        import yaml
+
         self.template_repo = {}
 
         if not os.path.exists(template_dir):
@@ -121,6 +148,16 @@ class LogConfig:
             'handlers': [],
             'meta_filters': []
         }
+        self._fingerprint = None
+        self._node_values = None
+
+        # merged settings & loggers of last run, unless config or templates changed since
+        snapshot_key = [self.config_root, sorted((custom_variables if custom_variables else {}).items()),
+                        custom_template_name, utils.normalize_path(custom_template_dir) if custom_template_dir else None]
+        loaded = self._load_snapshot(snapshot_key)
+        if loaded is not None:
+            self.settings, self.loggers = loaded
+            return
 
         # load settings
         settings = self._load_config(config_root)
@@ -138,6 +175,7 @@ class LogConfig:
         self.loggers = self._build_loggers(settings)
 
         self.settings = settings
+        self._save_snapshot(snapshot_key, custom_template_dir)
         #
         # def _get_logger_template(self, logger_template, variables=None):
         #     templates = self.settings.get('templates')
@@ -155,6 +193,68 @@ class LogConfig:
 
         # return {}
 
+    def _get_snapshot_file(self, key):
+        name = hashlib.md5(json.dumps(key, default=str).encode()).hexdigest()
+        return os.path.join(self.get_cache_dir('config'), 'snapshot-{}.pickle'.format(name))
+
+    def _get_sources(self, custom_template_dir=None):
+        # files settings are loaded from, templates dir itself to see templates added or removed
+        template_dir = os.path.join(self.config_root, 'templates')
+        sources = [self._get_config_file(), template_dir]
+        if os.path.isdir(template_dir):
+            sources.extend(os.path.join(template_dir, one) for one in sorted(os.listdir(template_dir)))
+        if custom_template_dir:
+            sources.append(utils.normalize_path(custom_template_dir))
+        for one in [self.settings.get('root'), *self.settings.get('loggers')]:
+            if one and one.get('template_dir'):
+                sources.append(os.path.join(self.config_root, one.get('template_dir')))
+        return sources
+
+    @staticmethod
+    def _stat_sources(sources):
+        stats = []
+        for one in sources:
+            try:
+                stat = os.stat(one)
+                stats.append((one, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stats.append((one, None, None))
+        return stats
+
+    def _load_snapshot(self, key):
+        snapshot_file = self._get_snapshot_file(key)
+        try:
+            with open(snapshot_file, 'rb') as f:
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning("config snapshot {} ignored: {}".format(snapshot_file, e))
+            return None
+
+        if snapshot.get('version') != SNAPSHOT_VERSION or snapshot.get('key') != json.dumps(key, default=str):
+            return None
+        if self._stat_sources([one for one, mtime, size in snapshot.get('sources')]) != snapshot.get('sources'):
+            # config or templates changed
+            return None
+        return snapshot.get('settings'), snapshot.get('loggers')
+
+    def _save_snapshot(self, key, custom_template_dir=None):
+        if not os.path.isdir(self.config_root):
+            return
+        snapshot_file = self._get_snapshot_file(key)
+        try:
+            os.makedirs(os.path.dirname(snapshot_file), exist_ok=True)
+            snapshot = {'version': SNAPSHOT_VERSION, 'key': json.dumps(key, default=str),
+                        'sources': self._stat_sources(self._get_sources(custom_template_dir)),
+                        'settings': self.settings, 'loggers': self.loggers}
+            fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(snapshot_file))
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, snapshot_file)
+        except Exception as e:
+            logging.warning("failed to save config snapshot {}: {}".format(snapshot_file, e))
+
     def _merge_loggers(self, logger1, logger2):
         if logger1 is None and logger2 is None:
             return {}
@@ -189,6 +289,8 @@ class LogConfig:
         return obj2
 
     def _load_config(self, settings_file=None, variables=None, root_parser=None):
+        import yaml
+
         if not os.path.exists(self._get_config_file()):
             raise Exception('config file not found')
 
@@ -219,6 +321,8 @@ class LogConfig:
         return settings
 
     def populate_templates(self, settings, template_repo=None, custom_template=None, custom_template_dir=None):
+        import yaml
+
         # populate root template
         root_logger = settings.get('root')
         if custom_template:
@@ -281,6 +385,8 @@ class LogConfig:
         elif os.path.exists(utils.normalize_path('~/.deep_log/config.yaml')):
             return utils.normalize_path('~/.deep_log/config.yaml')
         else:
+            import pkg_resources
+
             return pkg_resources.resource_filename('deep_log', 'config.yaml')
 
     def _build_loggers(self, settings):
@@ -335,97 +441,119 @@ class LogConfig:
 
         return paths
 
-    def get_parser(self, file_name):
-        node = self.loggers.find(file_name, accept=lambda x: 'parser' in x)
-        if node is not None and node.get('parser'):
-            node_parser = node.get('parser')
-            parser_name = node_parser.get('name')
-            parser_params = node_parser.get('params') if node_parser.get('params') else {}
-            deep_parser = getattr(parser, parser_name)(**parser_params)
-            return deep_parser
-        else:
-            return parser.DefaultLogParser()
-
-    def get_handlers(self, file_name, scope=('node', 'global')):
-        handlers = []
+    def _create_component(self, module, definition):
+        component_name = definition.get('name')
+        component_params = definition.get('params') if definition.get('params') else {}
+        return getattr(module, component_name)(**component_params)
 
+    def _create_components(self, module, node, key, scope):
+        components = []
         if 'node' in scope:
-            node = self.loggers.find(file_name, accept=lambda x: 'handlers' in x)
-
-            if node is not None and node.get('handlers'):
-                node_handlers = node.get('handlers')
-                for one_node_handler in node_handlers:
-                    handler_name = one_node_handler.get('name')
-                    handler_params = one_node_handler.get('params') if one_node_handler.get('params') else {}
-                    deep_handler = getattr(handler, handler_name)(**handler_params)
-                    handlers.append(deep_handler)
+            if node is not None and node.get(key):
+                for one_definition in node.get(key):
+                    components.append(self._create_component(module, one_definition))
+
         if 'global' in scope:
-            for one_node_handler in self.global_settings['handlers']:
-                handler_name = one_node_handler.get('name')
-                handler_params = one_node_handler.get('params') if one_node_handler.get('params') else {}
-                deep_handler = getattr(handler, handler_name)(**handler_params)
-                handlers.append(deep_handler)
+            for one_definition in self.global_settings[key]:
+                components.append(self._create_component(module, one_definition))
 
-        return handlers
+        return components
 
-    def get_filters(self, file_name, scope=('node', 'global')):
-        filters = []
+    def _create_parser(self, node):
+        if node is not None and node.get('parser'):
+            return self._create_component(parser, node.get('parser'))
+        else:
+            return parser.DefaultLogParser()
 
-        if 'node' in scope:
-            node = self.loggers.find(file_name, accept=lambda x: 'filters' in x)
-            if node is not None and node.get('filters'):
-                node_filters = node.get('filters')
-                for one_node_filters in node_filters:
-                    filter_name = one_node_filters.get('name')
-                    filter_params = one_node_filters.get('params') if one_node_filters.get('params') else {}
-                    deep_filter = getattr(filter, filter_name)(**filter_params)
-                    filters.append(deep_filter)
+    def get_parser(self, file_name):
+        node = self.loggers.find(file_name, accept=lambda x: 'parser' in x)
+        return self._create_parser(node)
 
-        if 'global' in scope:
-            for one_node_filters in self.global_settings['filters']:
-                filter_name = one_node_filters.get('name')
-                filter_params = one_node_filters.get('params') if one_node_filters.get('params') else {}
-                deep_filter = getattr(filter, filter_name)(**filter_params)
-                filters.append(deep_filter)
+    def get_handlers(self, file_name, scope=('node', 'global')):
+        node = self.loggers.find(file_name, accept=lambda x: 'handlers' in x)
+        return self._create_components(handler, node, 'handlers', scope)
 
-        return filters
+    def get_filters(self, file_name, scope=('node', 'global')):
+        node = self.loggers.find(file_name, accept=lambda x: 'filters' in x)
+        return self._create_components(filter, node, 'filters', scope)
 
     def get_meta_filters(self, file_name, scope=('node', 'global')):
-        meta_filters = []
-        if 'node' in scope:
-            node = self.loggers.find(file_name, accept=lambda x: 'meta_filters' in x)
-            if node is not None and node.get('meta_filters'):
-                node_filters = node.get('meta_filters')
-                for one_node_filters in node_filters:
-                    filter_name = one_node_filters.get('name')
-                    filter_params = one_node_filters.get('params') if one_node_filters.get('params') else {}
-                    deep_filter = getattr(meta_filter, filter_name)(**filter_params)
-                    meta_filters.append(deep_filter)
-
-        if 'global' in scope:
-            for one_global_filters in self.global_settings['meta_filters']:
-                filter_name = one_global_filters.get('name')
-                filter_params = one_global_filters.get('params') if one_global_filters.get('params') else {}
-                deep_filter = getattr(meta_filter, filter_name)(**filter_params)
-                meta_filters.append(deep_filter)
-
-        return meta_filters
+        node = self.loggers.find(file_name, accept=lambda x: 'meta_filters' in x)
+        return self._create_components(meta_filter, node, 'meta_filters', scope)
+
+    def get_index_fields(self, file_name):
+        # fields tokenized by token index, defined by index key of logger node
+        node = self.loggers.find(file_name, accept=lambda x: 'index' in x)
+        if node is not None and node.get('index') and node.get('index').get('fields'):
+            return list(node.get('index').get('fields'))
+        return ['_record']
+
+    def get_fingerprint(self):
+        # identify settings & global scope, the pipeline cache is shared by all configs in one process
+        if self._fingerprint is None:
+            content = json.dumps([self.settings, self.global_settings], sort_keys=True, default=str)
+            self._fingerprint = hashlib.md5(content.encode()).hexdigest()
+        return self._fingerprint
+
+    def get_nodes(self, file_name):
+        # paths of logger nodes resolved for each pipeline component
+        nodes = self.loggers.resolve(file_name, PIPELINE_KEYS)
+        return tuple(nodes[key].get('path', '/') if nodes[key] else None for key in PIPELINE_KEYS)
+
+    def get_loggers_fingerprint(self):
+        # identify logger definitions, node paths resolved by same loggers are the same
+        content = json.dumps([self.settings.get('root'), self.settings.get('loggers')], sort_keys=True, default=str)
+        return hashlib.md5(content.encode()).hexdigest()
+
+    def _get_node_value(self, node_path):
+        if self._node_values is None:
+            root_value = self.settings.get('root')
+            self._node_values = {root_value.get('path', '/'): root_value} if root_value else {}
+            for one_logger in self.settings.get('loggers'):
+                if one_logger is not None and 'path' in one_logger:
+                    self._node_values[one_logger.get('path')] = one_logger
+        return self._node_values.get(node_path)
+
+    def get_pipeline(self, file_name, nodes=None):
+        # nodes: resolved node paths from get_nodes, resolved again if not specified
+        nodes = nodes if nodes else self.get_nodes(file_name)
+
+        def build():
+            values = {key: self._get_node_value(path) for key, path in zip(PIPELINE_KEYS, nodes)}
+            signature = json.dumps([values['parser'].get('parser') if values['parser'] else None,
+                                    values['handlers'].get('handlers') if values['handlers'] else None,
+                                    self.global_settings['handlers']], sort_keys=True, default=str)
+            return LogPipeline(self._create_parser(values['parser']),
+                               self._create_components(handler, values['handlers'], 'handlers', ('node', 'global')),
+                               self._create_components(filter, values['filters'], 'filters', ('node', 'global')),
+                               self._create_components(meta_filter, values['meta_filters'], 'meta_filters',
+                                                       ('node', 'global')),
+                               hashlib.md5(signature.encode()).hexdigest())
+
+        return pipeline_cache.get((self.get_fingerprint(), *nodes), build)
 
     def add_filters(self, filters, scope='global'):
         if scope == 'global' and filters:
             self.global_settings['filters'].extend(filters)
+            self._fingerprint = None
 
     def add_handlers(self, handlers, scope='global'):
         if scope == 'global' and handlers:
             self.global_settings['filters'].extend(handlers)
+            self._fingerprint = None
 
     def add_parsers(self, parsers, scope='global'):
         if scope == 'global' and parsers:
             self.global_settings['filters'].extend(parsers)
+            self._fingerprint = None
 
     def add_meta_filters(self, filters, scope='global'):
         if scope == 'global' and filters:
             self.global_settings['meta_filters'].extend(filters)
+            self._fingerprint = None
+
+    def get_cache_dir(self, name):
+        return os.path.join(self.config_root, 'cache', name)
 
     def get_variable(self, variable):
         return self.settings.get('variables').get(variable)
@@ -0,0 +1,220 @@
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import traceback
+
+# frame of output streamed back to client: kind, payload length, payload
+FRAME_HEADER = struct.Struct('!cI')
+STDOUT = b'O'
+STDERR = b'E'
+EXIT = b'X'
+# bytes of output buffered by query before a frame is sent
+OUTPUT_BUFFER = 64 * 1024
+
+
+def default_socket_path(config_root=None):
+    return os.path.join(os.path.expanduser(config_root if config_root else '~/.deep_log'), 'daemon.sock')
+
+
+def _send_frame(conn, kind, payload):
+    conn.sendall(FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _read_exactly(conn_file, size):
+    data = conn_file.read(size)
+    if len(data) < size:
+        raise EOFError('connection closed')
+    return data
+
+
+class FrameWriter(io.RawIOBase):
+    """
+    output of query to client, every write is sent as one frame
+    """
+
+    def __init__(self, conn, kind):
+        super().__init__()
+        self.conn = conn
+        self.kind = kind
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        _send_frame(self.conn, self.kind, bytes(data))
+        return len(data)
+
+
+class DeepLogServer:
+    """
+    resident process serving queries of clients on a unix socket.
+    prepare(request) runs in server, it keeps state warm across queries (configs, file catalog, loaded modules).
+    every query runs execute(request, state) in a forked child which inherits warm state, so a query pays neither
+    interpreter startup, imports nor config loading. its output is streamed back to client in frames
+    """
+
+    def __init__(self, socket_path, prepare, execute):
+        self.socket_path = socket_path
+        self.prepare = prepare
+        self.execute = execute
+        self.sock = None
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise Exception("deep-log daemon already listening on {}".format(self.socket_path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                # stale socket of a daemon not running any more
+                os.remove(self.socket_path)
+            finally:
+                probe.close()
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.socket_path)
+        # queries run with permissions of server user, only the user may connect
+        os.chmod(self.socket_path, 0o600)
+        self.sock.listen(16)
+
+    @staticmethod
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt()
+
+    @staticmethod
+    def _reap(signum=None, frame=None):
+        try:
+            while os.waitpid(-1, os.WNOHANG)[0]:
+                pass
+        except ChildProcessError:
+            pass
+
+    def serve_forever(self):
+        self._bind()
+        signal.signal(signal.SIGCHLD, self._reap)
+        signal.signal(signal.SIGTERM, self._terminate)
+        logging.info("deep-log daemon listening on {}".format(self.socket_path))
+        try:
+            while True:
+                conn, _ = self.sock.accept()
+                try:
+                    self.handle(conn)
+                except Exception as e:
+                    logging.exception("failed to serve query")
+                finally:
+                    conn.close()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.sock.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def handle(self, conn):
+        with conn.makefile('rb') as conn_file:
+            request = json.loads(conn_file.readline())
+
+        try:
+            os.chdir(request.get('cwd', '/'))
+            state = self.prepare(request)
+        except BaseException as e:
+            # bad arguments are reported to client by query
+            logging.warning("failed to prepare query {}: {}".format(request.get('argv'), e))
+            state = None
+
+        if os.fork() == 0:
+            try:
+                self._run_child(conn, request, state)
+            finally:
+                # child never returns to server loop
+                os._exit(1)
+
+    def _run_child(self, conn, request, state):
+        code = 1
+        try:
+            self.sock.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            threading.Thread(target=self._watch_client, args=(conn,), daemon=True).start()
+            # line buffered as local output if client prints to a terminal
+            sys.stdout = io.TextIOWrapper(io.BufferedWriter(FrameWriter(conn, STDOUT), OUTPUT_BUFFER),
+                                          line_buffering=request.get('tty', False))
+            sys.stderr = io.TextIOWrapper(FrameWriter(conn, STDERR), write_through=True)
+            code = self.execute(request, state)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except (KeyboardInterrupt, BrokenPipeError, ConnectionResetError):
+            # client gone
+            code = 130
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            # client closes connection once exit code is read
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                _send_frame(conn, EXIT, struct.pack('!i', code if code else 0))
+            except (OSError, ValueError):
+                pass
+            os._exit(0)
+
+    @staticmethod
+    def _watch_client(conn):
+        # client closed connection (interrupted, or its output closed), query is interrupted as with ctrl-c
+        try:
+            conn.recv(1)
+        except OSError:
+            pass
+        os.kill(os.getpid(), signal.SIGINT)
+
+
+def _read_output(conn_file):
+    # output frames of query written to stdout & stderr, until exit code
+    while True:
+        kind, size = FRAME_HEADER.unpack(_read_exactly(conn_file, FRAME_HEADER.size))
+        payload = _read_exactly(conn_file, size)
+        if kind == EXIT:
+            return struct.unpack('!i', payload)[0]
+        output = sys.stdout if kind == STDOUT else sys.stderr
+        output.buffer.write(payload)
+        output.flush()
+
+
+def request(socket_path, argv):
+    # run query of argv by daemon, output is written to stdout & stderr. exit code, None if no daemon listening
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        conn.close()
+        return None
+
+    interrupted = []
+
+    def interrupt(signum, frame):
+        # first ctrl-c interrupts query, which flushes its output & exits. second one leaves it
+        if interrupted:
+            raise KeyboardInterrupt()
+        interrupted.append(True)
+        conn.shutdown(socket.SHUT_WR)
+
+    previous = signal.signal(signal.SIGINT, interrupt)
+    try:
+        conn.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd(), 'tty': sys.stdout.isatty()}).encode() + b'\n')
+        with conn.makefile('rb') as conn_file:
+            return _read_output(conn_file)
+    except EOFError:
+        print("deep-log daemon closed connection", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        signal.signal(signal.SIGINT, previous)
+        conn.close()
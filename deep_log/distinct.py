@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from collections import OrderedDict
+
+from deep_log.utils import BloomFilter
+
+# bytes of fingerprint, 128 bits
+FINGERPRINT_SIZE = 16
+# rough memory of one fingerprint kept in a set
+KEY_MEMORY = 100
+SPILL_BATCH = 10000
+# fingerprints kept by distinct prefilter of a worker if no memory budget given
+PREFILTER_KEYS = 100000
+
+
+def canonical(value):
+    """
+    text of value, same for values equal in python: 1, 1.0 and True, sets and dicts in any order.
+    types not equal to each other (str & int, list & tuple, set & dict) are still told apart
+    """
+    if isinstance(value, bool) or (isinstance(value, float) and value.is_integer()):
+        return repr(int(value))
+    if isinstance(value, (set, frozenset)):
+        return '<' + ', '.join(sorted(canonical(one) for one in value)) + '>'
+    if isinstance(value, dict):
+        return '{' + ', '.join(sorted(canonical(key) + ': ' + canonical(one) for key, one in value.items())) + '}'
+    if isinstance(value, list):
+        return '[' + ', '.join(canonical(one) for one in value) + ']'
+    if isinstance(value, tuple):
+        return '(' + ', '.join(canonical(one) for one in value) + ')'
+    return repr(value)
+
+
+def fingerprint(values):
+    # stable across processes, unlike hash()
+    return hashlib.blake2b(canonical(values).encode(), digest_size=FINGERPRINT_SIZE).digest()
+
+
+class DistinctPrefilter:
+    """
+    drop duplicates before records are shipped to consumer, which keeps first record of each distinct values.
+    exact and bounded: fingerprints are forgotten all at once when max keys are kept, some duplicates pass then,
+    but a record is never dropped by mistake.
+    """
+
+    def __init__(self, fields, max_keys=None):
+        self.fields = fields
+        self.max_keys = max_keys if max_keys else PREFILTER_KEYS
+        self.keys = set()
+
+    def is_new(self, record):
+        key = fingerprint(tuple([record.get(column) for column in self.fields]))
+        if key in self.keys:
+            return False
+        if len(self.keys) >= self.max_keys:
+            self.keys.clear()
+        self.keys.add(key)
+        return True
+
+    def filter(self, records):
+        for one in records:
+            if self.is_new(one):
+                yield one
+
+    def close(self):
+        self.keys.clear()
+
+
+class DistinctFilter:
+    """
+    keep first record of each distinct values of fields, by 128 bits fingerprints of values.
+    exact mode keeps fingerprints in a set, spilled to a sqlite file when they take more than max memory.
+    with window (keys count) or ttl (seconds), keys are forgotten after the window, a record is emitted again then.
+    approximate mode (error rate) uses bloom filters instead, a record may be dropped by mistake at about the
+    reported error rate. in approximate mode keys are forgotten with a whole filter generation, after 1 to 2 windows.
+    """
+
+    def __init__(self, fields, window=None, ttl=None, error_rate=None, capacity=None, max_memory=None):
+        self.fields = fields
+        self.window = window
+        self.ttl = ttl
+        self.error_rate = error_rate
+        self.capacity = capacity if capacity else 10000000
+        self.max_keys = max_memory // KEY_MEMORY if max_memory else None
+        self.keys = set()
+        # fingerprint -> time seen, oldest first, for window or ttl
+        self.recent = OrderedDict()
+        self.generations = []
+        self.rotated_time = time.monotonic()
+        self.db = None
+        self.db_file = None
+        self.dropped = 0
+
+        if self.error_rate:
+            self.generations.append(BloomFilter(capacity=min(self.capacity, window) if window else self.capacity,
+                                                  error_rate=error_rate))
+
+    def _is_new_approximate(self, key, now):
+        current = self.generations[-1]
+        if (self.window and current.count >= self.window) or (self.ttl and now - self.rotated_time >= self.ttl):
+            # drop oldest generation, keys of last generation are still remembered
+            current = BloomFilter(capacity=min(self.capacity, self.window) if self.window else self.capacity,
+                                  error_rate=self.error_rate)
+            self.generations = [self.generations[-1], current]
+            self.rotated_time = now
+        if any(key in one for one in self.generations[:-1]):
+            return False
+        return not current.add(key)
+
+    def _is_new_recent(self, key, now):
+        if self.ttl:
+            while self.recent and now - next(iter(self.recent.values())) >= self.ttl:
+                self.recent.popitem(last=False)
+        if key in self.recent:
+            return False
+        self.recent[key] = now
+        if self.window and len(self.recent) > self.window:
+            self.recent.popitem(last=False)
+        return True
+
+    def _spill(self):
+        if self.db is None:
+            fd, self.db_file = tempfile.mkstemp(prefix='deep-log-distinct-', suffix='.db')
+            os.close(fd)
+            self.db = sqlite3.connect(self.db_file)
+            self.db.execute('PRAGMA journal_mode=OFF')
+            self.db.execute('PRAGMA synchronous=OFF')
+            self.db.execute('CREATE TABLE keys (key BLOB PRIMARY KEY) WITHOUT ROWID')
+        self.db.executemany('INSERT OR IGNORE INTO keys VALUES (?)', ((one,) for one in self.keys))
+        self.db.commit()
+        self.keys.clear()
+
+    def _is_new_exact(self, key):
+        if key in self.keys:
+            return False
+        if self.db is not None and self.db.execute('SELECT 1 FROM keys WHERE key = ?', (key,)).fetchone():
+            return False
+        self.keys.add(key)
+        if self.max_keys and len(self.keys) >= max(self.max_keys, SPILL_BATCH):
+            self._spill()
+        return True
+
+    def is_new(self, record):
+        key = fingerprint(tuple([record.get(column) for column in self.fields]))
+        if self.error_rate:
+            new = self._is_new_approximate(key, time.monotonic())
+        elif self.window or self.ttl:
+            new = self._is_new_recent(key, time.monotonic())
+        else:
+            new = self._is_new_exact(key)
+        if not new:
+            self.dropped = self.dropped + 1
+        return new
+
+    def filter(self, records):
+        try:
+            for one in records:
+                if self.is_new(one):
+                    yield one
+        finally:
+            self.close()
+
+    def report(self):
+        # estimated error rate of approximate mode
+        if self.error_rate:
+            logging.info("approximate distinct dropped {} records, estimated false positive rate {:.2e}".format(
+                self.dropped, max(one.error_rate() for one in self.generations)))
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+            os.remove(self.db_file)
@@ -0,0 +1,482 @@
+import ast
+import builtins
+import functools
+import re
+import types
+
+from deep_log import filter
+from deep_log import handler
+from deep_log import meta_filter
+from deep_log import parser
+from deep_log import utils
+
+# names used in generated predicate
+SUBJECT = '__subject'
+RECORD = '__record'
+FIELD = '__field'
+COPIES = '__copies'
+REPORT = '__report'
+LOADER = '__loader'
+EXPRESSION = '__expression'
+
+FUNCTION_TEMPLATE = '''
+def __predicate(__subject):
+    return True
+'''
+
+# statement templates, __expression is replaced by the rewritten dsl
+STATEMENT_TEMPLATES = {
+    'record': '__record = __subject',
+    'load': '__record = __loader(__subject)',
+    'call': '''
+if not __expression(__subject):
+    return False
+''',
+    'raise': '''
+__copies = {}
+if not __expression:
+    return False
+''',
+    'fail': '''
+__copies = {}
+try:
+    if not __expression:
+        return False
+except Exception as __error:
+    __report(__error)
+    return False
+''',
+    'pass': '''
+__copies = {}
+try:
+    if not __expression:
+        return False
+except Exception as __error:
+    __report(__error)
+''',
+}
+
+
+def field(record, name, copies):
+    # same resolution as utils.RecordNamespace: record fields, then python builtins
+    # mutable values are copied once per expression, so that changes are seen by the rest of expression only
+    try:
+        value = record[name]
+    except KeyError:
+        try:
+            return getattr(builtins, name)
+        except AttributeError:
+            raise NameError("name '{}' is not defined".format(name)) from None
+    if name in copies:
+        return copies[name]
+    copied = utils.detach(value)
+    if copied is not value:
+        copies[name] = copied
+    return copied
+
+
+class FieldRewriter(ast.NodeTransformer):
+    """
+    rewrite free names of dsl expression to field lookups on the record, names of built functions and names bound
+    inside the expression (lambda arguments, comprehension targets, assignment expressions) are kept.
+    """
+
+    def __init__(self, reserved=None):
+        self.reserved = set(reserved) if reserved else set()
+        self.scopes = []
+
+    def _is_bound(self, name):
+        return name in self.reserved or any(name in one for one in self.scopes)
+
+    @staticmethod
+    def _target_names(target):
+        return {one.id for one in ast.walk(target) if isinstance(one, ast.Name)}
+
+    def rewrite(self, expression):
+        self.reserved.update(one.target.id for one in ast.walk(expression) if isinstance(one, ast.NamedExpr))
+        return self.visit(expression)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and not self._is_bound(node.id):
+            lookup = ast.Call(func=ast.Name(id=FIELD, ctx=ast.Load()),
+                              args=[ast.Name(id=RECORD, ctx=ast.Load()), ast.Constant(value=node.id),
+                                    ast.Name(id=COPIES, ctx=ast.Load())], keywords=[])
+            return ast.copy_location(lookup, node)
+        return node
+
+    def visit_Lambda(self, node):
+        # defaults are evaluated in enclosing scope
+        node.args = self.visit(node.args)
+        arguments = [*getattr(node.args, 'posonlyargs', []), *node.args.args, *node.args.kwonlyargs,
+                     node.args.vararg, node.args.kwarg]
+        self.scopes.append({one.arg for one in arguments if one is not None})
+        node.body = self.visit(node.body)
+        self.scopes.pop()
+        return node
+
+    def _visit_comprehension(self, node, fields):
+        # first iterable is evaluated in enclosing scope
+        generators = node.generators
+        generators[0].iter = self.visit(generators[0].iter)
+
+        names = set()
+        for one in generators:
+            names.update(self._target_names(one.target))
+        self.scopes.append(names)
+        for index, one in enumerate(generators):
+            if index:
+                one.iter = self.visit(one.iter)
+            one.ifs = [self.visit(one_if) for one_if in one.ifs]
+        for one_field in fields:
+            setattr(node, one_field, self.visit(getattr(node, one_field)))
+        self.scopes.pop()
+        return node
+
+    def visit_ListComp(self, node):
+        return self._visit_comprehension(node, ['elt'])
+
+    def visit_SetComp(self, node):
+        return self._visit_comprehension(node, ['elt'])
+
+    def visit_GeneratorExp(self, node):
+        return self._visit_comprehension(node, ['elt'])
+
+    def visit_DictComp(self, node):
+        return self._visit_comprehension(node, ['key', 'value'])
+
+
+class ExpressionInliner(ast.NodeTransformer):
+    def __init__(self, expression):
+        self.expression = expression
+
+    def visit_Name(self, node):
+        if node.id == EXPRESSION:
+            return ast.copy_location(self.expression, node)
+        return node
+
+
+def rewrite_expression(source):
+    expression = ast.parse(source.strip(), mode='eval').body
+    return FieldRewriter(utils.built_function.keys()).rewrite(expression)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_predicate(entries):
+    """
+    compile entries into code of one function, which evaluates entries in order with short circuit.
+    entries: tuple of (kind, source), kind is one of 'call', 'raise', 'fail', 'pass', 'record', 'load'
+    source: dsl expression for dsl kinds, global name of callable for 'call'
+    """
+    module = ast.parse(FUNCTION_TEMPLATE)
+    function = module.body[0]
+    body = []
+    for kind, source in entries:
+        statements = ast.parse(STATEMENT_TEMPLATES[kind]).body
+        if kind == 'call':
+            expression = ast.Name(id=source, ctx=ast.Load())
+        elif kind in ('raise', 'fail', 'pass'):
+            expression = rewrite_expression(source)
+        else:
+            expression = None
+        if expression is not None:
+            statements = [ExpressionInliner(expression).visit(one) for one in statements]
+        body.extend(statements)
+
+    function.body = [*body, *function.body]
+    ast.fix_missing_locations(module)
+
+    namespace = {}
+    exec(compile(module, '<dsl>', 'exec'), namespace)
+    return namespace['__predicate'].__code__
+
+
+def build_predicate(entries, callables=None, loader=None):
+    predicate_globals = {**utils.built_function, FIELD: field, REPORT: print, LOADER: loader,
+                         '__builtins__': builtins}
+    if callables:
+        predicate_globals.update(callables)
+    return types.FunctionType(compile_predicate(tuple(entries)), predicate_globals)
+
+
+def fuse_filters(log_filters):
+    # fuse filters of one pipeline into one predicate on record
+    entries = [('record', None)]
+    callables = {}
+    for one in log_filters:
+        if type(one) in (filter.LogFilter, filter.DefaultLogFilter):
+            continue
+        elif isinstance(one, filter.DslFilter) and type(one).filter is filter.DslFilter.filter:
+            if one.expression:
+                entries.append(('pass' if one.pass_on_exception else 'fail', one.expression))
+        else:
+            name = '__filter_{}'.format(len(callables))
+            callables[name] = one.filter
+            entries.append(('call', name))
+
+    return build_predicate(entries, callables)
+
+
+def fuse_meta_filters(meta_filters):
+    # fuse meta filters into one predicate on file name, file info is loaded only if dsl filter exists
+    entries = []
+    callables = {}
+    loaded = False
+    for one in meta_filters:
+        if type(one) is meta_filter.MetaFilter:
+            continue
+        elif isinstance(one, meta_filter.DslMetaFilter) and type(one).filter_meta is meta_filter.DslMetaFilter.filter_meta:
+            if one.file_filter:
+                if not loaded:
+                    entries.append(('load', None))
+                    loaded = True
+                entries.append(('raise', one.file_filter))
+        else:
+            name = '__filter_{}'.format(len(callables))
+            callables[name] = one.filter_meta
+            entries.append(('call', name))
+
+    return build_predicate(entries, callables, loader=utils.get_fileinfo)
+
+
+def _is_record(node):
+    return isinstance(node, ast.Name) and node.id == '_record'
+
+
+def _is_constant_string(node):
+    return isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value
+
+
+def _is_regex_search(node):
+    return (isinstance(node, ast.Attribute) and node.attr == 'search' and isinstance(node.value, ast.Name)
+            and node.value.id == 're')
+
+
+def extract_record_terms(source):
+    """
+    conditions of top level conjunction which only test raw record text.
+    "'needle' in _record" gives needle, "re.search('pattern', _record)" gives pattern
+    """
+    expression = ast.parse(source.strip(), mode='eval').body
+    if isinstance(expression, ast.BoolOp) and isinstance(expression.op, ast.And):
+        parts = expression.values
+    else:
+        parts = [expression]
+
+    needles = []
+    patterns = []
+    for one in parts:
+        if (isinstance(one, ast.Compare) and len(one.ops) == 1 and isinstance(one.ops[0], ast.In)
+                and _is_constant_string(one.left) and _is_record(one.comparators[0])):
+            needles.append(one.left.value)
+        elif (isinstance(one, ast.Call) and _is_regex_search(one.func) and len(one.args) == 2 and not one.keywords
+              and _is_constant_string(one.args[0]) and _is_record(one.args[1])):
+            try:
+                re.compile(one.args[0].value)
+                patterns.append(one.args[0].value)
+            except re.error:
+                pass
+    return needles, patterns
+
+
+def _record_change(one_handler):
+    # how handler changes _record: 'keep', 'shrink' (strip, substrings kept) or 'change'
+    handler_type = type(one_handler)
+    if handler_type in (handler.LogHandler, handler.DefaultLogHandler, handler.ModuleLogHandler,
+                        handler.TagLogHandler):
+        return 'keep'
+    elif handler_type is handler.TypeLogHandler:
+        fields = [one.get('field') for one in one_handler.type_definitions]
+        return 'change' if '_record' in fields else 'keep'
+    elif handler_type is handler.TransformLogHandler:
+        names = [one.get('name') for one in one_handler.definitions]
+        return 'change' if '_record' in names else 'keep'
+    elif handler_type is handler.RegLogHandler:
+        return 'change' if '_record' in one_handler.compiled_pattern.groupindex else 'keep'
+    elif handler_type is handler.StripLogHandler:
+        return 'shrink' if one_handler.fields is None or '_record' in one_handler.fields else 'keep'
+    else:
+        return 'change'
+
+
+def plan_prefilter(log_filters, handlers):
+    # push conditions on _record down to parser, only if handlers don't rewrite _record.
+    # filters passing on exception are ignored for records failing on conditions before would pass
+    needles = []
+    patterns = []
+    for one in log_filters:
+        if (isinstance(one, filter.DslFilter) and type(one).filter is filter.DslFilter.filter and one.expression
+                and not one.pass_on_exception):
+            filter_needles, filter_patterns = extract_record_terms(one.expression)
+            needles.extend(filter_needles)
+            patterns.extend(filter_patterns)
+
+    for one_handler in handlers:
+        if not needles and not patterns:
+            break
+        change = _record_change(one_handler)
+        if change == 'change':
+            return None
+        elif change == 'shrink':
+            # substring of stripped text is substring of raw text, it's not true for regular expression anchors
+            patterns = []
+
+    if not needles and not patterns:
+        return None
+    return parser.RecordPrefilter(needles, patterns)
+
+
+COMPARE_OPERATORS = {ast.Eq: '==', ast.Gt: '>', ast.GtE: '>=', ast.Lt: '<', ast.LtE: '<='}
+SWAPPED_OPERATORS = {'==': '==', '>': '<', '>=': '<=', '<': '>', '<=': '>='}
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def _field_name(node):
+    # free name which refers to a record field
+    if isinstance(node, ast.Name) and node.id not in utils.built_function:
+        return node.id
+    return None
+
+
+def _block_field(node):
+    # record field with block statistics, file info, internal fields and tags are not kept by zone map
+    name = _field_name(node)
+    if name and not name.startswith('_') and name != 'tags':
+        return name
+    return None
+
+
+def _number(node):
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _number(node.operand)
+        return None if value is None else -value
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return node.value
+    return None
+
+
+def _range_operand(node):
+    """
+    (field, kind, offset) for "field", "field.timestamp()" and "field.timestamp() - number",
+    kind is 'num' for number field and 'ts' for timestamp of datetime field
+    """
+    offset = 0
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub)):
+        number = _number(node.right)
+        if number is None:
+            return None
+        offset = number if isinstance(node.op, ast.Add) else -number
+        node = node.left
+
+    if (isinstance(node, ast.Call) and not node.args and not node.keywords and isinstance(node.func, ast.Attribute)
+            and node.func.attr == 'timestamp' and _block_field(node.func.value)):
+        return _block_field(node.func.value), 'ts', offset
+    if _block_field(node) and not offset:
+        return _block_field(node), 'num', 0
+    return None
+
+
+def needle_tokens(needle):
+    # tokens which are whole tokens of any text containing the needle
+    tokens = []
+    for matched in TOKEN_PATTERN.finditer(needle):
+        if matched.start() > 0 and matched.end() < len(needle):
+            tokens.append(matched.group())
+    return tokens
+
+
+def extract_block_constraints(source):
+    """
+    constraints of top level conjunction which can be checked on block statistics:
+    ('values', field, strings) for "field == 'a'" and "field in ('a', 'b')",
+    ('range', field, kind, operator, number) for "field > 1", "field.timestamp() - 100 > 0",
+    ('tokens', field, tokens) for "'needle' in _record".
+    fields starting with '_' (file info, _line_number) and tags have no block statistics, they aren't constrained
+    """
+    expression = ast.parse(source.strip(), mode='eval').body
+    if isinstance(expression, ast.BoolOp) and isinstance(expression.op, ast.And):
+        parts = expression.values
+    else:
+        parts = [expression]
+
+    constraints = []
+    for one in parts:
+        if not isinstance(one, ast.Compare) or len(one.ops) != 1:
+            continue
+        left, operator, right = one.left, one.ops[0], one.comparators[0]
+
+        if isinstance(operator, ast.In):
+            if _is_constant_string(left) and _is_record(right):
+                tokens = needle_tokens(left.value)
+                if tokens:
+                    constraints.append(('tokens', '_record', tuple(tokens)))
+            elif (_block_field(left) and isinstance(right, (ast.Tuple, ast.List, ast.Set)) and right.elts
+                  and all(isinstance(x, ast.Constant) and isinstance(x.value, str) for x in right.elts)):
+                constraints.append(('values', _block_field(left), frozenset(x.value for x in right.elts)))
+            continue
+
+        if type(operator) not in COMPARE_OPERATORS:
+            continue
+        operator = COMPARE_OPERATORS[type(operator)]
+
+        if operator == '==':
+            if _block_field(left) and isinstance(right, ast.Constant) and isinstance(right.value, str):
+                constraints.append(('values', _block_field(left), frozenset([right.value])))
+                continue
+            if _block_field(right) and isinstance(left, ast.Constant) and isinstance(left.value, str):
+                constraints.append(('values', _block_field(right), frozenset([left.value])))
+                continue
+
+        if _range_operand(left) and _number(right) is not None:
+            field_name, kind, offset = _range_operand(left)
+            constraints.append(('range', field_name, kind, operator, _number(right) - offset))
+        elif _range_operand(right) and _number(left) is not None:
+            field_name, kind, offset = _range_operand(right)
+            constraints.append(('range', field_name, kind, SWAPPED_OPERATORS[operator], _number(left) - offset))
+
+    return constraints
+
+
+def plan_constraints(log_filters):
+    # block constraints of all filters, filters passing on exception are ignored for missing fields would pass
+    constraints = []
+    for one in log_filters:
+        if (isinstance(one, filter.DslFilter) and type(one).filter is filter.DslFilter.filter and one.expression
+                and not one.pass_on_exception):
+            constraints.extend(extract_block_constraints(one.expression))
+    return constraints
+
+
+def extract_index_terms(source):
+    """
+    conditions of top level conjunction which can be answered by token index:
+    (field, needle, False) for "'needle' in field", (field, value, True) for "field == 'value'"
+    """
+    expression = ast.parse(source.strip(), mode='eval').body
+    if isinstance(expression, ast.BoolOp) and isinstance(expression.op, ast.And):
+        parts = expression.values
+    else:
+        parts = [expression]
+
+    terms = []
+    for one in parts:
+        if not isinstance(one, ast.Compare) or len(one.ops) != 1:
+            continue
+        left, operator, right = one.left, one.ops[0], one.comparators[0]
+        if isinstance(operator, ast.In) and _is_constant_string(left) and _field_name(right):
+            terms.append((_field_name(right), left.value, False))
+        elif isinstance(operator, ast.Eq):
+            if _field_name(left) and _is_constant_string(right):
+                terms.append((_field_name(left), right.value, True))
+            elif _field_name(right) and _is_constant_string(left):
+                terms.append((_field_name(right), left.value, True))
+    return terms
+
+
+def plan_index_terms(log_filters):
+    # index terms of all filters, filters passing on exception are ignored for missing fields would pass
+    terms = []
+    for one in log_filters:
+        if (isinstance(one, filter.DslFilter) and type(one).filter is filter.DslFilter.filter and one.expression
+                and not one.pass_on_exception):
+            terms.extend(extract_index_terms(one.expression))
+    return terms
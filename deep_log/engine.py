@@ -1,11 +1,60 @@
+import logging
 import multiprocessing as mp
 import os
+import shutil
+import signal
 import sys
+import tempfile
+import time
+from collections import deque
+from functools import partial
+from itertools import islice
+from queue import Empty
+
+from deep_log.distinct import KEY_MEMORY, DistinctFilter, DistinctPrefilter
+from deep_log.pipeline import pipeline_cache
+from deep_log.stream import StreamBatcher, StreamMetrics
+from deep_log.transport import discard_batch, load_batch, remove_segments, share_batch, start_transport
+from deep_log.zonemap import BlockStats
+
+# seconds to wait for workers to finish their current batches once stopped
+STOP_TIMEOUT = 5
+# chunks of tasks dispatched per worker, when tasks are small
+CHUNKS_PER_WORKER = 4
+# seconds waiting for results of workers before they are checked
+POLL_INTERVAL = 1
+
+# engine, result queue, stop event & distinct prefilter of pool worker, set once per worker by pool initializer
+_worker_engine = None
+_worker_queue = None
+_worker_stop = None
+_worker_distinct = None
+
+
+def _init_worker(engine, queue=None, stop=None):
+    # engine (miner, config & settings) is sent once per worker, pipelines are built & cached in worker on first use
+    global _worker_engine, _worker_queue, _worker_stop, _worker_distinct
+    # terminated by pool, without cleanup of consumer inherited
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _worker_engine = engine
+    _worker_queue = queue
+    _worker_stop = stop
+    # duplicates are dropped across all tasks of worker
+    _worker_distinct = engine.create_prefilter()
+    # hits & misses of consumer inherited by fork are counted by consumer
+    pipeline_cache.drain()
+
+
+def _run_chunk(name, tasks):
+    # method of worker engine on every task of chunk, with pipeline cache hits & misses of chunk
+    return [getattr(_worker_engine, name)(one) for one in tasks], pipeline_cache.drain()
 
 
 class LogEngine:
     def __init__(self, log_miner, log_analyzer, log_writer, targets=None, modules=None, workers=None, name_only=False,
-                 subscribe=False, limit=None, distinct=None, window=None, time_window=None, include_history=None):
+                 subscribe=False, limit=None, distinct=None, window=None, time_window=None, include_history=None,
+                 batch_size=None, shard_size=None, resume=False, max_memory=None, distinct_window=None, distinct_ttl=None,
+                 approximate_distinct=None, distinct_capacity=None, columnar=False, shared_memory=False):
         # rguments = ['subscribe', 'order_by', 'analyze', 'format', 'limit', 'full', 'reverse', 'name_only', 'workers']
         self.log_miner = log_miner  # mapper
         self.log_analyzer = log_analyzer  # reducer
@@ -17,7 +66,39 @@ class LogEngine:
         self.subscribe = subscribe
         self.limit = limit
         self.distinct = distinct.split(',') if distinct else []
+        # distinct keys are forgotten after window (keys count) or ttl (seconds)
+        self.distinct_window = distinct_window
+        self.distinct_ttl = distinct_ttl
+        # error rate of approximate distinct by bloom filter, sized for distinct capacity keys
+        self.approximate_distinct = approximate_distinct
+        self.distinct_capacity = distinct_capacity
         self.include_history = include_history
+        # subscribe from offsets saved by last run
+        self.resume = resume
+        self.batch_size = batch_size if batch_size else 1000
+        # MB, files larger than shard size are split and parsed in parallel
+        self.shard_size = (shard_size if shard_size else 64) * 1024 * 1024
+
+        # order by with limit and no window, keep top records only, workers ship their own top records
+        self.top_limit = limit if (limit and window is None and not subscribe and self.log_analyzer.order_by) else None
+        # records removed by distinct must not take places of top records in workers
+        self.worker_top = self.top_limit if not self.distinct else None
+        # MB, order by without limit spills sorted runs to disk when records take more than max memory
+        self.max_memory = max_memory * 1024 * 1024 if max_memory else None
+        self.external_sort = bool(self.max_memory and window is None and not subscribe and not self.top_limit
+                                  and self.log_analyzer.order_by)
+        # temp dir of sorted runs, shared with pool workers
+        self.sort_dir = None
+        # records one shard ships at most, first limit records are all consumer takes
+        self.shard_limit = limit if (limit and not self.distinct and not self.log_analyzer.aggregations
+                                     and not self.top_limit and not subscribe) else None
+        # batches of workers are encoded in shared memory segments, only descriptors go through the queue
+        self.shared_memory = shared_memory
+        self.transport_session = None
+        # analyze records shipped in column batches, data frame is built from columns
+        self.columnar = bool(columnar and self.log_analyzer.analyze_dsl and not self.log_analyzer.order_by
+                             and not self.log_analyzer.aggregations and not self.distinct and window is None
+                             and not subscribe)
 
         if window is not None:
             self.window = window
@@ -31,14 +112,260 @@ class LogEngine:
         # for future usage
         self.time_window = time_window if not time_window else 0
 
-    def mine_files(self, files):
-        if isinstance(files, str):
-            files = [files]
-        return list(self.log_miner.mine_files(files))
+    def stream_files(self, task):
+        # ship records back in bounded batches, None marks the end of task with zone map statistics of shard.
+        # once stopped, shard is left between batches & tasks not started are dropped
+        task_id, file_name, start, end, collect = task
+        stats = BlockStats(start, end) if collect else None
+        if _worker_stop.is_set():
+            _worker_queue.put((task_id, None, None))
+            return
+        # batches are encoded in shared memory segments of transport session, if enabled
+        session = self.transport_session if self.shared_memory else None
+        try:
+            batch = []
+            shipped = 0
+            records = self.log_miner.mine_file(file_name, start, end, stats)
+            if self.shard_limit:
+                records = islice(records, self.shard_limit)
+            if _worker_distinct is not None:
+                # duplicates seen by worker are not shipped, first one of all shards is kept by consumer
+                records = _worker_distinct.filter(records)
+            if self.worker_top:
+                records = self.log_analyzer.top(records, self.worker_top)
+            for one in records:
+                batch.append(one)
+                if len(batch) >= self.batch_size:
+                    _worker_queue.put((task_id, share_batch(batch, session) if session else batch, None))
+                    shipped = shipped + len(batch)
+                    batch = []
+                    if _worker_stop.is_set():
+                        # statistics of part of shard are not kept
+                        stats = None
+                        return
+            if batch:
+                _worker_queue.put((task_id, share_batch(batch, session) if session else batch, None))
+                shipped = shipped + len(batch)
+            if self.shard_limit and shipped >= self.shard_limit:
+                # shard may be left before end
+                stats = None
+        except Exception as error:
+            logging.exception("failed to mine file {}".format(file_name))
+            stats = None
+        finally:
+            _worker_queue.put((task_id, None, stats.to_dict() if stats else None))
+
+    def sort_files(self, task):
+        # sorted runs of one shard, memory budget is shared by workers
+        task_id, file_name, start, end, collect = task
+        stats = BlockStats(start, end) if collect else None
+        sorter = self.log_analyzer.create_sorter(self.max_memory // self.workers, self.sort_dir)
+        try:
+            sorter.extend(self.log_miner.mine_file(file_name, start, end, stats))
+            sorter.spill()
+        except Exception as error:
+            logging.exception("failed to mine file {}".format(file_name))
+            stats = None
+        return sorter.runs, stats.to_dict() if stats else None
+
+    def sort_records(self):
+        self.sort_dir = tempfile.mkdtemp(prefix='deep-log-sort-')
+        try:
+            if self.workers == 1 or self.distinct:
+                # first record of distinct values depends on original order, sort after distinct
+                sorter = self.log_analyzer.create_sorter(self.max_memory, self.sort_dir)
+                sorter.extend(self.distinct_records(self.execute()))
+                for one in sorter.sorted():
+                    yield one
+            else:
+                for one in self.log_analyzer.merge_runs(self.sort_shards()):
+                    yield one
+        finally:
+            shutil.rmtree(self.sort_dir, ignore_errors=True)
+
+    def sort_shards(self):
+        # shards are sorted by workers in parallel, runs are listed in task order to keep sort stable
+        runs = []
+        for one in self.map_shards(self.sort_files):
+            runs.extend(one)
+        return runs
+
+    def aggregate_files(self, task):
+        # partial aggregates of one shard
+        task_id, file_name, start, end, collect = task
+        stats = BlockStats(start, end) if collect else None
+        aggregator = self.log_analyzer.create_aggregator()
+        try:
+            aggregator.extend(self.log_miner.mine_file(file_name, start, end, stats))
+        except Exception as error:
+            logging.exception("failed to mine file {}".format(file_name))
+            stats = None
+        return aggregator.groups, stats.to_dict() if stats else None
+
+    def aggregate_records(self):
+        aggregator = self.log_analyzer.create_aggregator()
+        if self.workers == 1 or self.distinct:
+            # distinct depends on all records, aggregate after distinct
+            aggregator.extend(self.distinct_records(self.execute()))
+        else:
+            for one in self.map_shards(self.aggregate_files):
+                aggregator.merge(one)
+
+        rows = aggregator.results()
+        if self.log_analyzer.order_by:
+            rows = self.log_analyzer.analyze(rows)
+        return rows[:self.limit] if self.limit else rows
+
+    def columnar_files(self, task):
+        # column batches of one shard
+        task_id, file_name, start, end, collect = task
+        stats = BlockStats(start, end) if collect else None
+        # numpy & pandas are imported by columnar queries only
+        from deep_log.columnar import ColumnBuilder
+
+        batches = []
+        try:
+            records = self.log_miner.mine_file(file_name, start, end, stats)
+            if self.shard_limit:
+                records = islice(records, self.shard_limit)
+            batches = list(ColumnBuilder(file_name, self.batch_size).build(records))
+            if self.shard_limit and sum(one.size for one in batches) >= self.shard_limit:
+                # shard may be left before end
+                stats = None
+        except Exception as error:
+            logging.exception("failed to mine file {}".format(file_name))
+            stats = None
+        return batches, stats.to_dict() if stats else None
+
+    def analyze_columns(self):
+        from deep_log.columnar import concat_batches
 
-    def mining_files(self, files, queue):
-        for one in self.log_miner.mining_files(files, self.include_history):
-            queue.put(one)
+        batches = []
+        for one in self.map_shards(self.columnar_files):
+            batches.extend(one)
+
+        df = concat_batches(batches)
+        return self.log_analyzer.analyze_frame(df.head(self.limit) if self.limit else df)
+
+    def partial_aggregates(self, files, target_paths=None, partition=None, stop=None):
+        # partial aggregates of followed files, shipped after changes of every wake
+        aggregator = self.log_analyzer.create_aggregator()
+        distinct = self.create_distinct(self.max_memory // self.workers if self.max_memory else None) \
+            if self.distinct else None
+        try:
+            for one in self.log_miner.mining_files(files, self.include_history, target_paths, partition, self.resume,
+                                                   heartbeat=True, stop=stop):
+                if one is None:
+                    if aggregator.groups:
+                        yield aggregator.drain()
+                elif distinct is None or distinct.is_new(one):
+                    aggregator.add(one)
+        finally:
+            if distinct is not None:
+                distinct.close()
+
+    def aggregating_files(self, files, queue, target_paths=None, partition=None, stop=None):
+        # partial aggregates of one wake are shipped as a batch of one
+        for one in self.partial_aggregates(files, target_paths, partition, stop):
+            queue.put([one])
+
+    def aggregate_stream(self):
+        # rows of groups changed are written again once partial aggregates are merged
+        if self.workers == 1:
+            partials = self.partial_aggregates(self.log_miner.get_target_files(self.targets, self.modules),
+                                               self.log_miner.get_target_paths(self.targets, self.modules))
+        else:
+            partials = self.run_in_multi_streams(self.aggregating_files)
+
+        aggregator = self.log_analyzer.create_aggregator()
+        for one in partials:
+            aggregator.merge(one)
+            self.log_writer.write(aggregator.results(list(one)))
+
+    def chunk_size(self, tasks):
+        # many small files are dispatched in chunks, few chunks per worker, a chunk holds at most one shard size
+        # of data so large shards are still balanced one by one
+        size = 0
+        for task_id, file_name, start, end, collect in tasks:
+            if end is not None:
+                size = size + end - start
+            else:
+                try:
+                    size = size + os.path.getsize(file_name) - start
+                except OSError:
+                    size = size + self.shard_size
+        chunk = len(tasks) // (self.workers * CHUNKS_PER_WORKER)
+        return max(1, min(chunk, int(self.shard_size * len(tasks) // max(size, 1))))
+
+    def chunk_tasks(self, tasks, next_tasks):
+        # consecutive whole files are dispatched in chunks, shards of split files one by one
+        size = self.chunk_size(tasks)
+        chunks = deque()
+        chunk = []
+        for one in tasks:
+            task_id = one[0]
+            if task_id in next_tasks or next_tasks.get(task_id - 1) == task_id:
+                if chunk:
+                    chunks.append(chunk)
+                    chunk = []
+                chunks.append([one])
+                continue
+            chunk.append(one)
+            if len(chunk) >= size:
+                chunks.append(chunk)
+                chunk = []
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def map_shards(self, func):
+        # func on every shard by pool workers, returns (result, zone map statistics), results are in task order
+        full_paths = self.log_miner.get_target_files(self.targets, self.modules)
+        shards = self.log_miner.split_files(full_paths, self.shard_size)
+        tasks = [(task_id, *one) for task_id, one in enumerate(shards)]
+
+        collected = []
+        # single worker runs in process
+        pool = mp.Pool(processes=self.workers, initializer=_init_worker, initargs=(self,)) \
+            if self.workers > 1 else None
+        try:
+            if pool:
+                size = self.chunk_size(tasks)
+                chunks = [tasks[index:index + size] for index in range(0, len(tasks), size)]
+                results = self._watch_results(pool.imap(partial(_run_chunk, func.__name__), chunks))
+            else:
+                results = map(func, tasks)
+            for task, (result, stats) in zip(tasks, results):
+                if stats is not None:
+                    collected.append((task[1], stats))
+                yield result
+        finally:
+            if pool:
+                pool.terminate()
+            self.log_miner.update_zone_maps(collected)
+            pipeline_cache.report()
+
+    def mining_files(self, files, queue, target_paths=None, partition=None, stop=None):
+        # records of followed files shipped in batches, pending batch is shipped after changes of every wake
+        batcher = StreamBatcher(queue, self.batch_size)
+        distinct = self.create_prefilter()
+        try:
+            for one in self.log_miner.mining_files(files, self.include_history, target_paths, partition, self.resume,
+                                                   heartbeat=True, stop=stop):
+                if one is None:
+                    batcher.flush()
+                elif distinct is None or distinct.is_new(one):
+                    batcher.add(one)
+            batcher.flush()
+        finally:
+            if distinct is not None:
+                distinct.close()
+
+    def follow_files(self, target, *args):
+        # stream process, interrupt is handled by consumer which stops followers by event
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        target(*args)
 
     def run(self):
         if self.name_only:
@@ -47,22 +374,31 @@ class LogEngine:
 
             return
 
+        if self.log_analyzer.aggregations:
+            if self.subscribe:
+                self.aggregate_stream()
+            else:
+                self.log_writer.write(self.aggregate_records())
+            return
+
+        if self.columnar:
+            self.log_writer.write(self.analyze_columns())
+            return
+
+        if self.top_limit:
+            # partial top records of workers arrive in task order, merged same as sorting all records
+            self.log_writer.write(self.log_analyzer.top(self.distinct_records(self.execute()), self.top_limit))
+            return
+
+        if self.external_sort:
+            self.log_writer.write(self.sort_records())
+            return
+
         total_counter = 0
         batch_counter = 0
-        existing_records = set()
         batch_results = []
 
-        for one in self.execute():
-            if self.limit and total_counter >= self.limit:
-                break
-
-            if self.distinct:
-                the_distinct_values = tuple([one.get(column) for column in self.distinct])
-                if the_distinct_values in existing_records:
-                    continue
-                else:
-                    existing_records.add(the_distinct_values)
-
+        for one in self.distinct_records(self.execute()):
             # accumulate records
             total_counter = total_counter + 1
             batch_counter = batch_counter + 1
@@ -76,16 +412,45 @@ class LogEngine:
                 batch_counter = 0
                 batch_results.clear()
 
-        else:
-            # flush content
-            self.log_writer.write(self.log_analyzer.analyze(batch_results))
+            if self.limit and total_counter >= self.limit:
+                # stop workers before waiting for another record
+                break
+
+        # flush content
+        self.log_writer.write(self.log_analyzer.analyze(batch_results))
+
+    def create_distinct(self, max_memory=None):
+        return DistinctFilter(self.distinct, self.distinct_window, self.distinct_ttl, self.approximate_distinct,
+                              self.distinct_capacity, max_memory)
+
+    def create_prefilter(self):
+        # duplicates dropped by worker before shipping. none with window or ttl, consumer forgets keys then which
+        # worker may still remember
+        if not self.distinct or self.distinct_window or self.distinct_ttl:
+            return None
+        max_keys = self.max_memory // self.workers // KEY_MEMORY if self.max_memory else None
+        return DistinctPrefilter(self.distinct, max_keys)
+
+    def distinct_records(self, records):
+        # first record of each distinct values
+        if not self.distinct:
+            return records
+        return self._distinct(records)
+
+    def _distinct(self, records):
+        distinct = self.create_distinct(self.max_memory)
+        try:
+            for one in distinct.filter(records):
+                yield one
+        finally:
+            distinct.report()
 
     def execute(self):
         if self.workers == 1:
             for one in self.execute1():
                 yield one
 
-        if self.subscribe:
+        elif self.subscribe:
             # stream mode
             for one in self.run_in_multi_streams():
                 yield one
@@ -96,31 +461,219 @@ class LogEngine:
 
     def execute1(self):
         if self.subscribe:
-            return self.log_miner.mining_files(self.log_miner.get_target_files(self.targets, self.modules))
+            return self.log_miner.mining_files(self.log_miner.get_target_files(self.targets, self.modules),
+                                               self.include_history,
+                                               self.log_miner.get_target_paths(self.targets, self.modules),
+                                               resume=self.resume)
         else:
-            return self.log_miner.mine_files(self.log_miner.get_target_files(self.targets, self.modules))
+            full_paths = self.log_miner.get_target_files(self.targets, self.modules)
+            return self.log_miner.mine_shards(self.log_miner.split_files(full_paths, self.shard_size))
 
     def run_in_multi_batches(self):
-        with mp.Pool(processes=self.workers) as pool:
-            for one in pool.imap_unordered(self.mine_files,
-                                           self.log_miner.get_target_files(self.targets, self.modules)):
+        full_paths = self.log_miner.get_target_files(self.targets, self.modules)
+        shards = self.log_miner.split_files(full_paths, self.shard_size)
+        if not shards:
+            return
+
+        tasks = [(task_id, *one) for task_id, one in enumerate(shards)]
+
+        # shards of same file are chained, batches of a shard are held until previous shards finished
+        next_tasks = {}
+        heads = set()
+        for task_id, file_name, start, end, collect in tasks:
+            if task_id == 0 or tasks[task_id - 1][1] != file_name:
+                heads.add(task_id)
+            else:
+                next_tasks[task_id - 1] = task_id
+        pending_batches = {}
+        finished = set()
+        collected = []
+        chunks = self.chunk_tasks(tasks, next_tasks)
+        # dispatched shards waiting for previous shards of their file, batches of them are held by consumer.
+        # at most one per worker is dispatched ahead, held batches are bound to workers x shard size
+        waiting = set()
+
+        # bounded queue, workers block when consumer is slow
+        queue = mp.Queue(maxsize=self.workers * 2)
+        stop = mp.Event()
+        # segments of workers are named by transport session, set before engine is sent to workers
+        session = self.transport_session = start_transport() if self.shared_memory else None
+        # errors of tasks raised out of workers
+        errors = []
+        # pipeline cache hits & misses of chunks done by workers
+        counts = []
+
+        def chunk_done(result):
+            counts.append(result[1])
+
+        try:
+            with mp.Pool(processes=self.workers, initializer=_init_worker, initargs=(self, queue, stop)) as pool:
+                children = self._check_workers(set())
+                # tasks dispatched & not ended
+                pending = 0
                 try:
-                    for item in one:
-                        yield item
-                except Exception as error:
-                    pass
+                    while pending or chunks:
+                        while chunks:
+                            ahead = [one[0] for one in chunks[0] if one[0] not in heads]
+                            if waiting and len(waiting) + len(ahead) > self.workers:
+                                break
+                            chunk = chunks.popleft()
+                            waiting.update(ahead)
+                            pending = pending + len(chunk)
+                            pool.apply_async(_run_chunk, ('stream_files', chunk), callback=chunk_done,
+                                             error_callback=errors.append)
+
+                        try:
+                            task_id, batch, stats = queue.get(timeout=POLL_INTERVAL)
+                        except Empty:
+                            children = self._check_workers(children, errors)
+                            continue
+                        if batch is not None:
+                            if task_id in heads:
+                                for item in load_batch(batch):
+                                    yield item
+                            else:
+                                # shared batches are held encoded, decoded once shard is promoted
+                                pending_batches.setdefault(task_id, []).append(batch)
+                            continue
 
-    def run_in_multi_streams(self):
+                        pending = pending - 1
+                        finished.add(task_id)
+                        if stats is not None:
+                            collected.append((tasks[task_id][1], stats))
+                        while task_id in heads and task_id in finished:
+                            # shard done, promote next shard of the file
+                            heads.discard(task_id)
+                            task_id = next_tasks.get(task_id)
+                            if task_id is None:
+                                break
+                            heads.add(task_id)
+                            waiting.discard(task_id)
+                            # batches not taken yet are left in pending batches, discarded if closed early
+                            held = pending_batches.get(task_id, [])
+                            while held:
+                                for item in load_batch(held.pop(0)):
+                                    yield item
+                            pending_batches.pop(task_id, None)
+                    # every task ended, results of chunks (pipeline cache counts) are handled once workers exit
+                    pool.close()
+                    pool.join()
+                except Exception:
+                    # end of tasks lost with failed workers never arrives, pool is terminated
+                    pending = 0
+                    raise
+                finally:
+                    if pending:
+                        # closed early (limit reached), workers leave shards between batches & remaining tasks are
+                        # dropped
+                        stop.set()
+                        self._drain(queue, pending, tasks, collected)
+                    for held in pending_batches.values():
+                        for one in held:
+                            discard_batch(one)
+                    self.log_miner.update_zone_maps(collected)
+                    for one in counts:
+                        pipeline_cache.merge(one)
+                    pipeline_cache.report()
+        finally:
+            if session:
+                # segments shipped by workers before the pool was terminated
+                remove_segments(session)
+
+    @staticmethod
+    def _check_workers(children, errors=None):
+        """
+        pids of pool workers (or followers) alive. a task raising out of worker, or a worker killed (e.g. out of
+        memory), loses the end of its tasks, which consumer would wait for forever. workers respawned by pool are
+        watched from now on
+        """
+        if errors:
+            raise Exception("task of pool worker failed: {}".format(errors[0]))
+        alive = {one.pid for one in mp.active_children()}
+        lost = children - alive
+        if lost:
+            raise Exception("worker {} exited unexpectedly, results of its tasks are lost".format(
+                ', '.join(str(one) for one in sorted(lost))))
+        return alive
+
+    def _watch_results(self, results):
+        # results of chunks by pool imap, workers are checked while waiting
+        children = self._check_workers(set())
+        while True:
+            try:
+                chunk, counts = results.next(POLL_INTERVAL)
+            except mp.TimeoutError:
+                children = self._check_workers(children)
+                continue
+            except StopIteration:
+                return
+            pipeline_cache.merge(counts)
+            for one in chunk:
+                yield one
+
+    @staticmethod
+    def _drain(queue, pending, tasks, collected):
+        # consume batches of stopped workers until every task ended, pool is terminated if they don't in time
+        try:
+            while pending:
+                task_id, batch, stats = queue.get(timeout=STOP_TIMEOUT)
+                discard_batch(batch)
+                if batch is None:
+                    pending = pending - 1
+                    if stats is not None:
+                        collected.append((tasks[task_id][1], stats))
+        except Empty:
+            logging.warning("{} tasks not stopped in {} seconds, terminated".format(pending, STOP_TIMEOUT))
+
+    @staticmethod
+    def _stop_streams(queue, processes):
+        # batches are drained until followers end, blocked followers can't see stop event otherwise
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while any(p.is_alive() for p in processes) and time.monotonic() < deadline:
+            try:
+                queue.get(timeout=0.1)
+            except Empty:
+                pass
+        for p in processes:
+            if p.is_alive():
+                logging.warning("follower {} not stopped in {} seconds, terminated".format(p.pid, STOP_TIMEOUT))
+                p.terminate()
+            p.join()
+
+    def run_in_multi_streams(self, target=None):
         file_groups = [[] for one in range(0, self.workers)]
         full_paths = self.log_miner.get_target_files(self.targets, self.modules)
-        for one in range(len(full_paths)):
-            the_index = one % self.workers
-            file_groups[the_index].append(full_paths[one])
+        for one in full_paths:
+            file_groups[self.log_miner.get_partition(one, self.workers)].append(one)
 
-        queue = mp.Queue()
-        for one_file_group in file_groups:
-            p = mp.Process(target=self.mining_files, args=(one_file_group, queue))
+        # files created later are assigned to workers by partition
+        target_paths = self.log_miner.get_target_paths(self.targets, self.modules)
+        # bounded queue of batches, followers block when consumer is slow
+        queue = mp.Queue(maxsize=self.workers * 2)
+        stop = mp.Event()
+        metrics = StreamMetrics(queue)
+        processes = []
+        for index, one_file_group in enumerate(file_groups):
+            p = mp.Process(target=self.follow_files,
+                           args=(target if target else self.mining_files, one_file_group, queue, target_paths,
+                                 (index, self.workers), stop))
             p.start()
+            processes.append(p)
 
-        while True:
-            yield queue.get()
+        try:
+            # followers run until stopped, one exited (error raised, killed) would never ship its files again
+            children = {p.pid for p in processes}
+            while True:
+                try:
+                    batch = queue.get(timeout=POLL_INTERVAL)
+                except Empty:
+                    self._check_workers(children)
+                    continue
+                metrics.add(batch)
+                for one in batch:
+                    yield one
+        finally:
+            # closed (limit reached, interrupted or output closed), followers save offsets & end
+            stop.set()
+            self._stop_streams(queue, processes)
+            metrics.report()
@@ -64,7 +64,7 @@ class FilterFactory:
 class MetaFilterFactory:
     @staticmethod
     def create_recent_filter(recent):
-        meta_filter_template = 'mtime.timestamp() - {} > 0'
+        meta_filter_template = '_mtime.timestamp() - {} > 0'
         if recent is None:
             # no fitler
             return meta_filter.DslMetaFilter(None)
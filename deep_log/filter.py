@@ -1,5 +1,3 @@
-import copy
-
 from deep_log import utils
 
 
@@ -17,15 +15,16 @@ class DslFilter(LogFilter):
     def __init__(self, filter, pass_on_exception=False):
 
         self.dsl = filter
+        self.expression = filter
         self.pass_on_exception = pass_on_exception
         if self.dsl:
             self.dsl = compile(self.dsl, '', 'eval')
+        self.namespace = utils.RecordNamespace()
 
     def filter(self, one_log_item):
         try:
             if self.dsl:
-                clone_item = copy.deepcopy(one_log_item)
-                return eval(self.dsl, {**clone_item, **utils.built_function})
+                return eval(self.dsl, self.namespace.bind(one_log_item))
             else:
                 return True
         except Exception as error:
@@ -7,7 +7,6 @@ from datetime import datetime
 from os import path
 
 from deep_log import utils
-from deep_log.utils import built_function
 
 
 class LogHandler:
@@ -70,23 +69,28 @@ class StripLogHandler(LogHandler):
         self.fields = fields
 
     def handle(self, one_log_item):
-        if self.fields is None:
-            return {key: (value.strip() if isinstance(value, str) else value) for key, value in one_log_item.items()}
-        else:
-            return {key: (value.strip() if key in self.fields and isinstance(value, str) else value) for key, value in
-                    one_log_item.items()}
+        # same type as handled record
+        new_one_log_item = copy(one_log_item)
+        for key, value in one_log_item.items():
+            if isinstance(value, str) and (self.fields is None or key in self.fields):
+                stripped = value.strip()
+                if stripped != value:
+                    new_one_log_item[key] = stripped
+        return new_one_log_item
 
 
 class TransformLogHandler(LogHandler):
     def __init__(self, definitions):
         self.definitions = definitions
+        self.namespace = utils.RecordNamespace()
 
     def handle(self, one_log_item):
         new_one_log_item = copy(one_log_item)
+        namespace = self.namespace.bind(one_log_item)
         for one_definition in self.definitions:
             name = one_definition.get('name')
             value = one_definition.get('value')
-            new_one_log_item[name] = eval(value, {**one_log_item, **utils.built_function})
+            new_one_log_item[name] = eval(value, namespace)
 
         return new_one_log_item
 
@@ -114,6 +118,7 @@ class TagLogHandler(LogHandler):
         # }
         self.tag_definitions = definitions
         self._precess_condition()
+        self.namespace = utils.RecordNamespace()
 
     def _precess_condition(self):
         self.tag_definitions = [{"name": one.get("name"), "condition": compile(one.get('condition'), '', 'eval')} for
@@ -121,6 +126,7 @@ class TagLogHandler(LogHandler):
 
     def handle(self, one_log_item):
         tags = one_log_item.get('tags') if 'tags' in one_log_item else set()
+        namespace = self.namespace.bind(one_log_item)
         for one_definition in self.tag_definitions:
             name = one_definition.get('name')
             condition = one_definition.get('condition')
@@ -129,7 +135,7 @@ class TagLogHandler(LogHandler):
                 continue
             else:
                 try:
-                    if eval(condition, {**one_log_item, **built_function}):
+                    if eval(condition, namespace):
                         tags.add(name)
                 except Exception as e:
                     logging.error("can not evaluate condition {} on {}".format(condition, str(one_log_item)))
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+import argparse
+import base64
+import bisect
+import logging
+import os
+
+from deep_log import utils
+from deep_log.compression import detect_compression
+from deep_log.dsl import TOKEN_PATTERN
+
+INDEX_VERSION = 1
+# candidate records closer than merge gap are mined in one range
+MERGE_GAP = 64 * 1024
+
+
+def encode_postings(positions):
+    # sorted positions, delta & varint encoded
+    content = bytearray()
+    last = 0
+    for one in positions:
+        delta = one - last
+        last = one
+        while delta >= 0x80:
+            content.append((delta & 0x7f) | 0x80)
+            delta = delta >> 7
+        content.append(delta)
+    return base64.b64encode(bytes(content)).decode('ascii')
+
+
+def decode_postings(text):
+    positions = []
+    last = 0
+    delta = 0
+    shift = 0
+    for one in base64.b64decode(text):
+        delta = delta | ((one & 0x7f) << shift)
+        if one & 0x80:
+            shift = shift + 7
+        else:
+            last = last + delta
+            positions.append(last)
+            delta = 0
+            shift = 0
+    return positions
+
+
+def value_tokens(value):
+    # tokens of string value, or of string elements of collection value
+    if isinstance(value, str):
+        return TOKEN_PATTERN.findall(value)
+    if isinstance(value, (set, frozenset, list, tuple, dict)):
+        tokens = []
+        for one in value:
+            if isinstance(one, str):
+                tokens.extend(TOKEN_PATTERN.findall(one))
+        return tokens
+    return []
+
+
+def line_start(file, position):
+    # start of the line which ends at position
+    end = position - 1
+    while end > 0:
+        begin = max(0, end - 4096)
+        file.seek(begin)
+        index = file.read(end - begin).rfind(b'\n')
+        if index >= 0:
+            return begin + index + 1
+        end = begin
+    return 0
+
+
+class TokenIndexStore:
+    """
+    inverted token index under cache dir, one compressed json file per log file.
+    postings of each token are positions (_line_number) of records containing the token, index is bound to file
+    identity (inode & leading bytes), signature of parser & handlers and indexed fields, updated from last record
+    when file grows.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def _index_file(self, file_name):
+        return utils.get_cache_file(self.cache_dir, file_name, '.json.gz')
+
+    def _load(self, file_name):
+        return utils.load_cache(self._index_file(file_name), 'token index')
+
+    def _save(self, file_name, index):
+        utils.save_cache(self._index_file(file_name), index)
+
+    def _is_valid(self, file_name, index, signature, fields, size):
+        # index was built on a prefix of current file with same pipeline
+        return (index is not None and index.get('version') == INDEX_VERSION and index.get('inode') == os.stat(file_name).st_ino
+                and index.get('signature') == signature and index.get('fields') == fields
+                and index.get('size', 0) <= size
+                and index.get('fingerprint') == utils.get_fingerprint(file_name, index.get('size', 0)))
+
+    def build(self, file_name, pipeline, fields):
+        # build or update index of file, returns 'unchanged', 'updated', 'built', 'skipped' or 'failed'
+        if detect_compression(file_name):
+            # positions in compressed file can't be seeked directly
+            return 'skipped'
+        size = os.stat(file_name).st_size
+        index = self._load(file_name)
+        postings = {one: {} for one in fields}
+        start = 0
+        if self._is_valid(file_name, index, pipeline.signature, fields, size):
+            if index.get('size') == size:
+                return 'unchanged'
+            # last record may continue in appended data, index it again
+            start = index.get('tail')
+            last_position = index.get('last_position')
+            for field_name, tokens in index.get('postings').items():
+                for token, text in tokens.items():
+                    positions = decode_postings(text)
+                    if positions and positions[-1] == last_position:
+                        positions.pop()
+                    if positions:
+                        postings[field_name][token] = positions
+            records = index.get('records') - (1 if last_position is not None else 0)
+            status = 'updated'
+        else:
+            records = 0
+            status = 'built'
+
+        last_position = None
+        with open(file_name) as fp:
+            for record in pipeline.handle(pipeline.parse(fp, start, None, prefilter=False)):
+                position = record.get('_line_number')
+                if not isinstance(position, int):
+                    logging.error("failed to index file {}: record position missing".format(file_name))
+                    return 'failed'
+                records = records + 1
+                last_position = position
+                for field_name in fields:
+                    field_postings = postings[field_name]
+                    for token in set(value_tokens(record.get(field_name))):
+                        field_postings.setdefault(token, []).append(position)
+
+        if last_position is not None:
+            with open(file_name, 'rb') as f:
+                start = line_start(f, last_position)
+
+        self._save(file_name, {
+            'version': INDEX_VERSION,
+            'file': file_name,
+            'inode': os.stat(file_name).st_ino,
+            'size': size,
+            'fingerprint': utils.get_fingerprint(file_name, size),
+            'signature': pipeline.signature,
+            'fields': fields,
+            'records': records,
+            # records from tail on are not completely indexed
+            'tail': start,
+            'last_position': last_position,
+            # tokens are sorted for prefix search
+            'postings': {field_name: {token: encode_postings(tokens[token]) for token in sorted(tokens)}
+                         for field_name, tokens in postings.items()},
+        })
+        return status
+
+    def status(self, file_name, pipeline, fields):
+        # (state, indexed records, tokens), state is 'missing', 'stale', 'partial' or 'indexed'
+        index = self._load(file_name)
+        if index is None:
+            return 'missing', 0, 0
+        size = os.stat(file_name).st_size
+        tokens = sum(len(one) for one in index.get('postings').values())
+        if not self._is_valid(file_name, index, pipeline.signature, fields, size):
+            return 'stale', index.get('records'), tokens
+        return ('indexed' if index.get('size') == size else 'partial'), index.get('records'), tokens
+
+    @staticmethod
+    def _match_needle(postings, vocabulary, needle, exact, result=None):
+        """
+        positions of records which may contain needle, narrowing result, None if needle has no token.
+        a token of the needle is a whole token in record if word boundary on both sides, otherwise it is matched
+        against tokens of vocabulary as suffix, prefix or substring
+        """
+        for matched in TOKEN_PATTERN.finditer(needle):
+            token = matched.group()
+            left_open = not exact and matched.start() == 0
+            right_open = not exact and matched.end() == len(needle)
+            if not left_open and not right_open:
+                candidates = [token] if token in postings else []
+            elif left_open and right_open:
+                candidates = [one for one in vocabulary if token in one]
+            elif left_open:
+                candidates = [one for one in vocabulary if one.endswith(token)]
+            else:
+                # vocabulary is sorted, tokens with the prefix are adjacent
+                candidates = []
+                for one in vocabulary[bisect.bisect_left(vocabulary, token):]:
+                    if not one.startswith(token):
+                        break
+                    candidates.append(one)
+
+            if result is not None and sum(len(postings[one]) for one in candidates) > 8 * len(result):
+                # not selective, cheaper to check candidates by filters
+                continue
+
+            positions = set()
+            for one in candidates:
+                positions.update(decode_postings(postings[one]))
+            result = positions if result is None else result & positions
+            if not result:
+                break
+        return result
+
+    def plan(self, file_name, pipeline, fields, shard_size=None):
+        # (start, end) ranges of candidate records, None if index can't be used for pipeline
+        terms = [one for one in pipeline.index_terms if one[0] in fields]
+        if not terms or detect_compression(file_name):
+            return None
+
+        size = os.stat(file_name).st_size
+        index = self._load(file_name)
+        if not self._is_valid(file_name, index, pipeline.signature, fields, size):
+            logging.info("token index of {} missing or stale".format(file_name))
+            return None
+
+        # most selective terms first: exact terms, then longer needles
+        candidates = None
+        for field_name, needle, exact in sorted(terms, key=lambda x: (not x[2], -len(x[1]))):
+            postings = index.get('postings').get(field_name)
+            candidates = self._match_needle(postings, list(postings), needle, exact, candidates)
+        if candidates is None:
+            return None
+
+        # last record is mined with the tail
+        candidates.discard(index.get('last_position'))
+        ranges = []
+        with open(file_name, 'rb') as f:
+            for position in sorted(candidates):
+                start = line_start(f, position)
+                if ranges and start - ranges[-1][1] <= MERGE_GAP and (
+                        not shard_size or position - ranges[-1][0] <= shard_size):
+                    ranges[-1] = (ranges[-1][0], position)
+                else:
+                    ranges.append((start, position))
+
+        if index.get('tail') < size:
+            ranges.extend(pipeline.split(file_name, shard_size, index.get('tail')))
+
+        logging.info("token index selected {} of {} records in {}".format(len(candidates), index.get('records'),
+                                                                          file_name))
+        return ranges
+
+
+def main():
+    from deep_log.config import LogConfig
+    from deep_log.miner import DeepLogMiner
+
+    args_parser = argparse.ArgumentParser(description='token index of log files')
+    args_parser.add_argument('command', choices=['build', 'status'], help='build or update index, or show status')
+    args_parser.add_argument('-c', '--config', help='config dir')
+    args_parser.add_argument('--modules', help='index by modules')
+    args_parser.add_argument('--template', help='logger template')
+    args_parser.add_argument('--template_dir', help='logger template dir')
+    args_parser.add_argument('-D', action='append', dest='variables', help='definitions')
+    args_parser.add_argument('--target', metavar='N', nargs='*', help='log dirs to index')
+    args = args_parser.parse_args()
+
+    variables = {one.split('=')[0]: one.split('=')[1] for one in args.variables} if args.variables else {}
+    log_config = LogConfig(args.config, variables, custom_template_name=args.template,
+                           custom_template_dir=args.template_dir)
+    log_miner = DeepLogMiner(log_config)
+    store = TokenIndexStore(log_config.get_cache_dir('index'))
+
+    for file_name in log_miner.get_target_files(args.target, args.modules.split(',') if args.modules else None):
+        pipeline = log_config.get_pipeline(file_name)
+        fields = log_config.get_index_fields(file_name)
+        try:
+            if args.command == 'build':
+                print('{:<10} {}'.format(store.build(file_name, pipeline, fields), file_name))
+            else:
+                state, records, tokens = store.status(file_name, pipeline, fields)
+                print('{:<10} {:>10} {:>10} {}'.format(state, records, tokens, file_name))
+        except Exception as e:
+            logging.exception("failed to index file {}".format(file_name))
+            print('{:<10} {}'.format('failed', file_name))
+
+
+if __name__ == '__main__':
+    main()
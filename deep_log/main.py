@@ -1,17 +1,16 @@
 #!/usr/bin/env python
 import argparse
 import logging
+import os
+import signal
+import sys
 import time
 
 from deep_log import factory
-from deep_log.analyzer import LogAnalyzer
-from deep_log.config import LogConfig
-from deep_log.miner import DeepLogMiner
+from deep_log.daemon import DeepLogServer, default_socket_path, request
 
 # back pressure
 # https://pyformat.info/
-from deep_log.record_writer import LogRecordWriterFactory
-from deep_log.engine import LogEngine
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
@@ -79,7 +78,11 @@ class CmdHelper:
             return value
 
     @staticmethod
-    def build_args_parser():
+    def get_socket_path(args):
+        return args.socket if args.socket else default_socket_path(args.config)
+
+    @staticmethod
+    def build_args_parser(argv=None):
         parser = argparse.ArgumentParser()
         parser.add_argument('-c', '--config', help='config dir')
         parser.add_argument('-l', '--filter', help='log filter')
@@ -92,22 +95,42 @@ class CmdHelper:
         parser.add_argument('--limit', type=int, help='limit query count')
         parser.add_argument('--window', type=int, help='processing window size')
         parser.add_argument('--workers', type=int, help='workers count run in parallel')
+        parser.add_argument('--batch-size', type=int, help='records count per batch shipped from workers')
+        parser.add_argument('--catalog', action='store_true', help='reuse file discovery results cached under config root')
+        parser.add_argument('--index', action='store_true', help='seek to candidate records by token index built with dl-index')
+        parser.add_argument('--seek-index', action='store_true', help='record seek points of compressed files under config root, split them to parallel')
+        parser.add_argument('--zone-map', action='store_true', help='skip file blocks by zone map index under config root')
+        parser.add_argument('--zone-block-size', type=int, help='block size (KB) of zone map index')
+        parser.add_argument('--max-memory', type=int, help='memory budget (MB) of order by, sorted runs are spilled to temp dir beyond it')
+        parser.add_argument('--shard-size', type=int, help='split files larger than shard size (MB) and parse in parallel')
         parser.add_argument('--recent', help='query by time to now, for example, ')
         parser.add_argument('-y', '--analyze', help='dsl expression for analysis, integrate with pandas')
+        parser.add_argument('--shared-memory', action='store_true', help='ship record batches of workers in shared memory segments')
+        parser.add_argument('--columnar', action='store_true', help='ship records to analyze in typed column batches, data frame is built from columns')
+        parser.add_argument('--group-by', help='group records by fields separated by comma, with bucket of time or number field, for example, level,time:5m,latency:100')
+        parser.add_argument('--agg', help='aggregations of groups separated by comma, count, count(field), sum(field), avg(field), min(field) or max(field)')
         parser.add_argument('--tags', help='query by tags')
         parser.add_argument('--modules', help='query by modules')
         parser.add_argument('--template', help='logger template')
         parser.add_argument('--distinct', help='remove duplicated records by specified fields separated by comma')
+        parser.add_argument('--distinct-window', type=int, help='forget distinct keys after specified count of keys, for subscribe mode')
+        parser.add_argument('--distinct-ttl', type=float, help='forget distinct keys after specified seconds, for subscribe mode')
+        parser.add_argument('--approximate-distinct', type=float, help='distinct by bloom filter with specified error rate, for example, 0.001')
+        parser.add_argument('--distinct-capacity', type=int, help='expected distinct keys of approximate distinct, 10000000 by default')
         parser.add_argument('--template_dir', help='logger template dir')
         parser.add_argument('--name-only', action='store_true', help='show only file name')
         parser.add_argument('--full', action='store_true', help='display full')
+        parser.add_argument('--resume', action='store_true', help='save offsets under config root and resume from them, only work with subscribe mode')
         parser.add_argument('--include-history', action='store_true', help='subscribe history or not, only work with subscribe mode')
         parser.add_argument('--pass-on-exception', action='store_true', help='default value if met exception')
+        parser.add_argument('--serve', action='store_true', help='run as daemon serving queries of --connect on unix socket, keeps configs & file catalog warm')
+        parser.add_argument('--connect', action='store_true', help='run query by daemon started with --serve, run locally if no daemon listening')
+        parser.add_argument('--socket', help='unix socket of daemon, daemon.sock under config root by default')
         parser.add_argument('-D', action='append', dest='variables', help='definitions')
         parser.add_argument('--target', metavar='N', nargs='*', help='log dirs to analyze')
         parser.add_argument('pattern', nargs='?', help='default string pattern to match')
 
-        return parser.parse_args()
+        return parser.parse_args(argv)
 
     @staticmethod
     def build_modules(args):
@@ -116,20 +139,44 @@ class CmdHelper:
         return []
 
 
-def main():
-    args = CmdHelper.build_args_parser()
-    log_config = LogConfig(args.config, CmdHelper.build_variables(args), custom_template_name=args.template,
-                           custom_template_dir=args.template_dir)
+def load_config(args):
+    # config, miner & engine modules are imported when a query runs locally, client of daemon doesn't load them
+    from deep_log.config import LogConfig
+
+    return LogConfig(args.config, CmdHelper.build_variables(args), custom_template_name=args.template,
+                     custom_template_dir=args.template_dir)
+
+
+def create_miner(args, log_config):
+    from deep_log.miner import DeepLogMiner
+
+    zone_map_block_size = (args.zone_block_size if args.zone_block_size else 4096) * 1024 if args.zone_map else None
+    return DeepLogMiner(log_config, zone_map_block_size, args.catalog, args.index, args.seek_index)  # mapper
+
+
+def run(args, log_config=None, log_miner=None):
+    # config & miner are loaded unless given, e.g. warm ones of daemon
+    from deep_log.analyzer import LogAnalyzer
+    from deep_log.engine import LogEngine
+    from deep_log.record_writer import LogRecordWriterFactory
+
+    log_config = log_config if log_config else load_config(args)
     log_config.add_filters(CmdHelper.build_filters(args), scope='global')
     log_config.add_meta_filters(CmdHelper.build_meta_filters(args), scope='global')
     # log_config.set_template(args.template, scope='global')
-    log_miner = DeepLogMiner(log_config)  # mapper
+    log_miner = log_miner if log_miner else create_miner(args, log_config)
 
-    log_analyzer = LogAnalyzer(args.order_by, args.analyze, args.reverse)  # reducer
+    log_analyzer = LogAnalyzer(args.order_by, args.analyze, args.reverse, args.group_by, args.agg)  # reducer
 
-    log_record_writer = LogRecordWriterFactory.create(args.format, args.full)
+    format_string = args.format
+    if format_string is None and log_analyzer.aggregations:
+        # aggregated rows are printed as tab separated columns
+        format_string = '\t'.join('{' + one + '}' for one in log_analyzer.get_columns())
+    log_record_writer = LogRecordWriterFactory.create(format_string, args.full)
 
-    arguments = ['subscribe', 'limit', 'name_only', 'workers', 'modules', 'distinct', 'include_history', 'window']
+    arguments = ['subscribe', 'limit', 'name_only', 'workers', 'modules', 'distinct', 'include_history', 'window',
+                 'batch_size', 'shard_size', 'resume', 'max_memory', 'distinct_window', 'distinct_ttl',
+                 'approximate_distinct', 'distinct_capacity', 'columnar', 'shared_memory']
 
     # log_analyzer.analyze(dirs=args.target, modules=CmdHelper.build_modules(args),
     #                      **{one: CmdHelper.get_argument(args, log_config, one) for one in arguments})
@@ -139,5 +186,94 @@ def main():
     runner.run()
 
 
+def _config_signature(args):
+    # modification times of config files & file catalog, warm config and miner are reloaded once they change
+    root = os.path.expanduser(args.config if args.config else '~/.deep_log')
+    paths = [os.path.join(root, 'config.yaml'), os.path.join(root, 'cache', 'catalog', 'catalog.json')]
+    for one in [os.path.join(root, 'templates'), args.template_dir]:
+        if one and os.path.isdir(one):
+            paths.extend(os.path.join(one, name) for name in sorted(os.listdir(one)))
+    signature = []
+    for one in paths:
+        try:
+            signature.append((one, os.stat(one).st_mtime_ns))
+        except OSError:
+            signature.append((one, None))
+    return tuple(signature)
+
+
+def _parse_query(query):
+    # arguments of query sent by client, paths are relative to working dir of client
+    args = CmdHelper.build_args_parser(query['argv'])
+    if args.config:
+        args.config = os.path.abspath(args.config)
+    if args.template_dir:
+        args.template_dir = os.path.abspath(args.template_dir)
+    return args
+
+
+def serve(args):
+    # modules of queries are loaded once by daemon, forked queries inherit them
+    import deep_log.analyzer
+    import deep_log.config
+    import deep_log.engine
+    import deep_log.miner
+    import deep_log.record_writer
+
+    # warm config & miner by config arguments of query
+    warm = {}
+
+    def prepare(query):
+        query_args = _parse_query(query)
+        key = (query_args.config,
+               tuple(sorted(CmdHelper.build_variables(query_args).items())), query_args.template,
+               query_args.template_dir, query_args.zone_map, query_args.zone_block_size, query_args.catalog,
+               query_args.index, query_args.seek_index)
+        signature = _config_signature(query_args)
+        if key not in warm or warm[key][0] != signature:
+            log_config = load_config(query_args)
+            warm[key] = (signature, log_config, create_miner(query_args, log_config))
+        return warm[key][1:]
+
+    def execute(query, state):
+        query_args = _parse_query(query)
+        # filters of query are added to config of forked query only
+        run(query_args, *(state if state else ()))
+
+    DeepLogServer(CmdHelper.get_socket_path(args), prepare, execute).serve_forever()
+
+
+def _terminate(signum, frame):
+    # terminated as interrupted, workers are stopped & shared segments removed by cleanup of engine
+    raise KeyboardInterrupt()
+
+
+def main():
+    args = CmdHelper.build_args_parser()
+    if args.serve:
+        serve(args)
+        return
+
+    if args.connect:
+        try:
+            code = request(CmdHelper.get_socket_path(args), sys.argv[1:])
+        except BrokenPipeError:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            code = 0
+        if code is not None:
+            sys.exit(code)
+        logging.warning("no deep-log daemon listening on {}, run locally".format(CmdHelper.get_socket_path(args)))
+
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        run(args)
+    except KeyboardInterrupt:
+        # workers are stopped as streams are closed
+        pass
+    except BrokenPipeError:
+        # output closed (e.g. piped to head), nothing left to flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
 if __name__ == '__main__':
     main()
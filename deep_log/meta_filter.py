@@ -34,9 +34,10 @@ class DslMetaFilter(MetaFilter):
     def __init__(self, filter):
         self.file_filter = filter
         self.code = compile(self.file_filter, '', 'eval')
+        self.namespace = utils.RecordNamespace()
 
     def filter_meta(self, filename):
         if self.file_filter:
-            return eval(self.code, {**utils.get_fileinfo(filename), **utils.built_function})
+            return eval(self.code, self.namespace.bind(utils.get_fileinfo(filename)))
         else:
             return True
@@ -1,88 +1,268 @@
-import glob
 import logging
 import os
 import time
-import traceback
-from functools import partial
+import zlib
 from os import path
-from multiprocessing import Pool
 
 from binaryornot.check import is_binary
 
 from deep_log import utils
+from deep_log.catalog import FileCatalog
+from deep_log.compression import CompressedFile, SeekPointStore, detect_compression, is_supported
+from deep_log.index import TokenIndexStore
+from deep_log.offsets import OffsetStore, get_file_key
+from deep_log.pipeline import pipeline_cache
+from deep_log.watcher import FLUSH_TIMEOUT, LogTail, create_watcher
+from deep_log.zonemap import BlockStats, ZoneMapStore
 
 
 class DeepLogMiner:
-    def __init__(self, config):
+    def __init__(self, config, zone_map_block_size=None, catalog=False, token_index=False, seek_index=False):
         self.config = config
+        # reuse file discovery results of previous runs
+        self.catalog = FileCatalog(os.path.join(config.get_cache_dir('catalog'), 'catalog.json'),
+                                   config.get_loggers_fingerprint()) if catalog else None
+        # skip blocks of files by zone map index, disabled if block size not specified
+        self.zone_map = ZoneMapStore(config.get_cache_dir('zonemap'), zone_map_block_size) \
+            if zone_map_block_size else None
+        # seek to candidate records by token index built with dl-index
+        self.token_index = TokenIndexStore(config.get_cache_dir('index')) if token_index else None
+        # record seek points of compressed files, split them by seek points
+        self.seek_points = SeekPointStore(config.get_cache_dir('seekpoints')) if seek_index else None
 
-    def _parse_file(self, fp):
-        parser = self.config.get_parser(fp.name)
-        return parser.parse_file(fp)
+    def open_file(self, file_name):
+        # plain file, or decompressed content of compressed file
+        compression = detect_compression(file_name)
+        if compression is None:
+            return open(file_name)
+        if self.seek_points:
+            return self.seek_points.open(file_name, compression)
+        return CompressedFile(file_name, compression)
 
-    def _handle_file(self, fp, parsed_results):
-        handlers = self.config.get_handlers(fp.name)
+    def _split_compressed(self, file_name, compression, pipeline, shard_size):
+        if not self.seek_points:
+            return [(0, None, False)]
 
-        for one_handler in handlers:
-            parsed_results = [one_handler.handle(one) for one in parsed_results]
+        def split(block_size, start=0):
+            return self.seek_points.split(file_name, compression, pipeline.parser, block_size, start)
 
-        return parsed_results
+        loaded = self.seek_points.load(file_name)
+        if self.zone_map and loaded is not None:
+            return self.zone_map.plan(file_name, pipeline, loaded[1], split)
+        return [(start, end, False) for start, end in split(shard_size)]
 
-    def _filter_file(self, fp, parsed_results):
-        filters = self.config.get_filters(fp.name)
-        for one_node_filters in filters:
-            parsed_results = [one for one in parsed_results if one_node_filters.filter(one)]
-        return parsed_results
+    def mine_file(self, file_name, start=0, end=None, stats=None):
+        # stats collects zone map statistics of all handled records
+        try:
+            fp = self.open_file(file_name)
+        except Exception as e:
+            logging.error("failed to process file {}".format(file_name))
+            return
 
-    def _is_qualified_item(self, log_item):
-        filters = self.config.get_global_filters()
-        for one_filter in filters:
-            if not one_filter.filter(log_item):
-                return False
-        return True
-
-    def mine_opened_file(self, fp):
-        parsed_results = self._parse_file(fp)
-        parsed_results = self._handle_file(fp, parsed_results)
-        parsed_results = self._filter_file(fp, parsed_results)
-        return parsed_results
-
-    def mine_opened_files(self, fps):
-        for fp in fps:
-            results = self.mine_opened_file(fp)
-            if results:
-                for one in results:
-                    yield one
+        with fp:
+            for one in self.config.get_pipeline(file_name).mine(fp, start, end, stats.add if stats else None):
+                yield one
 
-    def mine_files(self, full_paths):
-        opened_file_list = []
+    def split_files(self, full_paths, shard_size=None):
+        # (file name, start, end, collect) shards, files smaller than shard size are kept as one shard
+        # collect is True if zone map statistics should be collected for the shard
+        shards = []
         for one in full_paths:
             try:
-                fp = open(one)
-                opened_file_list.append(fp)
+                pipeline = self.config.get_pipeline(one)
+                compression = self._get_compression(one)
+                ranges = None
+                if self.token_index and not compression:
+                    ranges = self.token_index.plan(one, pipeline, self.config.get_index_fields(one), shard_size)
+                if ranges is not None:
+                    ranges = [(start, end, False) for start, end in ranges]
+                elif compression:
+                    ranges = self._split_compressed(one, compression, pipeline, shard_size)
+                elif self.zone_map:
+                    ranges = self.zone_map.plan(one, pipeline)
+                else:
+                    ranges = [(start, end, False) for start, end in pipeline.split(one, shard_size)]
             except Exception as e:
-                logging.error("failed to process file {}".format(one))
+                logging.error("failed to split file {}".format(one))
+                ranges = [(0, None, False)]
+            shards.extend([(one, start, end, collect) for start, end, collect in ranges])
+        return shards
 
-        for one in self.mine_opened_files(opened_file_list):
-            yield one
+    def mine_shards(self, shards):
+        collected = []
+        try:
+            for file_name, start, end, collect in shards:
+                stats = BlockStats(start, end) if collect else None
+                for one in self.mine_file(file_name, start, end, stats):
+                    yield one
+                if stats is not None:
+                    collected.append((file_name, stats.to_dict()))
+        finally:
+            self.update_zone_maps(collected)
+            pipeline_cache.report()
 
-    def mining_files(self, filename_list, include_history=False):
-        fps = []
-        for one in filename_list:
+    def update_zone_maps(self, collected):
+        # collected: (file name, block statistics)
+        if not self.zone_map or not collected:
+            return
+        blocks = {}
+        for file_name, block in collected:
+            blocks.setdefault(file_name, []).append(block)
+        for file_name, file_blocks in blocks.items():
             try:
-                fp = open(one)
-                fps.append(fp)
+                self.zone_map.update(file_name, file_blocks)
             except Exception as e:
-                traceback.print_exc()
+                logging.error("failed to update zone map of {}: {}".format(file_name, e))
 
-        if not include_history:
-            for fp in fps:
-                fp.seek(0, 2)
+    @staticmethod
+    def get_partition(file_name, count):
+        # stable partition of file among count workers, by inode which is kept when file is renamed
+        try:
+            key = get_file_key(os.stat(file_name))
+        except OSError:
+            key = file_name
+        return zlib.crc32(key.encode()) % count
 
-        while True:
-            for one in self.mine_opened_files(fps):
-                yield one
-            time.sleep(0.1)
+    def _accept_new_file(self, file_name, target_paths, partition=None):
+        # new file under target paths which passes meta filters, partition (index, count) splits files to workers
+        if not any(file_name == one or file_name.startswith(os.path.join(one, '')) for one in target_paths):
+            return False
+        if partition is not None and self.get_partition(file_name, partition[1]) != partition[0]:
+            return False
+        try:
+            if not path.isfile(file_name):
+                return False
+            return bool(self._filter_meta([file_name]))
+        except Exception as e:
+            logging.error("failed to check file {}: {}".format(file_name, e))
+            return False
+
+    def mining_files(self, filename_list, include_history=False, target_paths=None, partition=None, resume=False,
+                     heartbeat=False, stop=None):
+        """
+        wake on changed files only, files created under target paths later are followed from start.
+        renamed (rotated) file is read to end and a new file with the name is followed from start.
+        with resume, offsets are saved under config root and files are followed from saved offsets.
+        with heartbeat, None is yielded after changes of every wake are read.
+        with stop (event), following ends once it is set, checked at least every flush timeout.
+        """
+        # sizes of files existing at start by file key, such files passing meta filters later are followed from there
+        existing = {}
+        for one in target_paths if target_paths else []:
+            for root, dirs, files in os.walk(one):
+                for file in files:
+                    try:
+                        stat = os.stat(os.path.join(root, file))
+                        existing[get_file_key(stat)] = stat.st_size
+                    except OSError:
+                        pass
+
+        offsets = OffsetStore(self.config.get_cache_dir('offsets'), partition) if resume else None
+        watcher = create_watcher()
+        tails = {}
+        # file key -> offset of rotated files read to end, followed from there if found by new name
+        rotated = {}
+
+        def follow(file_name, position=None, emitted=None):
+            try:
+                if detect_compression(file_name):
+                    # rotated & compressed, won't grow
+                    return
+                tails[file_name] = LogTail(file_name, self.config.get_pipeline(file_name), position, emitted)
+                watcher.add_file(file_name)
+            except Exception as e:
+                logging.error("failed to follow file {}: {}".format(file_name, e))
+
+        for one in filename_list:
+            entry = None
+            try:
+                entry = offsets.lookup(one) if offsets else None
+            except OSError as e:
+                logging.error("failed to check offset of {}: {}".format(one, e))
+            if entry is not None:
+                follow(one, entry.get('position'), entry.get('emitted'))
+            elif offsets and offsets.is_followed(one):
+                # rotated while not running
+                follow(one, 0)
+            else:
+                follow(one, 0 if include_history else None)
+        for one in target_paths if target_paths else []:
+            try:
+                if path.isdir(one):
+                    watcher.add_directory(one)
+            except OSError as e:
+                logging.error("failed to watch {}: {}".format(one, e))
+
+        try:
+            changed = set(tails)
+            while stop is None or not stop.is_set():
+                now = time.monotonic()
+                if changed is None:
+                    # events lost, check all files
+                    changed = set(tails)
+                for file_name, tail in list(tails.items()):
+                    if file_name not in changed or not tail.is_rotated():
+                        continue
+                    # read rotated file to end, new file with the name is checked below
+                    try:
+                        for one in tail.drain():
+                            yield one
+                    except OSError as e:
+                        logging.error("failed to read file {}: {}".format(file_name, e))
+                    rotated[tail.key] = tail.get_offset()
+                    tail.close()
+                    del tails[file_name]
+
+                for file_name in changed:
+                    if file_name in tails or not target_paths:
+                        continue
+                    try:
+                        key = get_file_key(os.stat(file_name))
+                    except OSError:
+                        continue
+                    if key in rotated and self._accept_new_file(file_name, target_paths):
+                        # rotated file renamed in target paths
+                        follow(file_name, *rotated.pop(key))
+                    elif self._accept_new_file(file_name, target_paths, partition):
+                        follow(file_name, 0 if include_history else existing.get(key, 0))
+
+                for file_name, tail in list(tails.items()):
+                    if file_name in changed or tail.pending():
+                        try:
+                            for one in tail.poll(now):
+                                yield one
+                        except OSError as e:
+                            logging.error("failed to read file {}: {}".format(file_name, e))
+                        if offsets:
+                            offsets.update(tail)
+                if offsets:
+                    offsets.save()
+                if heartbeat:
+                    yield None
+
+                changed = watcher.wait(FLUSH_TIMEOUT if stop is not None or any(one.pending() for one in tails.values())
+                                       else None)
+        finally:
+            if offsets:
+                offsets.save(force=True)
+            for tail in tails.values():
+                tail.close()
+            watcher.close()
+
+    def _get_compression(self, file_name):
+        # verdict of catalog is reused while file is unchanged, magic bytes are read otherwise
+        return self.catalog.get_compression(file_name) if self.catalog else detect_compression(file_name)
+
+    def _is_ignored(self, file_name):
+        # binary file, or compressed file which can't be decompressed
+        compression = self._get_compression(file_name)
+        if compression is None:
+            return self.catalog.is_binary(file_name) if self.catalog else is_binary(file_name)
+        if not is_supported(compression):
+            logging.error("{} compressed file {} ignored, required package not installed".format(compression,
+                                                                                                file_name))
+            return True
+        return False
 
     def _filter_meta(self, file_name_list):
         if not file_name_list:
@@ -90,38 +270,57 @@ class DeepLogMiner:
 
         filtered_list = []
         for file_name in file_name_list:
-            # ignore binary file type
-            if is_binary(file_name):
-                continue
-
-            meta_filters = self.config.get_meta_filters(file_name)
-            for one_filter in meta_filters:
-                if not one_filter.filter_meta(file_name):
-                    break
+            if self.catalog:
+                try:
+                    # ignore binary file type
+                    if self._is_ignored(file_name):
+                        continue
+                    nodes = self.catalog.get_nodes(file_name, self.config.get_nodes)
+                except OSError as e:
+                    logging.error("failed to access file {}".format(file_name))
+                    continue
             else:
+                # ignore binary file type
+                if self._is_ignored(file_name):
+                    continue
+                nodes = None
+
+            if self.config.get_pipeline(file_name, nodes).filter_meta(file_name):
                 filtered_list.append(file_name)
 
         return filtered_list
 
-    def get_target_files(self, target_dirs=None, modules=None):
+    def get_target_paths(self, target_dirs=None, modules=None):
+        # normalized target dirs & files
         target_dirs = self.config.get_default_paths(modules) if not target_dirs else target_dirs
 
-        full_paths = []
         dirs = []
         for one_target_dir in target_dirs:
             dirs.extend(utils.normalize_path(one_target_dir, True))
+        return dirs
 
-        for folder in dirs:
+    def get_target_files(self, target_dirs=None, modules=None):
+        full_paths = []
+        for folder in self.get_target_paths(target_dirs, modules):
 
             if path.isfile(folder):
                 full_paths.append(folder)
                 continue
 
+            if self.catalog:
+                full_paths.extend(self.catalog.walk(folder))
+                continue
+
             for root, dirs, files in os.walk(folder):
                 for file in files:
                     full_paths.append(os.path.join(root, file))
 
         full_paths = self._filter_meta(full_paths)
+        if self.catalog:
+            try:
+                self.catalog.save()
+            except Exception as e:
+                logging.error("failed to save catalog: {}".format(e))
         return full_paths
 
     def mine(self, target_dirs=None, modules=None, subscribe=False, name_only=False, include_history=False):
@@ -132,8 +331,8 @@ class DeepLogMiner:
                 yield one
 
         elif subscribe:
-            for one in self.mining_files(full_paths, include_history):
+            for one in self.mining_files(full_paths, include_history, self.get_target_paths(target_dirs, modules)):
                 yield one
         else:
-            for one in self.mine_files(full_paths):
+            for one in self.mine_shards(self.split_files(full_paths)):
                 yield one
@@ -0,0 +1,82 @@
+import glob
+import os
+import time
+
+from deep_log import utils
+
+# seconds, offsets are saved at most once in checkpoint interval
+CHECKPOINT_INTERVAL = 1.0
+
+
+def get_file_key(stat):
+    # identify file by device & inode, kept when file is renamed
+    return '{}:{}'.format(stat.st_dev, stat.st_ino)
+
+
+class OffsetStore:
+    """
+    read positions of followed files under cache dir, keyed by device & inode.
+    every worker saves its own offsets file, files of all workers are merged on load and the latest entry wins.
+    position: start of first record not emitted, emitted: _line_number of last emitted record
+    """
+
+    def __init__(self, cache_dir, partition=None):
+        self.cache_dir = cache_dir
+        self.cache_file = os.path.join(cache_dir, 'offsets-{}.json'.format(partition[0] if partition else 0))
+        self.entries = {}
+        # entries of files followed by this worker
+        self.current = {}
+        self.saved_time = 0
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        for one in glob.glob(os.path.join(self.cache_dir, 'offsets-*.json')):
+            content = utils.load_cache(one, 'offsets')
+            if content is None:
+                continue
+            for key, entry in content.items():
+                if key not in self.entries or self.entries[key].get('time') < entry.get('time'):
+                    self.entries[key] = entry
+
+    def lookup(self, file_name):
+        # saved entry of file, None if not found or file was replaced
+        with open(file_name, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            entry = self.entries.get(get_file_key(stat))
+            if (entry is None or entry.get('position') > stat.st_size
+                    or utils.get_fingerprint(f, entry.get('fingerprint_size')) != entry.get('fingerprint')):
+                return None
+            return entry
+
+    def is_followed(self, file_name):
+        # file name was followed before, by a file which is rotated now
+        return any(one.get('name') == file_name for one in self.entries.values())
+
+    def update(self, tail):
+        position, emitted = tail.get_offset()
+        fingerprint_size = min(position, utils.FINGERPRINT_SIZE)
+        self.current[tail.key] = {
+            'name': tail.file_name,
+            'position': position,
+            'emitted': emitted,
+            'fingerprint': utils.get_fingerprint(tail.binary_fp, fingerprint_size),
+            'fingerprint_size': fingerprint_size,
+            'time': time.time(),
+        }
+        self.dirty = True
+
+    def save(self, force=False):
+        if not self.dirty or (not force and time.monotonic() - self.saved_time < CHECKPOINT_INTERVAL):
+            return
+        for key, entry in list(self.current.items()):
+            # forget files removed
+            try:
+                if get_file_key(os.stat(entry.get('name'))) != key:
+                    del self.current[key]
+            except OSError:
+                del self.current[key]
+
+        utils.save_cache(self.cache_file, self.current)
+        self.saved_time = time.monotonic()
+        self.dirty = False
@@ -1,13 +1,45 @@
 import logging
+import mmap
+import os
 import re
 
-from deep_log.utils import get_fileinfo
+from deep_log.record import FileInfo, Interner, LogRecord
+
+
+class RecordPrefilter:
+    """
+    necessary conditions on raw record text, checked before fields are extracted.
+    needles: substrings which must be in the record, patterns: regular expressions which must be found in the record
+    """
+
+    def __init__(self, needles=None, patterns=None):
+        self.needles = list(needles) if needles else []
+        self.patterns = [re.compile(one) for one in patterns] if patterns else []
+        # longest needle is most selective, used to seek in buffer
+        self.seek_needle = max(self.needles, key=len) if self.needles else None
+
+    def match(self, text):
+        for one in self.needles:
+            if one not in text:
+                return False
+        for one in self.patterns:
+            if not one.search(text):
+                return False
+        return True
 
 
 class LogParser:
-    def parse_file(self, file):
+    def parse_file(self, file, start=0, end=None, prefilter=None):
         pass
 
+    def split_file(self, file_name, shard_size, start=0):
+        # (start, end) byte ranges, end None means end of file
+        return [(start, None)]
+
+    def last_record_start(self, file, start, end):
+        # start of last record beginning in [start, end) of binary file, None if not known
+        return None
+
     def parse(self, lines):
         pass
 
@@ -19,43 +51,262 @@ class DefaultLogParser(LogParser):
     def __init__(self, *args, **kwargs):
         self.pattern = '' if 'pattern' not in kwargs else kwargs['pattern']
         self.compiled_pattern = re.compile(self.pattern)
+        # readline: text mode line by line, mmap: match bytes on memory mapped file
+        self.backend = kwargs.get('backend', 'readline')
+        self.compiled_bytes_pattern = re.compile(self.pattern.encode()) if self.backend == 'mmap' else None
         self.log_items = []
         self.strategy = ''
+        # repeated short field values share one string
+        self.interner = Interner()
 
-    def parse_file(self, file):
-        items = []
-        current_item = {}
+    def find_record_start(self, file, offset):
+        # first line start at or after offset which matches the pattern, None if not found
+        if offset > 0:
+            file.seek(offset - 1)
+            file.readline()
+        else:
+            file.seek(0)
 
         while True:
-            try:
-                line = file.readline()
-                if not line:
-                    # flush final results
-                    if current_item:
-                        return [*items, current_item]
-                    else:
-                        return [*items]
+            position = file.tell()
+            line = file.readline()
+            if not line:
+                return None
+            if self.compiled_pattern.match(line.decode(errors='replace')):
+                return position
+
+    def last_record_start(self, file, start, end):
+        file.seek(start)
+        last_start = None
+        position = start
+        while position < end:
+            line = file.readline()
+            if not line:
+                break
+            if self.compiled_pattern.match(line.decode(errors='replace')):
+                last_start = position
+            position = position + len(line)
+        return last_start
+
+    def split_file(self, file_name, shard_size, start=0):
+        file_size = os.path.getsize(file_name)
+        if not shard_size or file_size - start <= shard_size:
+            return [(start, None)]
 
-                result = self.parse_line(line)
-                if result is None:
+        boundaries = [start]
+        with open(file_name, 'rb') as file:
+            offset = start + shard_size
+            while offset < file_size:
+                boundary = self.find_record_start(file, offset)
+                if boundary is None:
+                    break
+                if boundary > boundaries[-1]:
+                    boundaries.append(boundary)
+                offset = boundary + shard_size
+
+        return [(one, boundaries[index + 1] if index + 1 < len(boundaries) else None)
+                for index, one in enumerate(boundaries)]
+
+    def parse_file(self, file, start=0, end=None, prefilter=None):
+        # yield records one by one, a record is flushed when next record starts
+        # only records starting in [start, end) are parsed, start and end should be record start positions
+        # records not matching prefilter are dropped before fields are extracted
+        # compressed file is always read line by line
+        if self.backend == 'mmap' and not getattr(file, 'compressed', False):
+            return self._parse_mmap(file, start, end, prefilter)
+        else:
+            return self._parse_readline(file, start, end, prefilter)
+
+    def _parse_mmap(self, file, start=0, end=None, prefilter=None):
+        file_size = os.fstat(file.fileno()).st_size
+        if file_size == 0:
+            return
+
+        encoding = getattr(file, 'encoding', None) or 'utf-8'
+        fileinfo = FileInfo(file.name)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            size = len(buffer)
+            end = size if end is None else end
+
+            if prefilter is not None and prefilter.seek_needle:
+                for one in self._seek_mmap(buffer, start, end, prefilter, encoding, fileinfo):
+                    yield one
+                return
+
+            match = self._line_matcher(buffer, start, end)
+            find = buffer.find
+
+            current_match = None
+            record_start = record_end = first_line_end = 0
+            position = start
+            while position < size:
+                line_end = find(b'\n', position)
+                line_end = size if line_end < 0 else line_end + 1
+
+                matched_result = match(buffer, position, line_end)
+                if matched_result is None:
                     # not matched, append to last item, if not found, ignore it
-                    if not current_item:
-                        logging.warning("line %s ignored" % line)
+                    if current_match is None:
+                        logging.warning("line %s ignored" % buffer[position:line_end].decode(encoding, 'replace'))
                     else:
-                        # affinity to last item
-                        current_item['_record'] = current_item['_record'] + line
-                        # current_item['content'] = current_item['content'] + line
-                        # current_item.update(get_fileinfo(file.name))
+                        record_end = line_end
                 else:
-                    # matched pattern
-                    # flush current item first
-                    if current_item:
-                        items.append(current_item)
-                    current_item = {'_line_number': file.tell(), **result}
-                    current_item.update({'tags': set()})
-                    current_item.update(get_fileinfo(file.name))
+                    if current_match is not None:
+                        item = self._build_item(buffer, current_match, record_start, record_end, first_line_end,
+                                                encoding, fileinfo, prefilter)
+                        if item is not None:
+                            yield item
+                        current_match = None
+
+                    if position >= end:
+                        # record belongs to next shard
+                        break
+
+                    current_match = matched_result
+                    record_start = position
+                    record_end = first_line_end = line_end
+
+                position = line_end
+
+            # flush final results
+            if current_match is not None:
+                item = self._build_item(buffer, current_match, record_start, record_end, first_line_end, encoding,
+                                        fileinfo, prefilter)
+                if item is not None:
+                    yield item
+
+    def _seek_mmap(self, buffer, start, end, prefilter, encoding, fileinfo):
+        # jump from needle to needle, only records containing the needle are parsed
+        size = len(buffer)
+        match = self._line_matcher(buffer, start, end)
+        find = buffer.find
+        needle = prefilter.seek_needle.encode(encoding)
+
+        position = start
+        while position < size:
+            hit = find(needle, position)
+            if hit < 0:
+                break
+
+            # walk back to the start line of the record containing the needle
+            hit_line_start = max(position, buffer.rfind(b'\n', position, hit) + 1)
+            record_start = hit_line_start
+            while True:
+                first_line_end = find(b'\n', record_start)
+                first_line_end = size if first_line_end < 0 else first_line_end + 1
+                matched_result = match(buffer, record_start, first_line_end)
+                if matched_result is not None or record_start <= position:
+                    break
+                record_start = max(position, buffer.rfind(b'\n', position, record_start - 1) + 1)
+
+            if matched_result is None:
+                # needle in lines not belonging to any record
+                position = find(b'\n', hit_line_start)
+                position = size if position < 0 else position + 1
+                continue
+
+            if record_start >= end:
+                # record belongs to next shard
+                break
+
+            # walk forward to the start of next record
+            record_end = first_line_end
+            while record_end < size:
+                line_end = find(b'\n', record_end)
+                line_end = size if line_end < 0 else line_end + 1
+                if match(buffer, record_end, line_end) is not None:
+                    break
+                record_end = line_end
+
+            item = self._build_item(buffer, matched_result, record_start, record_end, first_line_end, encoding,
+                                    fileinfo, prefilter)
+            if item is not None:
+                yield item
+            position = record_end
+
+    def _line_matcher(self, buffer, start, end):
+        # match of pattern on line [position, line_end) of buffer.
+        # CRLF line ends are matched as LF, same as lines read in text mode (universal newlines), if shard has any
+        match = self.compiled_bytes_pattern.match
+        if buffer.find(b'\r\n', start, end) < 0:
+            return match
+
+        def match_line(buffer, position, line_end):
+            if buffer[line_end - 2:line_end] == b'\r\n':
+                return match(buffer[position:line_end - 2] + b'\n')
+            return match(buffer, position, line_end)
+
+        return match_line
+
+    def _build_item(self, buffer, matched_result, record_start, record_end, first_line_end, encoding, fileinfo,
+                    prefilter=None):
+        # decode matched fields only
+        record = buffer[record_start:record_end].decode(encoding, 'replace')
+        if '\r\n' in record:
+            record = record.replace('\r\n', '\n')
+        if prefilter is not None and not prefilter.match(record):
+            return None
+        intern = self.interner.intern
+        item = {key: value if value is None else intern(value.decode(encoding, 'replace'))
+                for key, value in matched_result.groupdict().items()}
+        return LogRecord({'_line_number': first_line_end, **item, '_record': record, 'tags': None}, fileinfo)
+
+    def _build_text_item(self, fileinfo, matched_result, lines, position, prefilter=None):
+        record = ''.join(lines)
+        if prefilter is not None and not prefilter.match(record):
+            return None
+        intern = self.interner.intern
+        item = {key: intern(value) for key, value in matched_result.groupdict().items()}
+        return LogRecord({'_line_number': position, **item, '_record': record, 'tags': None}, fileinfo)
+
+    def _parse_readline(self, file, start=0, end=None, prefilter=None):
+        current_match = None
+        current_lines = []
+        current_position = 0
+        fileinfo = FileInfo(file.name)
+        if start:
+            file.seek(start)
+
+        while True:
+            try:
+                line = file.readline()
             except Exception as error:
-                print(file.name)
+                logging.error("failed to read file {}: {}".format(file.name, error))
+                break
+
+            if not line:
+                break
+
+            matched_result = self.compiled_pattern.match(line)
+            if matched_result is None:
+                # not matched, append to last item, if not found, ignore it
+                if current_match is None:
+                    logging.warning("line %s ignored" % line)
+                else:
+                    # affinity to last item
+                    current_lines.append(line)
+            else:
+                # matched pattern
+                # flush current item first
+                if current_match is not None:
+                    item = self._build_text_item(fileinfo, current_match, current_lines, current_position, prefilter)
+                    if item is not None:
+                        yield item
+                    current_match = None
+
+                position = file.tell()
+                if end is not None and position > end:
+                    # record belongs to next shard
+                    break
+                current_match = matched_result
+                current_lines = [line]
+                current_position = position
+
+        # flush final results
+        if current_match is not None:
+            item = self._build_text_item(fileinfo, current_match, current_lines, current_position, prefilter)
+            if item is not None:
+                yield item
 
     def parse_line(self, one_line):
         # {'raw': '', 'content': 'content'}
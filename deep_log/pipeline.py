@@ -0,0 +1,94 @@
+import logging
+
+from deep_log import dsl
+
+
+class LogPipeline:
+    def __init__(self, parser, handlers=None, filters=None, meta_filters=None, signature=None):
+        self.parser = parser
+        self.handlers = handlers if handlers else []
+        self.filters = filters if filters else []
+        self.meta_filters = meta_filters if meta_filters else []
+        # all filters fused into one compiled predicate
+        self.predicate = dsl.fuse_filters(self.filters)
+        self.meta_predicate = dsl.fuse_meta_filters(self.meta_filters)
+        # conditions on raw record text checked by parser
+        self.prefilter = dsl.plan_prefilter(self.filters, self.handlers)
+        # conditions checked on block statistics of zone map
+        self.constraints = dsl.plan_constraints(self.filters)
+        # conditions answered by token index
+        self.index_terms = dsl.plan_index_terms(self.filters)
+        # identify parser & handlers, records of same signature are the same before filtering
+        self.signature = signature
+
+    def parse(self, fp, start=0, end=None, prefilter=True):
+        return self.parser.parse_file(fp, start, end, self.prefilter if prefilter else None)
+
+    def handle(self, parsed_results):
+        # chain handlers lazily, records are pulled one by one through the whole pipeline
+        for one_handler in self.handlers:
+            parsed_results = map(one_handler.handle, parsed_results)
+        return parsed_results
+
+    def filter(self, parsed_results):
+        return filter(self.predicate, parsed_results)
+
+    def filter_meta(self, file_name):
+        return self.meta_predicate(file_name)
+
+    def split(self, file_name, shard_size, start=0):
+        return self.parser.split_file(file_name, shard_size, start)
+
+    def mine(self, fp, start=0, end=None, observer=None):
+        # observer sees every handled record before filtering, all records are parsed then
+        if observer is None:
+            return self.filter(self.handle(self.parse(fp, start, end)))
+        else:
+            return self.filter(map(observer, self.handle(self.parse(fp, start, end, prefilter=False))))
+
+
+class PipelineCache:
+    """
+    compiled pipelines keyed by config fingerprint and resolved logger nodes.
+    config is pickled to every pool task, so the cache lives per process instead of per config object.
+    """
+
+    def __init__(self):
+        self.pipelines = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, builder):
+        pipeline = self.pipelines.get(key)
+        if pipeline is None:
+            self.misses = self.misses + 1
+            pipeline = builder()
+            self.pipelines[key] = pipeline
+        else:
+            self.hits = self.hits + 1
+        return pipeline
+
+    def clear(self):
+        self.pipelines.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def drain(self):
+        # hits & misses since last drain, pool workers ship them to the consumer which merges them
+        counts = (self.hits, self.misses)
+        self.hits = 0
+        self.misses = 0
+        return counts
+
+    def merge(self, counts):
+        self.hits = self.hits + counts[0]
+        self.misses = self.misses + counts[1]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.pipelines)}
+
+    def report(self):
+        logging.info("pipeline cache: {hits} hits, {misses} misses, {size} pipelines".format(**self.stats()))
+
+
+pipeline_cache = PipelineCache()
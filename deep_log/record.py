@@ -0,0 +1,109 @@
+from collections.abc import MutableMapping
+
+from deep_log.utils import get_fileinfo
+
+# short values are interned per parser, until so many distinct values are seen
+MAX_INTERN_LENGTH = 32
+MAX_INTERNED = 4096
+
+
+class FileInfo:
+    """
+    file info fields shared by records of one file, resolved on first access
+    """
+    __slots__ = ('name', '_values')
+
+    def __init__(self, name, values=None):
+        self.name = name
+        self._values = values
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._values = get_fileinfo(self.name)
+        return self._values
+
+    def __reduce__(self):
+        return FileInfo, (self.name, self._values)
+
+
+class LogRecord(MutableMapping):
+    """
+    parsed fields of one record and a reference to file info of its file, looks like a dict of both.
+    fields set on the record hide file info fields of same name. tags set is created on first access, None until then.
+    """
+    __slots__ = ('fields', 'file')
+
+    def __init__(self, fields, file):
+        self.fields = fields
+        self.file = file
+
+    def __getitem__(self, key):
+        try:
+            value = self.fields[key]
+        except KeyError:
+            return self.file.values[key]
+        if value is None and key == 'tags':
+            value = self.fields['tags'] = set()
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self.fields or key in self.file.values
+
+    def __setitem__(self, key, value):
+        self.fields[key] = value
+
+    def __delitem__(self, key):
+        found = self.fields.pop(key, self) is not self
+        if key in self.file.values:
+            # file info of this record only
+            self.file = FileInfo(self.file.name, {name: value for name, value in self.file.values.items() if name != key})
+        elif not found:
+            raise KeyError(key)
+
+    def __iter__(self):
+        fields = self.fields
+        yield from fields
+        for key in self.file.values:
+            if key not in fields:
+                yield key
+
+    def __len__(self):
+        return len(self.fields) + sum(1 for key in self.file.values if key not in self.fields)
+
+    def copy(self):
+        return LogRecord(dict(self.fields), self.file)
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        # file info is pickled once per pickled batch
+        return LogRecord, (self.fields, self.file)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class Interner:
+    """
+    share one string object for repeated short values, such as level or host
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def intern(self, value):
+        if value is None or len(value) > MAX_INTERN_LENGTH:
+            return value
+        interned = self.values.get(value)
+        if interned is not None:
+            return interned
+        if len(self.values) < MAX_INTERNED:
+            self.values[value] = value
+        return value
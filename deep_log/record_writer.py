@@ -1,5 +1,4 @@
 from string import Formatter
-import pandas as pd
 import types
 
 class OutputFormat:
@@ -30,7 +29,23 @@ class TextOutputFormat(OutputFormat):
         if self.full_mode:
             return str(content)
         else:
-            return self.log_format.format(**{**self.default_values, **content})
+            # only fields in format are looked up
+            return self.log_format.format_map(FormatValues(content, self.default_values))
+
+
+class FormatValues:
+    # fields of record, empty string for fields missing in record
+    __slots__ = ('record', 'default_values')
+
+    def __init__(self, record, default_values):
+        self.record = record
+        self.default_values = default_values
+
+    def __getitem__(self, key):
+        try:
+            return self.record[key]
+        except KeyError:
+            return self.default_values[key]
 
 
 class DataFrameOutputFormat(OutputFormat):
@@ -69,7 +84,10 @@ class LogRecordWriterFactory:
     @staticmethod
     def create(format, pd_full_mode):
         record_writer = RecordWriter()
-        record_writer.register('dict', TextOutputFormat(format))
+        text_output_format = TextOutputFormat(format)
+        record_writer.register('dict', text_output_format)
+        record_writer.register('LogRecord', text_output_format)
+        record_writer.register('SharedRecord', text_output_format)
         record_writer.register('DataFrame', DataFrameOutputFormat(pd_full_mode))
         return record_writer
 
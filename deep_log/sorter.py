@@ -0,0 +1,110 @@
+import heapq
+import itertools
+import os
+import pickle
+import sys
+import tempfile
+
+# records per pickle frame of a run file
+FRAME_SIZE = 1000
+BUFFER_SIZE = 1024 * 1024
+# runs open at once in a merge, more runs are merged in passes
+MAX_FAN_IN = 64
+
+
+def estimate_size(record):
+    # rough memory of a record dict, its keys are shared by records of same logger
+    return sys.getsizeof(record) + sum(sys.getsizeof(one) for one in record.values())
+
+
+def write_run(records, temp_dir):
+    # sorted records to a new run file, pickled in frames
+    fd, run_file = tempfile.mkstemp(prefix='run-', dir=temp_dir)
+    records = iter(records)
+    with os.fdopen(fd, 'wb', BUFFER_SIZE) as f:
+        while True:
+            frame = list(itertools.islice(records, FRAME_SIZE))
+            if not frame:
+                break
+            pickle.dump(frame, f, pickle.HIGHEST_PROTOCOL)
+    return run_file
+
+
+def read_run(run_file):
+    with open(run_file, 'rb', BUFFER_SIZE) as f:
+        while True:
+            try:
+                frame = pickle.load(f)
+            except EOFError:
+                break
+            for one in frame:
+                yield one
+
+
+def reduce_runs(runs, key, reverse=False, fan_in=MAX_FAN_IN):
+    """
+    merge consecutive runs into longer runs until at most fan in runs are left, so a merge never opens more files
+    than fan in. merged runs are removed, order of runs is kept
+    """
+    runs = list(runs)
+    while len(runs) > fan_in:
+        merged = []
+        for index in range(0, len(runs), fan_in):
+            group = runs[index:index + fan_in]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            merged.append(write_run(heapq.merge(*[read_run(one) for one in group], key=key, reverse=reverse),
+                                    os.path.dirname(group[0])))
+            for one in group:
+                os.remove(one)
+        runs = merged
+    return runs
+
+
+def merge_runs(runs, key, reverse=False):
+    # k-way merge of sorted runs, records with same key keep order of runs
+    return heapq.merge(*[read_run(one) for one in reduce_runs(runs, key, reverse)], key=key, reverse=reverse)
+
+
+class ExternalSorter:
+    """
+    sort records in memory until they take more than max memory (bytes), then spill them to a sorted run under temp
+    dir. sorted records are merged from runs and records in memory, same order as a stable sort of all records.
+    """
+
+    def __init__(self, key, reverse=False, max_memory=None, temp_dir=None):
+        self.key = key
+        self.reverse = reverse
+        self.max_memory = max_memory
+        self.temp_dir = temp_dir
+        self.records = []
+        self.memory = 0
+        self.runs = []
+
+    def add(self, record):
+        self.records.append(record)
+        if self.max_memory:
+            self.memory = self.memory + estimate_size(record)
+            if self.memory >= self.max_memory:
+                self.spill()
+
+    def extend(self, records):
+        for one in records:
+            self.add(one)
+
+    def spill(self):
+        # records in memory to a sorted run
+        if self.records:
+            self.records.sort(key=self.key, reverse=self.reverse)
+            self.runs.append(write_run(self.records, self.temp_dir))
+        self.records = []
+        self.memory = 0
+
+    def sorted(self):
+        self.records.sort(key=self.key, reverse=self.reverse)
+        if not self.runs:
+            return self.records
+        # records in memory are the latest ones
+        self.runs = reduce_runs(self.runs, self.key, self.reverse)
+        return heapq.merge(*[read_run(one) for one in self.runs], self.records, key=self.key, reverse=self.reverse)
@@ -0,0 +1,69 @@
+import logging
+import time
+
+# seconds a record may wait in a batch before the batch is shipped
+STREAM_LATENCY = 1.0
+# seconds between reports of streaming metrics
+STREAM_REPORT_INTERVAL = 60
+
+
+class StreamBatcher:
+    """
+    ship records to queue in batches, after batch size records or latency seconds since first record of batch.
+    queue is bounded, put blocks follower until consumer catches up
+    """
+
+    def __init__(self, queue, batch_size, latency=STREAM_LATENCY):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.latency = latency
+        self.batch = []
+        self.started = None
+
+    def add(self, record):
+        if not self.batch:
+            self.started = time.monotonic()
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size or time.monotonic() - self.started >= self.latency:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+
+
+class StreamMetrics:
+    """
+    throughput & queue depth of streamed batches, logged every interval seconds and when stream ends
+    """
+
+    def __init__(self, queue, interval=STREAM_REPORT_INTERVAL):
+        self.queue = queue
+        self.interval = interval
+        self.started = self.reported = time.monotonic()
+        self.records = 0
+        self.batches = 0
+        self.depth = 0
+        self.max_depth = 0
+
+    def _depth(self):
+        try:
+            return self.queue.qsize()
+        except NotImplementedError:
+            # not supported on macOS
+            return 0
+
+    def add(self, batch):
+        self.records = self.records + len(batch)
+        self.batches = self.batches + 1
+        self.depth = self._depth()
+        self.max_depth = max(self.max_depth, self.depth)
+        if time.monotonic() - self.reported >= self.interval:
+            self.report()
+
+    def report(self):
+        now = time.monotonic()
+        self.reported = now
+        logging.info("streamed {} records in {} batches, {:.1f} records/s, queue depth {} (max {})".format(
+            self.records, self.batches, self.records / max(now - self.started, 1e-6), self.depth, self.max_depth))
@@ -0,0 +1,290 @@
+import os
+import pickle
+import secrets
+import struct
+from array import array
+from itertools import repeat
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from deep_log.record import LogRecord
+
+# segments are named by transport session of consumer, e.g. deep-log-1234-5a0c7e2d-9f86d081884c
+SEGMENT_PREFIX = 'deep-log-'
+SEGMENT_DIR = '/dev/shm'
+# segment starts with offset & length of its header, columns follow
+HEADER = struct.Struct('<QQ')
+# separator of strings in a string column, columns with it in values are pickled
+SEPARATOR = '\x00'
+# string columns with less distinct values than this ratio of rows are stored as distinct values & codes
+CATEGORY_RATIO = 0.5
+
+
+def _encode_column(values):
+    # (kind, data) of column: separated utf-8 strings, categories, int64, float64, all None, or pickled values
+    types = set(map(type, values))
+    if types == {str}:
+        distinct = dict.fromkeys(values)
+        if len(distinct) <= len(values) * CATEGORY_RATIO:
+            # repeated values (e.g. level) are kept once with codes of values, decoded to shared strings
+            codes = dict(zip(distinct, range(len(distinct))))
+            kind, text = 'category', SEPARATOR.join(distinct)
+            count = len(distinct)
+        else:
+            kind, text = 'str', SEPARATOR.join(values)
+            count = len(values)
+        if text.count(SEPARATOR) == count - 1:
+            data = text.encode('utf-8', 'surrogatepass')
+            if kind == 'category':
+                data = struct.pack('<Q', len(data)) + data + array('I', map(codes.__getitem__, values)).tobytes()
+            return kind, data
+    if types == {int}:
+        try:
+            return 'int', array('q', values).tobytes()
+        except OverflowError:
+            pass
+    if types == {float}:
+        return 'float', array('d', values).tobytes()
+    if types == {type(None)}:
+        return 'none', b''
+    return 'object', pickle.dumps(values, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_column(buffer, kind, offset, size, count):
+    # values of column, decoded at once
+    if kind == 'str':
+        return str(buffer[offset:offset + size], 'utf-8', 'surrogatepass').split(SEPARATOR)
+    if kind == 'category':
+        text_size, = struct.unpack_from('<Q', buffer, offset)
+        start = offset + 8
+        distinct = str(buffer[start:start + text_size], 'utf-8', 'surrogatepass').split(SEPARATOR)
+        codes = array('I')
+        codes.frombytes(buffer[start + text_size:offset + size])
+        return list(map(distinct.__getitem__, codes))
+    if kind in ('int', 'float'):
+        values = array('q' if kind == 'int' else 'd')
+        values.frombytes(buffer[offset:offset + size])
+        return values.tolist()
+    if kind == 'none':
+        return [None] * count
+    return pickle.loads(buffer[offset:offset + size])
+
+
+class SegmentColumns:
+    """
+    columns of a batch in a segment, a column is decoded on first access. segment is removed once attached, it's
+    closed when all columns are decoded or no record of the batch is referenced any more
+    """
+
+    def __init__(self, segment, columns, count):
+        self.segment = segment
+        # name: (kind, offset, size), in field order of records
+        self.columns = columns
+        self.count = count
+        self.decoded = {}
+        self.rows = None
+
+    def row(self, index):
+        # fields of one record as a dict, dicts of all records are built at once when first one is needed
+        if self.rows is None:
+            keys = list(self.columns)
+            self.rows = list(map(dict, map(zip, repeat(keys), zip(*[self.get(key) for key in keys]))))
+        return self.rows[index]
+
+    def get(self, name):
+        # values of column, None if not a column of batch
+        values = self.decoded.get(name)
+        if values is None:
+            column = self.columns.get(name)
+            if column is None:
+                return None
+            values = self.decoded[name] = _decode_column(self.segment.buf, *column, self.count)
+            if len(self.decoded) == len(self.columns):
+                self.segment.close()
+        return values
+
+
+class SharedRecord(LogRecord):
+    """
+    record of a shared batch, fields are read from columns of the batch, so that only fields used by consumer (e.g.
+    _record printed) are decoded. fields are copied into a dict of the record once it's changed or iterated
+    """
+    __slots__ = ('columns', 'index')
+
+    def __init__(self, columns, index, file):
+        super().__init__(None, file)
+        self.columns = columns
+        self.index = index
+
+    def materialize(self):
+        if self.fields is None:
+            self.fields = self.columns.row(self.index)
+        return self.fields
+
+    def __getitem__(self, key):
+        fields = self.fields
+        if fields is None:
+            if key != 'tags':
+                values = self.columns.get(key)
+                if values is None:
+                    return self.file.values[key]
+                return values[self.index]
+            # tags set created on access is kept by record
+            fields = self.materialize()
+        # same as LogRecord, inlined
+        try:
+            value = fields[key]
+        except KeyError:
+            return self.file.values[key]
+        if value is None and key == 'tags':
+            value = fields['tags'] = set()
+        return value
+
+    def __contains__(self, key):
+        if self.fields is None:
+            return key in self.columns.columns or key in self.file.values
+        return LogRecord.__contains__(self, key)
+
+    def __setitem__(self, key, value):
+        self.materialize()
+        LogRecord.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.materialize()
+        LogRecord.__delitem__(self, key)
+
+    def __iter__(self):
+        self.materialize()
+        return LogRecord.__iter__(self)
+
+    def __len__(self):
+        self.materialize()
+        return LogRecord.__len__(self)
+
+    def copy(self):
+        return LogRecord(dict(self.materialize()), self.file)
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        # pickled as a plain record, without the segment
+        return LogRecord, (self.materialize(), self.file)
+
+
+class SharedBatch:
+    """
+    descriptor of a record batch encoded in a shared memory segment, only the descriptor goes through the queue.
+    segment is owned by the consumer once shipped, it is unlinked when loaded or discarded
+    """
+    __slots__ = ('name', 'size')
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def load(self):
+        # records reading their fields from the segment, or decoded records of a pickled batch.
+        # records are created when iterated
+        segment = SharedMemory(self.name)
+        segment.unlink()
+        header_offset, header_size = HEADER.unpack_from(segment.buf)
+        header = pickle.loads(segment.buf[header_offset:header_offset + header_size])
+        if 'records' in header:
+            segment.close()
+            return header['records']
+        count = header['count']
+        columns = SegmentColumns(segment, header['columns'], count)
+        files = header['files']
+        if header['file_indexes'] is None:
+            return map(SharedRecord, repeat(columns), range(count), repeat(files[0]))
+        return map(SharedRecord, repeat(columns), range(count), map(files.__getitem__, header['file_indexes']))
+
+    def discard(self):
+        try:
+            segment = SharedMemory(self.name)
+        except FileNotFoundError:
+            return
+        segment.close()
+        segment.unlink()
+
+
+def _encode_batch(batch):
+    # (header, column parts), records of same fields in same order are encoded in columns, others are pickled
+    first = batch[0] if batch else None
+    if not isinstance(first, LogRecord) or not all(type(one) is LogRecord for one in batch):
+        return {'records': batch}, []
+    keys = list(first.fields)
+    if not all(list(one.fields) == keys for one in batch):
+        return {'records': batch}, []
+
+    files = []
+    file_ids = {}
+    file_indexes = array('I')
+    for one in batch:
+        file_index = file_ids.get(id(one.file))
+        if file_index is None:
+            file_index = file_ids[id(one.file)] = len(files)
+            files.append(one.file)
+        file_indexes.append(file_index)
+
+    header = {'count': len(batch), 'files': files, 'file_indexes': file_indexes.tolist() if len(files) > 1 else None,
+              'columns': {}}
+    parts = []
+    offset = HEADER.size
+    for key in keys:
+        kind, data = _encode_column([one.fields[key] for one in batch])
+        header['columns'][key] = (kind, offset, len(data))
+        parts.append(data)
+        offset = offset + len(data)
+    return header, parts
+
+
+def start_transport():
+    """
+    prepare consumer before its workers are forked, returns the transport session which names segments of workers.
+    resource tracker is started by consumer, so segments created by workers are registered to the tracker shared with
+    consumer, segments not unlinked are removed by tracker once consumer and workers are gone (killed, or pool
+    terminated).
+    """
+    resource_tracker.ensure_running()
+    return '{}-{}'.format(os.getpid(), secrets.token_hex(4))
+
+
+def remove_segments(session):
+    # segments of session left by workers, once workers of consumer are gone
+    if not os.path.isdir(SEGMENT_DIR):
+        return
+    prefix = '{}{}-'.format(SEGMENT_PREFIX, session)
+    for name in os.listdir(SEGMENT_DIR):
+        if name.startswith(prefix):
+            SharedBatch(name, 0).discard()
+
+
+def share_batch(batch, session):
+    # encode batch into a new segment of session, returns its descriptor
+    header, parts = _encode_batch(batch)
+    header = pickle.dumps(header, pickle.HIGHEST_PROTOCOL)
+    header_offset = HEADER.size + sum(len(one) for one in parts)
+    size = header_offset + len(header)
+    name = '{}{}-{}'.format(SEGMENT_PREFIX, session, secrets.token_hex(6))
+    segment = SharedMemory(name, create=True, size=size)
+    buffer = segment.buf
+    HEADER.pack_into(buffer, 0, header_offset, len(header))
+    offset = HEADER.size
+    for one in parts + [header]:
+        buffer[offset:offset + len(one)] = one
+        offset = offset + len(one)
+    segment.close()
+    return SharedBatch(segment.name, size)
+
+
+def load_batch(batch):
+    return batch.load() if isinstance(batch, SharedBatch) else batch
+
+
+def discard_batch(batch):
+    if isinstance(batch, SharedBatch):
+        batch.discard()
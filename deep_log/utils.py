@@ -1,11 +1,23 @@
+import base64
+import copy
 import functools
 import glob
+import gzip
+import hashlib
+import json
+import logging
+import math
 import os
 import re
 import datetime
+import stat
+import tempfile
 from os import path
 from string import Formatter
 
+# leading bytes of a file in its fingerprint, detects file replaced under same name or inode
+FINGERPRINT_SIZE = 4096
+
 built_function = {
     'datetime': datetime,  # datetime function
     'path': path,  # datetime function
@@ -13,6 +25,110 @@ built_function = {
 }
 
 
+def detach(value):
+    # copy of mutable values, so that dsl can't change the record, types are kept so that results are the same
+    if isinstance(value, set):
+        # items of set are hashable
+        return set(value)
+    elif isinstance(value, (list, dict)):
+        return copy.deepcopy(value)
+    else:
+        return value
+
+
+class RecordNamespace(dict):
+    """
+    globals to evaluate dsl on one record without copying it.
+    built functions are resolved first, then fields of the bound record, then python builtins.
+    """
+
+    def __init__(self, functions=None):
+        super().__init__(built_function if functions is None else functions)
+        self.record = {}
+        # fields copied for the bound record, one copy per evaluation as the deep copy of record used to be
+        self.copied = []
+
+    def bind(self, record):
+        for key in self.copied:
+            del self[key]
+        self.copied.clear()
+        self.record = record
+        return self
+
+    def __missing__(self, key):
+        # KeyError falls back to python builtins
+        value = self.record[key]
+        copied = detach(value)
+        if copied is not value:
+            self[key] = copied
+            self.copied.append(key)
+        return copied
+
+
+# bits set in each byte value
+POPCOUNT = bytes(bin(one).count('1') for one in range(256))
+
+
+class BloomFilter:
+    """
+    bloom filter on strings or bytes fingerprints, hashes are stable across processes so that it can be persisted.
+    sized for capacity keys at error rate if size is not given, bit positions by double hashing of two halves of
+    the key hash, fingerprints (16 bytes or more, e.g. of distinct values) are used as hash directly.
+    """
+
+    def __init__(self, size=None, hashes=None, bits=None, capacity=None, error_rate=0.01):
+        if size is None:
+            # optimal bits & hashes for capacity & error rate
+            capacity = capacity if capacity else 1024
+            size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+            hashes = hashes if hashes else max(1, round(size / capacity * math.log(2)))
+        self.size = size
+        self.hashes = hashes if hashes else 4
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+        # keys added which were not found before
+        self.count = 0
+
+    def _positions(self, value):
+        if isinstance(value, bytes) and len(value) >= 16:
+            first = int.from_bytes(value[:8], 'little')
+            second = int.from_bytes(value[8:16], 'little') | 1
+        else:
+            digest = hashlib.blake2b(value.encode(errors='replace'), digest_size=8).digest()
+            first = int.from_bytes(digest[:4], 'little')
+            second = int.from_bytes(digest[4:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, value):
+        # True if value may have been added before
+        found = True
+        for position in self._positions(value):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & bit:
+                found = False
+                self.bits[byte] |= bit
+        if not found:
+            self.count = self.count + 1
+        return found
+
+    def __contains__(self, value):
+        for position in self._positions(value):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def error_rate(self):
+        # estimated false positive rate by bits set
+        filled = sum(self.bits.translate(POPCOUNT)) / self.size
+        return filled ** self.hashes
+
+    def to_dict(self):
+        return {'size': self.size, 'hashes': self.hashes, 'bits': base64.b64encode(bytes(self.bits)).decode()}
+
+    @staticmethod
+    def from_dict(content):
+        return BloomFilter(content['size'], content['hashes'], bytearray(base64.b64decode(content['bits'])))
+
+
 def evaluate_variable(variable, variables, depth=5):
     result = variable
     for index in range(depth):
@@ -31,8 +147,50 @@ def evaluate_variables(variables, depth=5):
 
 
 def make_directory(dir):
-    if not os.path.exists(dir):
-        os.makedirs(dir)
+    # workers may create same directory at once
+    os.makedirs(dir, exist_ok=True)
+
+
+def get_fingerprint(file, size):
+    # md5 of leading bytes (at most FINGERPRINT_SIZE of size) of file, by name or binary file object
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            return get_fingerprint(f, size)
+    file.seek(0)
+    return hashlib.md5(file.read(min(size, FINGERPRINT_SIZE))).hexdigest()
+
+
+def get_cache_file(cache_dir, file_name, suffix='.json'):
+    # cache file of a log file under cache dir, named by md5 of file name
+    return os.path.join(cache_dir, hashlib.md5(file_name.encode()).hexdigest() + suffix)
+
+
+def load_cache(cache_file, description):
+    # content of json cache file (gzip compressed if named .gz), None if missing or broken
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with (gzip.open if cache_file.endswith('.gz') else open)(cache_file, 'rt') as f:
+            return json.load(f)
+    except Exception as e:
+        logging.warning("{} {} ignored: {}".format(description, cache_file, e))
+        return None
+
+
+def save_cache(cache_file, content):
+    # json cache file (gzip compressed if named .gz) is replaced at once, readers never see a partial file.
+    # temp file is unique, processes saving same cache file at once don't write into each other's temp file
+    directory = os.path.dirname(cache_file)
+    make_directory(directory)
+    data = json.dumps(content).encode()
+    fd, temp_file = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(gzip.compress(data) if cache_file.endswith('.gz') else data)
+        os.replace(temp_file, cache_file)
+    except BaseException:
+        os.unlink(temp_file)
+        raise
 
 
 def normalize_path(dir, with_wildcard=False):
@@ -48,24 +206,26 @@ def normalize_path(dir, with_wildcard=False):
 
 @functools.lru_cache(maxsize=256, typed=True)
 def get_fileinfo(filename):
-    if os.path.exists(filename):
-        return {
-            '_name': filename,
-            '_writable': os.access(filename, os.W_OK),
-            '_readable': os.access(filename, os.R_OK),
-            '_executable': os.access(filename, os.X_OK),
-            '_ctime': datetime.datetime.fromtimestamp(path.getctime(filename)),
-            '_mtime': datetime.datetime.fromtimestamp(path.getmtime(filename)),
-            '_actime': datetime.datetime.fromtimestamp(path.getatime(filename)),
-            '_size': path.getsize(filename),
-            '_basename': path.basename(filename),
-            '_isdir': path.isdir(filename),
-            '_isfile': path.isfile(filename),
-            '_exists': True,
-        }
-
-    else:
+    # one stat call for times, size & type
+    try:
+        file_stat = os.stat(filename)
+    except OSError:
         return {
             '_name': filename,
             '_exists': False
         }
+
+    return {
+        '_name': filename,
+        '_writable': os.access(filename, os.W_OK),
+        '_readable': os.access(filename, os.R_OK),
+        '_executable': os.access(filename, os.X_OK),
+        '_ctime': datetime.datetime.fromtimestamp(file_stat.st_ctime),
+        '_mtime': datetime.datetime.fromtimestamp(file_stat.st_mtime),
+        '_actime': datetime.datetime.fromtimestamp(file_stat.st_atime),
+        '_size': file_stat.st_size,
+        '_basename': path.basename(filename),
+        '_isdir': stat.S_ISDIR(file_stat.st_mode),
+        '_isfile': stat.S_ISREG(file_stat.st_mode),
+        '_exists': True,
+    }
@@ -0,0 +1,297 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+from deep_log.offsets import get_file_key
+
+# seconds, a pending record is emitted if no more data arrives in flush timeout
+FLUSH_TIMEOUT = 1.0
+# seconds, interval of polling watcher
+POLL_INTERVAL = 0.1
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """
+    watch directories by linux inotify, wait blocks until files in watched directories change
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        # watch descriptor -> (directory, recursive)
+        self.watches = {}
+        # directory -> watch descriptor
+        self.directories = {}
+
+    def _watch(self, directory, recursive):
+        wd = self.directories.get(directory)
+        if wd is None:
+            wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_add_watch failed on {}'.format(directory))
+            self.directories[directory] = wd
+        elif self.watches[wd][1]:
+            return
+        self.watches[wd] = (directory, recursive)
+
+    def add_directory(self, directory):
+        # watch directory & sub directories, files created later are reported
+        for root, dirs, files in os.walk(directory):
+            self._watch(root, True)
+
+    def add_file(self, file_name):
+        # changes of file are reported by watch on its directory
+        self._watch(os.path.dirname(file_name), False)
+
+    def wait(self, timeout=None):
+        # changed paths, None if events were lost
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        lost = False
+        while True:
+            try:
+                content = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(content):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(content, offset)
+                name = content[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                offset = offset + EVENT_HEADER.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    lost = True
+                    continue
+                if wd not in self.watches:
+                    continue
+                directory, recursive = self.watches[wd]
+                if mask & IN_IGNORED:
+                    # directory removed
+                    del self.watches[wd]
+                    self.directories.pop(directory, None)
+                    continue
+                if not name:
+                    continue
+
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                        # files may be created before the watch is added
+                        try:
+                            self.add_directory(path)
+                            for root, dirs, files in os.walk(path):
+                                changed.update(os.path.join(root, one) for one in files)
+                        except OSError as e:
+                            logging.warning("failed to watch {}: {}".format(path, e))
+                else:
+                    changed.add(path)
+        return None if lost else changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    watch files by size & mtime, directories by mtime, checked every poll interval
+    """
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.files = {}
+        self.directories = {}
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+            return stat.st_size, stat.st_mtime_ns, stat.st_ino
+        except OSError:
+            return None
+
+    def add_directory(self, directory):
+        for root, dirs, files in os.walk(directory):
+            if root not in self.directories:
+                self.directories[root] = self._stat(root)
+            for one in files:
+                file_name = os.path.join(root, one)
+                if file_name not in self.files:
+                    self.files[file_name] = self._stat(file_name)
+
+    def add_file(self, file_name):
+        if file_name not in self.files:
+            self.files[file_name] = self._stat(file_name)
+
+    def wait(self, timeout=None):
+        time.sleep(self.interval if timeout is None else min(self.interval, timeout))
+        changed = set()
+        for file_name, state in list(self.files.items()):
+            current = self._stat(file_name)
+            if current != state:
+                self.files[file_name] = current
+                changed.add(file_name)
+
+        for directory, state in list(self.directories.items()):
+            current = self._stat(directory)
+            if current == state:
+                continue
+            self.directories[directory] = current
+            if current is None:
+                continue
+            # new entries of directory
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.path not in self.directories:
+                                self.add_directory(entry.path)
+                                changed.update(name for name in self.files if name.startswith(entry.path + os.sep))
+                        elif entry.path not in self.files:
+                            self.files[entry.path] = self._stat(entry.path)
+                            changed.add(entry.path)
+            except OSError as e:
+                logging.warning("failed to scan {}: {}".format(directory, e))
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher():
+    # inotify on linux, polling otherwise or if inotify is not available
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as e:
+            logging.warning("inotify not available, fall back to polling: {}".format(e))
+    return PollingWatcher()
+
+
+def _last_line_end(file, start, end):
+    # position after last newline in [start, end) of binary file, start if no complete line
+    position = end
+    while position > start:
+        begin = max(start, position - 65536)
+        file.seek(begin)
+        index = file.read(position - begin).rfind(b'\n')
+        if index >= 0:
+            return begin + index + 1
+        position = begin
+    return start
+
+
+class LogTail:
+    """
+    follow appended records of one file.
+    partial trailing line is buffered until it's complete, a record is emitted when next record starts, or no more
+    data arrives in flush timeout
+    """
+
+    def __init__(self, file_name, pipeline, position=None, emitted=None):
+        self.file_name = file_name
+        self.pipeline = pipeline
+        self.fp = open(file_name)
+        self.binary_fp = open(file_name, 'rb')
+        stat = os.fstat(self.fp.fileno())
+        self.key = get_file_key(stat)
+        # start of first record not emitted
+        self.position = stat.st_size if position is None else position
+        # records with _line_number not after emitted are emitted already
+        self.emitted = emitted
+        # complete lines before scanned are checked for record start
+        self.scanned = self.position
+        # start of last record found after position
+        self.record_start = None
+        self.changed_time = time.monotonic()
+
+    def pending(self):
+        return self.scanned > self.position
+
+    def get_offset(self):
+        return self.position, self.emitted
+
+    def is_rotated(self):
+        # file name is removed, or refers to another file now
+        try:
+            return get_file_key(os.stat(self.file_name)) != self.key
+        except OSError:
+            return True
+
+    def _mine(self, start, end):
+        self.fp.seek(start)
+        for one in self.pipeline.mine(self.fp, start, end):
+            line_number = one.get('_line_number')
+            if isinstance(line_number, int):
+                if self.emitted is not None and line_number <= self.emitted:
+                    continue
+                self.emitted = line_number
+            yield one
+
+    def poll(self, now, flush_timeout=FLUSH_TIMEOUT):
+        size = os.fstat(self.fp.fileno()).st_size
+        if size < self.position:
+            logging.warning("file {} truncated, read from start".format(self.file_name))
+            self.position = self.scanned = 0
+            self.record_start = None
+            self.emitted = None
+
+        if size > self.scanned:
+            complete_end = _last_line_end(self.binary_fp, self.scanned, size)
+            if complete_end > self.scanned:
+                record_start = self.pipeline.parser.last_record_start(self.binary_fp, self.scanned, complete_end)
+                if record_start is not None:
+                    self.record_start = record_start
+                self.scanned = complete_end
+                self.changed_time = now
+
+        if self.record_start is not None and self.record_start > self.position:
+            # records before last record start are complete
+            for one in self._mine(self.position, self.record_start):
+                yield one
+            self.position = self.record_start
+
+        if self.pending() and self.scanned == size and now - self.changed_time >= flush_timeout:
+            for one in self._mine(self.position, self.scanned):
+                yield one
+            self.position = self.scanned
+            self.record_start = None
+
+    def drain(self):
+        # emit all records to end of file, including the partial trailing line, file won't grow any more
+        size = os.fstat(self.fp.fileno()).st_size
+        if size > self.position:
+            for one in self._mine(self.position, None):
+                yield one
+        self.position = self.scanned = max(size, self.position)
+        self.record_start = None
+
+    def close(self):
+        self.fp.close()
+        self.binary_fp.close()
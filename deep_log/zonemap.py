@@ -0,0 +1,196 @@
+import logging
+import os
+from datetime import datetime
+
+from deep_log import utils
+from deep_log.dsl import TOKEN_PATTERN
+
+MAX_DISTINCT_VALUES = 32
+MAX_VALUE_LENGTH = 64
+
+
+class BlockStats:
+    """
+    statistics of handled records in one block [start, end) of a file:
+    min/max of number & datetime fields, distinct values of low cardinality string fields, bloom filter of tokens
+    """
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.count = 0
+        self.ranges = {}
+        self.times = {}
+        self.values = {}
+        self.tokens = set()
+
+    @staticmethod
+    def _update_range(ranges, key, value):
+        if value != value:
+            # nan
+            return
+        current = ranges.get(key)
+        if current is None:
+            ranges[key] = [value, value]
+        elif value < current[0]:
+            current[0] = value
+        elif value > current[1]:
+            current[1] = value
+
+    def add(self, record):
+        self.count = self.count + 1
+        # file info fields of LogRecord are skipped anyway
+        for key, value in getattr(record, 'fields', record).items():
+            if key == '_record':
+                if isinstance(value, str):
+                    self.tokens.update(TOKEN_PATTERN.findall(value))
+            elif key.startswith('_') or key == 'tags':
+                continue
+            elif isinstance(value, datetime):
+                self._update_range(self.times, key, value.timestamp())
+            elif isinstance(value, (int, float)):
+                self._update_range(self.ranges, key, value)
+            elif isinstance(value, str):
+                values = self.values.get(key, set())
+                if values is None:
+                    continue
+                values.add(value)
+                if len(value) > MAX_VALUE_LENGTH or len(values) > MAX_DISTINCT_VALUES:
+                    # high cardinality, can't be used
+                    values = None
+                self.values[key] = values
+        return record
+
+    def to_dict(self):
+        bloom = utils.BloomFilter(capacity=max(len(self.tokens), 1))
+        for one in self.tokens:
+            bloom.add(one)
+        return {
+            'start': self.start,
+            'end': self.end,
+            'count': self.count,
+            'ranges': self.ranges,
+            'times': self.times,
+            'values': {key: (sorted(value) if value is not None else None) for key, value in self.values.items()},
+            'tokens': bloom.to_dict(),
+        }
+
+
+def block_may_match(block, constraints):
+    # False only if no record in block can satisfy constraints
+    for constraint in constraints:
+        kind = constraint[0]
+        if kind == 'values':
+            field_name, expected = constraint[1], constraint[2]
+            if field_name not in block['values']:
+                # no string value at all
+                return False
+            values = block['values'][field_name]
+            if values is not None and not expected.intersection(values):
+                return False
+
+        elif kind == 'range':
+            field_name, range_kind, operator, value = constraint[1:]
+            ranges = block['times'] if range_kind == 'ts' else block['ranges']
+            if field_name not in ranges:
+                return False
+            low, high = ranges[field_name]
+            if operator == '>' and not high > value:
+                return False
+            if operator == '>=' and not high >= value:
+                return False
+            if operator == '<' and not low < value:
+                return False
+            if operator == '<=' and not low <= value:
+                return False
+            if operator == '==' and not low <= value <= high:
+                return False
+
+        elif kind == 'tokens':
+            bloom = block.get('_bloom')
+            if bloom is None:
+                bloom = block['_bloom'] = utils.BloomFilter.from_dict(block['tokens'])
+            for one in constraint[2]:
+                if one not in bloom:
+                    return False
+    return True
+
+
+class ZoneMapStore:
+    """
+    zone map index of files under cache dir, one json file per log file.
+    index is bound to file identity (inode & leading bytes) and signature of parser & handlers,
+    blocks are appended when file grows.
+    """
+
+    def __init__(self, cache_dir, block_size):
+        self.cache_dir = cache_dir
+        self.block_size = block_size
+        # file name -> (identity, kept blocks) of current plan
+        self.plans = {}
+
+    def _index_file(self, file_name):
+        return utils.get_cache_file(self.cache_dir, file_name)
+
+    def plan(self, file_name, pipeline, size=None, split=None):
+        """
+        (start, end, collect) ranges to mine, blocks which can't match pipeline constraints are skipped,
+        collect is True for ranges not indexed yet.
+        size & split(block size, start) are given for compressed file, positions are uncompressed offsets then.
+        """
+        stat = os.stat(file_name)
+        size = stat.st_size if size is None else size
+        split = split if split else lambda block_size, start: pipeline.split(file_name, block_size, start)
+        identity = {'inode': stat.st_ino, 'size': size,
+                    'fingerprint': utils.get_fingerprint(file_name, size), 'signature': pipeline.signature}
+
+        blocks = []
+        index = utils.load_cache(self._index_file(file_name), 'zone map')
+        if (index is not None and index.get('inode') == stat.st_ino and index.get('signature') == pipeline.signature
+                and index.get('size', 0) <= size
+                and index.get('fingerprint') == utils.get_fingerprint(file_name, index.get('size', 0))):
+            blocks = index.get('blocks', [])
+            if blocks and index.get('size') < size:
+                # last record of last block may continue in appended data
+                blocks = blocks[:-1]
+
+        self.plans[file_name] = (identity, blocks)
+
+        ranges = []
+        skipped = 0
+        for block in blocks:
+            if block_may_match(block, pipeline.constraints):
+                ranges.append((block['start'], block['end'], False))
+            else:
+                skipped = skipped + 1
+
+        indexed_end = blocks[-1]['end'] if blocks else 0
+        if indexed_end < size:
+            for start, end in split(self.block_size, indexed_end):
+                ranges.append((start, end if end is not None else size, True))
+
+        if skipped:
+            logging.info("zone map skipped {} of {} blocks in {}".format(skipped, len(blocks), file_name))
+        return ranges
+
+    def update(self, file_name, new_blocks):
+        # merge collected blocks into index of planned file, only continuous blocks from file start are kept
+        if file_name not in self.plans:
+            return
+        identity, blocks = self.plans.pop(file_name)
+
+        merged = []
+        position = 0
+        for block in sorted([*blocks, *new_blocks], key=lambda x: x['start']):
+            if block['start'] != position:
+                break
+            merged.append({key: value for key, value in block.items() if not key.startswith('_')})
+            position = block['end']
+
+        if not merged:
+            return
+
+        # index covers the continuous blocks only
+        identity['size'] = min(identity['size'], position)
+        identity['fingerprint'] = utils.get_fingerprint(file_name, identity['size'])
+        utils.save_cache(self._index_file(file_name), {**identity, 'file': file_name, 'blocks': merged})
@@ -20,6 +20,7 @@ setup(
     entry_points={
         'console_scripts': [
             'dl = deep_log.main:main',
+            'dl-index = deep_log.index:main',
         ],
     }
 )
@@ -0,0 +1,79 @@
+import os
+import random
+import resource
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = '''
+root:
+  parser:
+    name: DefaultLogParser
+    params:
+      pattern: (?P<content>.*?)
+  path: /
+loggers:
+  - name: test
+    path: '{}'
+    parser:
+      name: DefaultLogParser
+      params:
+        pattern: '\\[(?P<time>.*?)\\] \\[(?P<level>.*?)\\] (?P<content>worker (?P<worker>\\d+) latency (?P<latency>\\d+).*)'
+    handlers:
+      - name: TypeLogHandler
+        params:
+          definitions:
+            - field: time
+              format: '%a %b %d %H:%M:%S %Y'
+              type: datetime
+            - field: worker
+              type: int
+            - field: latency
+              type: int
+'''
+LEVELS = ['error', 'notice', 'warn']
+
+
+class Workspace:
+    """
+    config dir and log dir of one test, queries run by dl in a new process as from command line
+    """
+
+    def __init__(self, root):
+        self.config_dir = os.path.join(root, 'config')
+        self.log_dir = os.path.join(root, 'logs')
+        os.makedirs(self.config_dir)
+        os.makedirs(self.log_dir)
+        with open(os.path.join(self.config_dir, 'config.yaml'), 'w') as f:
+            f.write(CONFIG.format(self.log_dir))
+
+    def write_log(self, name, lines=None, count=100, seed=0):
+        # lines of apache error log format by default
+        if lines is None:
+            generator = random.Random(seed)
+            lines = ['[Sun Dec 04 04:52:15 2005] [{}] worker {} latency {}'.format(
+                generator.choice(LEVELS), index, generator.randint(0, 1000)) for index in range(count)]
+        file_name = os.path.join(self.log_dir, name)
+        with open(file_name, 'w') as f:
+            f.write(''.join(one + '\n' for one in lines))
+        return file_name
+
+    def run(self, *args, check=True, open_files=None):
+        # output lines of query, open files of dl process are limited by open files
+        env = {**os.environ, 'PYTHONPATH': ROOT}
+        def limit():
+            resource.setrlimit(resource.RLIMIT_NOFILE, (open_files, open_files))
+        result = subprocess.run([sys.executable, '-m', 'deep_log.main', '-c', self.config_dir, *args,
+                                 '--target', self.log_dir], env=env, capture_output=True, text=True,
+                                preexec_fn=limit if open_files else None)
+        if check and result.returncode != 0:
+            raise AssertionError('dl {} failed: {}'.format(' '.join(args), result.stderr))
+        return result.stdout.splitlines()
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    return Workspace(str(tmp_path))
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from deep_log.aggregator import Aggregator, parse_aggregations, parse_group_by
+
+
+def aggregate(group_by, aggregations, *partials):
+    # results of partial aggregators merged, as shipped by workers
+    merged = Aggregator(parse_group_by(group_by), parse_aggregations(aggregations))
+    for records in partials:
+        aggregator = Aggregator(parse_group_by(group_by), parse_aggregations(aggregations))
+        aggregator.extend(records)
+        merged.merge(aggregator.groups)
+    return merged.results()
+
+
+def test_min_max_of_numeric_strings():
+    records = [{'level': 'error', 'content': one} for one in ['99', '1000', '5']]
+    assert aggregate('level', 'max(content),min(content),avg(content)', records) == [
+        {'level': 'error', 'max(content)': '1000', 'min(content)': '5', 'avg(content)': 368.0}]
+    assert aggregate('level', 'max(content),min(content)', records[:1], records[1:]) == [
+        {'level': 'error', 'max(content)': '1000', 'min(content)': '5'}]
+
+
+def test_min_max_of_mixed_types():
+    records = [{'value': 3}, {'value': 'abc'}, {'value': [1]}, {'value': None}, {'value': '7.5'},
+               {'value': datetime(2020, 1, 1)}]
+    assert aggregate('', 'min(value),max(value),count(value)', records) == [
+        {'min(value)': 3, 'max(value)': 'abc', 'count(value)': 5}]
+    assert aggregate('', 'min(time),max(time)', [{'time': datetime(2020, 1, 1)}], [{'time': datetime(2019, 1, 1)}]) == [
+        {'min(time)': datetime(2019, 1, 1), 'max(time)': datetime(2020, 1, 1)}]
+
+
+def test_unhashable_group_values():
+    records = [{'tags': ['a']}, {'tags': ['a']}, {'tags': 'b'}]
+    assert aggregate('tags', 'count', records) == [{'tags': "['a']", 'count': 2}, {'tags': 'b', 'count': 1}]
+
+
+def test_workers_aggregate_same_as_one(workspace):
+    for index in range(4):
+        workspace.write_log('f{}.log'.format(index), count=300, seed=index)
+    args = ['--group-by', 'level', '--agg', 'count,min(content),max(latency),avg(worker),min(time)']
+    expected = workspace.run(*args, '--workers', '1')
+    assert len(expected) == 3
+    assert workspace.run(*args, '--workers', '2') == expected
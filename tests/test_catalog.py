@@ -0,0 +1,42 @@
+import gzip
+import os
+
+from deep_log import catalog
+from deep_log import miner
+from deep_log.config import LogConfig
+from deep_log.miner import DeepLogMiner
+
+
+def test_compression_read_once_per_file(workspace, monkeypatch):
+    plain = workspace.write_log('a.log')
+    compressed = os.path.join(workspace.log_dir, 'b.log.gz')
+    with gzip.open(compressed, 'wt') as f:
+        f.write('[Sun Dec 04 04:52:15 2005] [error] worker 1 latency 2\n')
+
+    detected = []
+
+    def detect(file_name):
+        detected.append(file_name)
+        return 'gzip' if file_name.endswith('.gz') else None
+
+    monkeypatch.setattr(catalog, 'detect_compression', detect)
+    monkeypatch.setattr(miner, 'detect_compression', detect)
+
+    def discover():
+        log_miner = DeepLogMiner(LogConfig(workspace.config_dir), catalog=True)
+        files = log_miner.get_target_files([workspace.log_dir])
+        log_miner.split_files(files)
+        return sorted(files)
+
+    assert discover() == [plain, compressed]
+    assert sorted(detected) == [plain, compressed]
+
+    # unchanged files are not read again by next run
+    del detected[:]
+    assert discover() == [plain, compressed]
+    assert detected == []
+
+    with open(plain, 'a') as f:
+        f.write('[Sun Dec 04 04:52:15 2005] [error] worker 2 latency 3\n')
+    assert discover() == [plain, compressed]
+    assert detected == [plain]
@@ -0,0 +1,15 @@
+import pytest
+
+pytest.importorskip('pandas')
+
+
+@pytest.mark.parametrize('analysis', ["df.groupby('level')['latency'].agg(['count', 'sum', 'max'])",
+                                      "df[df.level == 'error'].groupby('_basename').worker.max()",
+                                      "df[df.level.isin(['warn'])].latency.describe()"])
+def test_columnar_same_as_records(workspace, analysis):
+    for index in range(3):
+        workspace.write_log('f{}.log'.format(index), count=300, seed=index)
+    args = ['-y', analysis, '--workers', '2']
+    expected = workspace.run(*args)
+    assert len(expected) > 3
+    assert workspace.run(*args, '--columnar') == expected
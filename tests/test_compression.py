@@ -0,0 +1,34 @@
+import bz2
+import gzip
+import os
+
+import pytest
+
+from deep_log.compression import detect_compression
+
+
+def compress(file_name, compression, members=1):
+    # file replaced by compressed one of several members (e.g. pigz, concatenated rotations)
+    with open(file_name, 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
+    step = len(lines) // members + 1
+    compress_data = gzip.compress if compression == 'gzip' else bz2.compress
+    compressed = file_name + ('.gz' if compression == 'gzip' else '.bz2')
+    with open(compressed, 'wb') as f:
+        for start in range(0, len(lines), step):
+            f.write(compress_data(b''.join(lines[start:start + step])))
+    os.remove(file_name)
+    return compressed
+
+
+@pytest.mark.parametrize('compression, members', [('gzip', 1), ('gzip', 5), ('bz2', 3)])
+def test_compressed_file_same_records_as_plain(workspace, compression, members):
+    file_name = workspace.write_log('a.log', count=2000)
+    args = ['-l', "level == 'error'", '-m', '{_line_number} {content}']
+    expected = workspace.run(*args)
+    assert expected
+    assert detect_compression(compress(file_name, compression, members)) == compression
+    assert workspace.run(*args) == expected
+    # seek points recorded by first run split the file for next ones
+    for one in range(2):
+        assert workspace.run(*args, '--seek-index', '--workers', '2', '--shard-size', '1') == expected
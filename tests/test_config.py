@@ -0,0 +1,29 @@
+import os
+
+from deep_log.config import LogConfig
+
+
+def test_snapshot_loaded_until_config_changes(workspace, monkeypatch):
+    expected = LogConfig(workspace.config_dir).settings
+    loaded = []
+    load_config = LogConfig._load_config
+    monkeypatch.setattr(LogConfig, '_load_config', lambda self, *args: loaded.append(args) or load_config(self, *args))
+    assert LogConfig(workspace.config_dir).settings == expected
+    assert loaded == []
+
+    config_file = os.path.join(workspace.config_dir, 'config.yaml')
+    with open(config_file) as f:
+        content = f.read()
+    with open(config_file, 'w') as f:
+        f.write(content.replace('  path: /\n', '  path: /\n  index:\n    fields: [content]\n', 1))
+    config = LogConfig(workspace.config_dir)
+    assert len(loaded) == 1 and config.settings != expected
+    assert config.get_index_fields('/elsewhere/a.log') == ['content']
+
+
+def test_snapshot_bound_to_variables(workspace):
+    assert LogConfig(workspace.config_dir, {'a': '1'}).settings['variables'] == {'a': '1'}
+    # each definition has its own snapshot
+    assert LogConfig(workspace.config_dir, {'a': '2'}).settings['variables'] == {'a': '2'}
+    assert LogConfig(workspace.config_dir, {'a': '1'}).settings['variables'] == {'a': '1'}
+    assert LogConfig(workspace.config_dir).settings['variables'] == {}
@@ -0,0 +1,47 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def daemon(workspace):
+    # dl serving queries on a socket of test config
+    socket_path = os.path.join(workspace.config_dir, 'test.sock')
+    server = subprocess.Popen([sys.executable, '-m', 'deep_log.main', '-c', workspace.config_dir, '--serve',
+                               '--socket', socket_path], env={**os.environ, 'PYTHONPATH': ROOT},
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while not os.path.exists(socket_path) and server.poll() is None and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert os.path.exists(socket_path), 'daemon not listening'
+    yield socket_path
+    server.send_signal(signal.SIGTERM)
+    server.wait(20)
+
+
+def test_query_by_daemon_same_as_local(workspace, daemon):
+    for index in range(3):
+        workspace.write_log('f{}.log'.format(index), count=200, seed=index)
+    for args in [['-l', "level == 'error'", '-m', '{_basename} {_line_number} {latency}'],
+                 ['--order-by', 'latency', '--limit', '5', '-m', '{latency} {_basename} {_line_number}'],
+                 ['--group-by', 'level', '--agg', 'count,max(latency)']]:
+        expected = workspace.run(*args)
+        assert expected
+        assert workspace.run(*args, '--connect', '--socket', daemon) == expected
+    # files created after daemon started are found
+    workspace.write_log('new.log', count=10)
+    args = ['-l', "_basename == 'new.log'", '-m', '{_line_number}']
+    assert len(workspace.run(*args, '--connect', '--socket', daemon)) == 10
+
+
+def test_query_run_locally_without_daemon(workspace):
+    workspace.write_log('a.log', count=10)
+    socket_path = os.path.join(workspace.config_dir, 'none.sock')
+    assert workspace.run('-m', '{_line_number}', '--connect', '--socket', socket_path) == \
+        workspace.run('-m', '{_line_number}')
@@ -0,0 +1,36 @@
+from deep_log.distinct import DistinctFilter, DistinctPrefilter, fingerprint
+
+
+def test_equal_values_same_fingerprint():
+    assert fingerprint((1,)) == fingerprint((1.0,)) == fingerprint((True,))
+    assert fingerprint(({'a', 'b', 'c'},)) == fingerprint(({'c', 'b', 'a'},)) == fingerprint((frozenset('abc'),))
+    assert fingerprint(({'a': 1, 'b': 2},)) == fingerprint(({'b': 2.0, 'a': 1},))
+    assert fingerprint((1,)) != fingerprint(('1',))
+    assert fingerprint(([1],)) != fingerprint(((1,),))
+    assert fingerprint((set(),)) != fingerprint(({},))
+    assert fingerprint((1.5,)) != fingerprint((1,))
+
+
+def test_distinct_keeps_first_of_equal_values():
+    records = [{'value': 1}, {'value': 1.0}, {'value': True}, {'value': '1'}, {'value': {2, 3}}, {'value': {3, 2}}]
+    assert list(DistinctFilter(['value']).filter(records)) == [{'value': 1}, {'value': '1'}, {'value': {2, 3}}]
+
+
+def test_prefilter_never_drops_new_values():
+    prefilter = DistinctPrefilter(['value'], max_keys=3)
+    records = [{'value': one % 5} for one in range(100)]
+    kept = list(prefilter.filter(records))
+    assert len(prefilter.keys) <= 3
+    assert {one['value'] for one in kept} == set(range(5))
+    # consumer removes duplicates passed once keys are forgotten
+    assert list(DistinctFilter(['value']).filter(kept)) == records[:5]
+
+
+def test_workers_distinct_same_as_one(workspace):
+    for index in range(4):
+        workspace.write_log('f{}.log'.format(index), count=300, seed=index)
+    args = ['--distinct', 'level,latency', '-m', '{level} {latency}']
+    expected = sorted(workspace.run(*args, '--workers', '1'))
+    assert len(expected) < 1200
+    assert sorted(workspace.run(*args, '--workers', '2', '--shard-size', '1')) == expected
+    assert sorted(workspace.run(*args, '--workers', '2', '--approximate-distinct', '0.0001')) == expected
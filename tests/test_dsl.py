@@ -0,0 +1,123 @@
+import copy
+import datetime
+import itertools
+
+import pytest
+
+from deep_log import dsl
+from deep_log import utils
+from deep_log.filter import DslFilter, LogFilter
+from deep_log.meta_filter import DslMetaFilter, NameFilter
+
+RECORDS = [
+    {'time': datetime.datetime(2005, 12, 4, 4, 52, 15), 'level': 'error', 'content': 'worker 1 latency 600',
+     'worker': 1, 'latency': 600, 'tags': {'important'}, 'items': [1, 2]},
+    {'time': datetime.datetime(2005, 12, 3, 4, 52, 15), 'level': 'notice', 'content': 'worker 4 latency 20',
+     'worker': 4, 'latency': 20, 'tags': set(), 'items': []},
+    {'level': 'warn', 'content': 'worker x', 'worker': 'x', 'tags': {'other'}},
+]
+EXPRESSIONS = [
+    "level == 'error'",
+    "latency > 500 and worker % 2 == 1",
+    "'worker 1' in content",
+    "str(worker) in content",
+    "level in ['error', 'warn']",
+    "tags & {'important'}",
+    "not tags",
+    "time.timestamp() - 1133661135 > 0",
+    "datetime.datetime(2005, 12, 4) < time",
+    "re.search(r'latency \\d+', content)",
+    "path.basename(content) == content",
+    "items == [1, 2]",
+    "items + [3] == [1, 2, 3]",
+    "any(one > 1 for one in items)",
+    "[one for one in items if one > worker]",
+    "[latency for _ in items]",
+    "[x for x in items for y in items if x < y]",
+    "{worker: level for _ in items}",
+    "{one: latency for one in tags}",
+    "sorted(items, key=lambda one: -one)[0] == 2",
+    "(lambda x: x + latency)(1) > 100",
+    "(lambda x=latency: x)() == latency",
+    "(n := latency) > 100 and n < 900",
+    "max(latency, worker) > 5",
+    "len(missing) > 0",
+    "1 / 0",
+    "items.append(3) or len(items) == 3",
+    "",
+]
+
+
+def legacy_filter(expression, pass_on_exception=False):
+    # dsl filter as evaluated before fusion: on a deep copy of record merged with built functions
+    code = compile(expression, '', 'eval') if expression else None
+
+    def evaluate(record):
+        try:
+            return bool(eval(code, {**copy.deepcopy(record), **utils.built_function})) if code else True
+        except Exception:
+            return pass_on_exception
+    return evaluate
+
+
+class LatencyFilter(LogFilter):
+    def filter(self, one_log_item):
+        return one_log_item.get('latency', 0) < 500
+
+
+def records(lines):
+    # line numbers printed, errors of failed filters are printed too
+    return [one for one in lines if one.isdigit()]
+
+
+def test_prefilter_skips_filters_passing_on_exception():
+    assert dsl.plan_prefilter([DslFilter("'zzz' in _record", pass_on_exception=True)], []) is None
+    assert dsl.plan_prefilter([DslFilter("'zzz' in _record")], []) is not None
+
+
+def test_prefilter_same_results_as_filter(workspace):
+    workspace.write_log('a.log')
+    for query in ["int(content) > 0 and 'zzz' in _record", "'worker 1' in _record and latency > 500"]:
+        # field conditions aren't pushed down, raw record conditions are
+        field_query = query.replace('_record', 'content')
+        for args in [[], ['--pass-on-exception']]:
+            expected = records(workspace.run('-l', field_query, '-m', '{_line_number}', *args))
+            assert records(workspace.run('-l', query, '-m', '{_line_number}', *args)) == expected
+
+
+@pytest.mark.parametrize('expression', EXPRESSIONS)
+@pytest.mark.parametrize('pass_on_exception', [False, True])
+def test_fused_filter_same_results_as_eval(expression, pass_on_exception):
+    predicate = dsl.fuse_filters([DslFilter(expression, pass_on_exception=pass_on_exception)])
+    expected = legacy_filter(expression, pass_on_exception)
+    for record in RECORDS:
+        assert bool(predicate(record)) == expected(record), record
+        assert bool(DslFilter(expression, pass_on_exception=pass_on_exception).filter(record)) == expected(record)
+
+
+@pytest.mark.parametrize('expressions', list(itertools.combinations(EXPRESSIONS[::3], 3)))
+def test_fused_filters_same_results_as_chain(expressions):
+    # filters of one pipeline in order, with custom filters and both exception modes
+    log_filters = [DslFilter(expressions[0]), LatencyFilter(), DslFilter(expressions[1], pass_on_exception=True),
+                   DslFilter(expressions[2])]
+    expected = [legacy_filter(expressions[0]), LatencyFilter().filter, legacy_filter(expressions[1], True),
+                legacy_filter(expressions[2])]
+    predicate = dsl.fuse_filters(log_filters)
+    for record in RECORDS:
+        assert bool(predicate(record)) == all(one(record) for one in expected), record
+
+
+def test_fused_meta_filters_same_results_as_eval(tmp_path):
+    files = [tmp_path / 'a.log', tmp_path / 'b.txt', tmp_path / 'dir', tmp_path / 'missing.log']
+    files[0].write_text('x' * 100)
+    files[1].write_text('x')
+    files[2].mkdir()
+    for expressions in [["_size > 10"], ["_basename.endswith('.log')", "_mtime < datetime.datetime.now()"],
+                        ["_isdir or _size < 10"], ["_exists and _readable"]]:
+        meta_filters = [NameFilter(exclude_patterns='*.tmp')] + [DslMetaFilter(one) for one in expressions]
+        predicate = dsl.fuse_meta_filters(meta_filters)
+        for one in files[:3]:
+            expected = all(eval(expression, {**utils.get_fileinfo(str(one)), **utils.built_function})
+                           for expression in expressions)
+            assert bool(predicate(str(one))) == expected, (expressions, one)
+        assert not dsl.fuse_meta_filters([DslMetaFilter('_exists')])(str(files[3]))
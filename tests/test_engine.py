@@ -0,0 +1,148 @@
+import functools
+import logging
+import multiprocessing as mp
+import os
+import signal
+import time
+
+import pytest
+
+from deep_log.analyzer import LogAnalyzer
+from deep_log.config import LogConfig
+from deep_log.engine import LogEngine
+from deep_log.miner import DeepLogMiner
+from deep_log.pipeline import pipeline_cache
+from deep_log.record_writer import LogRecordWriterFactory
+
+
+def create_engine(workspace, workers, shard_size, log_analyzer=None):
+    log_analyzer = log_analyzer if log_analyzer else LogAnalyzer()
+    log_engine = LogEngine(DeepLogMiner(LogConfig(workspace.config_dir)), log_analyzer,
+                           LogRecordWriterFactory.create(None, False), targets=[workspace.log_dir], workers=workers)
+    # bytes, small shards of test files
+    log_engine.shard_size = shard_size
+    return log_engine
+
+
+def test_chunks_keep_shards_of_split_file_alone(workspace):
+    for index in range(6):
+        workspace.write_log('f{}.log'.format(index), count=2)
+    workspace.write_log('z.log', count=200)
+    log_engine = create_engine(workspace, 2, 1024)
+    shards = log_engine.log_miner.split_files(log_engine.log_miner.get_target_files([workspace.log_dir]),
+                                              log_engine.shard_size)
+    tasks = [(task_id, *one) for task_id, one in enumerate(shards)]
+    next_tasks = {task_id - 1: task_id for task_id in range(1, len(tasks))
+                  if tasks[task_id - 1][1] == tasks[task_id][1]}
+    chunks = log_engine.chunk_tasks(tasks, next_tasks)
+    assert [one for chunk in chunks for one in chunk] == tasks
+    assert all(len(chunk) == 1 for chunk in chunks if chunk[0][1].endswith('z.log'))
+    assert len([chunk for chunk in chunks if chunk[0][1].endswith('z.log')]) > 5
+
+
+def test_shards_dispatched_ahead_of_head_are_bounded(workspace, monkeypatch):
+    file_name = workspace.write_log('a.log', count=3000)
+    log_engine = create_engine(workspace, 2, 4096)
+    started = mp.Value('i', 0)
+    started_during_head = mp.Value('i', 0)
+    stream_files = LogEngine.stream_files
+
+    def slow_head(self, task):
+        # head shard is slow, later shards are fast. workers are forked with the patched engine
+        with started.get_lock():
+            started.value = started.value + 1
+        if task[2] == 0:
+            time.sleep(1)
+            started_during_head.value = started.value
+        return stream_files(self, task)
+
+    monkeypatch.setattr(LogEngine, 'stream_files', slow_head)
+    shards = len(log_engine.log_miner.split_files([file_name], log_engine.shard_size))
+    assert shards > 10
+    records = list(log_engine.run_in_multi_batches())
+    assert [one['worker'] for one in records] == list(range(3000))
+    assert started.value == shards
+    # head & one shard per worker ahead of it
+    assert started_during_head.value <= 1 + log_engine.workers
+
+
+def killed_on_second_file(method):
+    # worker exits as killed (e.g. out of memory) without ending its task
+    @functools.wraps(method)
+    def run(self, task):
+        if task[1].endswith('f1.log'):
+            os._exit(1)
+        return method(self, task)
+    return run
+
+
+@pytest.mark.parametrize('method, args', [('stream_files', {}), ('aggregate_files', {'group_by': 'level'})])
+def test_killed_worker_fails_run(workspace, monkeypatch, method, args):
+    for index in range(4):
+        workspace.write_log('f{}.log'.format(index), count=100, seed=index)
+    log_engine = create_engine(workspace, 2, 1024 * 1024, LogAnalyzer(**args))
+    monkeypatch.setattr(LogEngine, method, killed_on_second_file(getattr(LogEngine, method)))
+
+    def timeout(signum, frame):
+        raise AssertionError('run not failed in time')
+
+    previous = signal.signal(signal.SIGALRM, timeout)
+    signal.alarm(20)
+    try:
+        with pytest.raises(Exception, match='exited unexpectedly'):
+            if method == 'stream_files':
+                list(log_engine.run_in_multi_batches())
+            else:
+                log_engine.aggregate_records()
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def test_exited_follower_fails_stream(workspace):
+    for index in range(4):
+        workspace.write_log('f{}.log'.format(index), count=10, seed=index)
+    log_engine = create_engine(workspace, 2, 1024 * 1024)
+
+    def follow(files, queue, target_paths, partition, stop):
+        # second follower exits as killed, first one waits to be stopped
+        if partition[0] == 1:
+            os._exit(1)
+        stop.wait()
+
+    def timeout(signum, frame):
+        raise AssertionError('stream not failed in time')
+
+    previous = signal.signal(signal.SIGALRM, timeout)
+    signal.alarm(20)
+    try:
+        with pytest.raises(Exception, match='exited unexpectedly'):
+            list(log_engine.run_in_multi_streams(follow))
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+@pytest.mark.parametrize('workers, method', [(1, 'execute'), (2, 'run_in_multi_batches'), (2, 'sort_records')])
+def test_pipeline_cache_reported_with_worker_lookups(workspace, caplog, workers, method):
+    for index in range(4):
+        workspace.write_log('f{}.log'.format(index), count=10)
+    args = {'order_by': 'latency'} if method == 'sort_records' else {}
+    log_engine = create_engine(workspace, workers, 1024 * 1024, LogAnalyzer(**args))
+    log_engine.max_memory = 1024 * 1024 * 1024
+    pipeline_cache.clear()
+    caplog.set_level(logging.INFO)
+    list(getattr(log_engine, method)())
+    # consumer looks pipeline up to filter & split files, workers to mine them
+    stats = pipeline_cache.stats()
+    assert stats['misses'] == 1 and stats['hits'] >= 4 * 2 + 3
+    assert 'pipeline cache: {hits} hits, {misses} misses'.format(**stats) in caplog.text
+
+
+@pytest.mark.parametrize('args', [['--workers', '1'], ['--workers', '2'], ['--workers', '2', '--shard-size', '1'],
+                                  ['--workers', '2', '--shared-memory']])
+def test_limit_stops_at_count(workspace, args):
+    for index in range(4):
+        workspace.write_log('f{}.log'.format(index), count=3000, seed=index)
+    records = workspace.run('--limit', '7', '-m', '{_basename} {_line_number}', *args)
+    assert len(records) == 7 and len(set(records)) == 7
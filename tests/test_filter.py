@@ -0,0 +1,31 @@
+import pytest
+
+from deep_log import dsl
+from deep_log.filter import DslFilter
+
+RECORD = {'items': ['a'], 'tags': {'x'}, 'extra': {'key': [1]}, 'count': 3}
+
+
+def evaluators():
+    # dsl evaluated on record namespace, and fused into one predicate
+    return [lambda query: DslFilter(query).filter, lambda query: dsl.fuse_filters([DslFilter(query)])]
+
+
+@pytest.mark.parametrize('evaluator', evaluators())
+@pytest.mark.parametrize('query', [
+    "items == ['a']",
+    "items + ['b'] == ['a', 'b']",
+    "isinstance(items, list) and isinstance(tags, set) and isinstance(extra, dict)",
+    "tags == {'x'} and tags | {'y'} == {'x', 'y'}",
+    "extra == {'key': [1]} and extra['key'] == [1]",
+    "[one for one in items] == items",
+])
+def test_fields_keep_types(evaluator, query):
+    assert evaluator(query)(RECORD)
+
+
+@pytest.mark.parametrize('evaluator', evaluators())
+def test_dsl_cant_change_record(evaluator):
+    record = {'items': ['a'], 'tags': {'x'}, 'extra': {'key': [1]}}
+    assert evaluator("items.append('b') is None and tags.add('y') is None and extra['key'].append(2) is None")(record)
+    assert record == {'items': ['a'], 'tags': {'x'}, 'extra': {'key': [1]}}
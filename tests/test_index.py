@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+from deep_log.index import decode_postings, encode_postings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERIES = ["'worker 42 ' in _record", "'latency 7' in _record and level == 'error'", "'nothing' in _record"]
+
+
+def build_index(workspace):
+    # index of files under log dir, as built by dl-index
+    result = subprocess.run([sys.executable, '-m', 'deep_log.index', 'build', '-c', workspace.config_dir,
+                             '--target', workspace.log_dir], env={**os.environ, 'PYTHONPATH': ROOT},
+                            capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+
+def test_postings_round_trip():
+    positions = [0, 1, 5, 1000, 1000000]
+    assert decode_postings(encode_postings(positions)) == positions
+    assert decode_postings(encode_postings([])) == []
+
+
+def test_seek_by_index_same_as_scan(workspace):
+    workspace.write_log('a.log', count=1000)
+    args = ['-m', '{_line_number} {content}']
+    expected = [workspace.run('-l', one, *args) for one in QUERIES]
+    assert expected[0] and not expected[2]
+    # files not indexed are fully scanned
+    assert [workspace.run('-l', one, *args, '--index') for one in QUERIES] == expected
+    assert build_index(workspace)[0] == 'built'
+    assert [workspace.run('-l', one, *args, '--index') for one in QUERIES] == expected
+    assert [workspace.run('-l', one, *args, '--index', '--workers', '2', '--shard-size', '1') for one in QUERIES] == \
+        expected
+
+
+def test_appended_records_found_after_indexed_ones(workspace):
+    file_name = workspace.write_log('a.log', count=500)
+    build_index(workspace)
+    with open(file_name, 'a') as f:
+        f.write('[Sun Dec 04 04:52:15 2005] [error] worker 42 latency 7 appended\n')
+    args = ['-l', QUERIES[0], '-m', '{_line_number} {content}']
+    expected = workspace.run(*args)
+    assert expected[-1].endswith('appended')
+    assert workspace.run(*args, '--index') == expected
+    # index is updated from its last record
+    assert build_index(workspace)[0] != 'failed'
+    assert workspace.run(*args, '--index') == expected
@@ -0,0 +1,46 @@
+from deep_log.offsets import OffsetStore
+from deep_log.watcher import LogTail
+
+
+def save_offset(cache_dir, file_name, partition=None):
+    # offset of a tail at end of file, as saved by follower of partition
+    tail = LogTail(file_name, None)
+    tail.emitted = 3
+    store = OffsetStore(cache_dir, partition)
+    store.update(tail)
+    store.save(force=True)
+    tail.fp.close()
+    tail.binary_fp.close()
+    return tail.position
+
+
+def test_offsets_resumed_from_all_followers(tmp_path):
+    cache_dir = str(tmp_path / 'offsets')
+    files = [str(tmp_path / 'a.log'), str(tmp_path / 'b.log')]
+    for index, one in enumerate(files):
+        with open(one, 'w') as f:
+            f.write('line\n' * (index + 1))
+    positions = [save_offset(cache_dir, one, (index, 2)) for index, one in enumerate(files)]
+    store = OffsetStore(cache_dir)
+    assert [store.lookup(one)['position'] for one in files] == positions == [5, 10]
+    assert store.lookup(files[0])['emitted'] == 3
+    assert store.is_followed(files[1])
+
+
+def test_offset_of_replaced_file_ignored(tmp_path):
+    cache_dir = str(tmp_path / 'offsets')
+    file_name = str(tmp_path / 'a.log')
+    with open(file_name, 'w') as f:
+        f.write('first\n' * 10)
+    save_offset(cache_dir, file_name)
+    with open(file_name, 'a') as f:
+        f.write('appended\n')
+    assert OffsetStore(cache_dir).lookup(file_name)['position'] == 60
+    # same inode, other content (truncated & rewritten)
+    with open(file_name, 'w') as f:
+        f.write('other\n' * 20)
+    assert OffsetStore(cache_dir).lookup(file_name) is None
+    # shorter than saved position
+    with open(file_name, 'w') as f:
+        f.write('first\n')
+    assert OffsetStore(cache_dir).lookup(file_name) is None
@@ -0,0 +1,38 @@
+import pytest
+
+from deep_log.parser import DefaultLogParser, RecordPrefilter
+
+PATTERN = r'\[(?P<time>.*?)\] \[(?P<level>.*?)\] (?P<content>.*)'
+LINES = ['[t1] [error] hello', 'continued line', '[t2] [warn] worker 1', '', 'line ignored', '[t3] [error] last',
+         '[t4] [notice] worker 2 ends']
+
+
+def parse(file_name, backend, start=0, end=None, prefilter=None):
+    # parsed fields of records, file info fields are left out
+    with open(file_name) as fp:
+        return [dict(one.fields) for one in DefaultLogParser(pattern=PATTERN, backend=backend).parse_file(
+            fp, start, end, prefilter)]
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+@pytest.mark.parametrize('prefilter', [None, RecordPrefilter(['worker']), RecordPrefilter(['error'], ['t[13]'])])
+def test_mmap_same_records_as_readline(tmp_path, newline, prefilter):
+    file_name = str(tmp_path / 'a.log')
+    with open(file_name, 'w', newline='') as f:
+        f.write(newline.join(LINES) + newline)
+    expected = parse(file_name, 'readline', prefilter=prefilter)
+    assert expected and parse(file_name, 'mmap', prefilter=prefilter) == expected
+    # shards of records starting in them
+    shards = DefaultLogParser(pattern=PATTERN).split_file(file_name, 16)
+    assert len(shards) > 1
+    for backend in ['readline', 'mmap']:
+        assert [one for start, end in shards for one in parse(file_name, backend, start, end, prefilter)] == expected
+
+
+def test_mmap_crlf_fields_same_as_text(tmp_path):
+    file_name = str(tmp_path / 'a.log')
+    with open(file_name, 'wb') as f:
+        f.write(b'[t1] [a] hello\r\n[t2] [b] world\r\nnext\r\n')
+    records = parse(file_name, 'mmap')
+    assert [one['content'] for one in records] == ['hello', 'world']
+    assert [one['_record'] for one in records] == ['[t1] [a] hello\n', '[t2] [b] world\nnext\n']
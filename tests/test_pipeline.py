@@ -0,0 +1,50 @@
+import pytest
+
+from deep_log.config import LogConfig
+from deep_log.factory import FilterFactory
+from deep_log.pipeline import pipeline_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    pipeline_cache.clear()
+    yield
+    pipeline_cache.clear()
+
+
+def test_pipeline_cached_by_config_fingerprint(workspace):
+    file_name = workspace.write_log('a.log')
+    config = LogConfig(workspace.config_dir)
+    pipeline = config.get_pipeline(file_name)
+    assert config.get_pipeline(file_name) is pipeline
+    # same settings loaded by another config object
+    assert LogConfig(workspace.config_dir).get_pipeline(file_name) is pipeline
+    assert pipeline_cache.stats() == {'hits': 2, 'misses': 1, 'size': 1}
+
+    # files of other logger nodes get their own pipeline
+    other = config.get_pipeline('/elsewhere/b.log')
+    assert other is not pipeline and other.signature != pipeline.signature
+    assert pipeline_cache.stats() == {'hits': 2, 'misses': 2, 'size': 2}
+
+
+def test_changed_config_not_served_from_cache(workspace):
+    file_name = workspace.write_log('a.log')
+    config = LogConfig(workspace.config_dir)
+    pipeline = config.get_pipeline(file_name)
+    fingerprint = config.get_fingerprint()
+    config.add_filters([FilterFactory.create_dsl_filter("level == 'error'")])
+    assert config.get_fingerprint() != fingerprint
+    filtered = config.get_pipeline(file_name)
+    assert filtered is not pipeline and len(filtered.filters) == len(pipeline.filters) + 1
+    # parser & handlers are the same, only filters differ
+    assert filtered.signature == pipeline.signature
+    assert pipeline_cache.stats()['misses'] == 2
+
+
+def test_worker_counts_merged():
+    pipeline_cache.get('a', object)
+    pipeline_cache.get('a', object)
+    assert pipeline_cache.drain() == (1, 1)
+    assert pipeline_cache.drain() == (0, 0)
+    pipeline_cache.merge((3, 2))
+    assert pipeline_cache.stats() == {'hits': 3, 'misses': 2, 'size': 1}
@@ -0,0 +1,39 @@
+import pickle
+
+from deep_log.record import FileInfo, Interner, LogRecord
+
+
+def test_record_looks_like_dict_of_fields_and_file_info():
+    file = FileInfo('/a.log', {'_name': '/a.log', '_size': 10})
+    record = LogRecord({'level': 'error', '_size': 3, 'tags': None}, file)
+    # fields hide file info of same name
+    assert record['_size'] == 3 and record['_name'] == '/a.log'
+    assert dict(record) == {'level': 'error', '_size': 3, 'tags': set(), '_name': '/a.log'}
+    assert len(record) == 4 and 'tags' in record and 'other' not in record
+    assert record.get('other', 1) == 1
+
+
+def test_changes_stay_in_record():
+    file = FileInfo('/a.log', {'_name': '/a.log'})
+    first, second = LogRecord({'tags': None}, file), LogRecord({'tags': None}, file)
+    first['tags'].add('x')
+    del first['_name']
+    copied = first.copy()
+    copied['level'] = 'warn'
+    assert first['tags'] == {'x'} and second['tags'] == set()
+    assert '_name' not in first and second['_name'] == '/a.log'
+    assert 'level' not in first
+
+
+def test_file_info_pickled_once():
+    file = FileInfo('/a.log', {'_name': '/a.log'})
+    records = pickle.loads(pickle.dumps([LogRecord({'line': one}, file) for one in range(3)]))
+    assert [dict(one) for one in records] == [{'line': one, '_name': '/a.log'} for one in range(3)]
+    assert records[0].file is records[2].file
+
+
+def test_interned_values_shared():
+    interner = Interner()
+    first = interner.intern(''.join(['err', 'or']))
+    assert interner.intern(''.join(['er', 'ror'])) is first
+    assert interner.intern(None) is None
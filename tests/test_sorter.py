@@ -0,0 +1,47 @@
+import heapq
+import os
+import random
+
+import pytest
+
+from deep_log.sorter import ExternalSorter, read_run, reduce_runs, write_run
+
+
+def test_spilled_sort_is_stable(tmp_path):
+    records = [{'key': random.randint(0, 20), 'index': index} for index in range(5000)]
+    sorter = ExternalSorter(key=lambda x: x['key'], max_memory=5000, temp_dir=str(tmp_path))
+    sorter.extend(records)
+    assert len(sorter.runs) > 64
+    assert list(sorter.sorted()) == sorted(records, key=lambda x: x['key'])
+    assert len(os.listdir(str(tmp_path))) <= 64
+
+
+def test_reduce_runs_keeps_order_of_runs(tmp_path):
+    key = lambda x: x['key']
+    runs = [write_run(sorted([{'key': random.randint(0, 5), 'run': run} for _ in range(20)], key=key), str(tmp_path))
+            for run in range(10)]
+    expected = sorted([one for run in runs for one in read_run(run)], key=key)
+    reduced = reduce_runs(runs, key, fan_in=3)
+    assert len(reduced) <= 3
+    assert sorted(os.listdir(str(tmp_path))) == sorted(os.path.basename(one) for one in reduced)
+    assert list(heapq.merge(*[read_run(one) for one in reduced], key=key)) == expected
+
+
+def test_order_by_many_files_with_max_memory(workspace):
+    for index in range(300):
+        workspace.write_log('f{:03}.log'.format(index), count=5, seed=index)
+    args = ['--order-by', 'level', '-m', '{level} {_basename} {_line_number}']
+    expected = workspace.run(*args, '--workers', '1')
+    assert len(expected) == 1500
+    assert workspace.run(*args, '--max-memory', '100', '--workers', '2', open_files=128) == expected
+
+
+@pytest.mark.parametrize('reverse', [[], ['--reverse']])
+def test_top_records_same_as_sorted_head(workspace, reverse):
+    for index in range(3):
+        workspace.write_log('f{}.log'.format(index), count=300, seed=index)
+    args = ['--order-by', 'latency', *reverse, '-m', '{latency} {_basename} {_line_number}']
+    expected = workspace.run(*args, '--workers', '1')[:5]
+    # ties keep order of files & records, same as sorting all records
+    assert workspace.run(*args, '--limit', '5', '--workers', '1') == expected
+    assert workspace.run(*args, '--limit', '5', '--workers', '2', '--shard-size', '1') == expected
@@ -0,0 +1,97 @@
+import os
+import pickle
+
+import pytest
+
+from deep_log.record import FileInfo, LogRecord
+from deep_log.transport import SEGMENT_DIR, SharedRecord, load_batch, remove_segments, share_batch, start_transport
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(SEGMENT_DIR), reason='no shared memory dir')
+
+FILES = [FileInfo('/a.log', {'filename': 'a.log', 'path': '/'}), FileInfo('/b.log', {'filename': 'b.log', 'path': '/'})]
+
+
+def make_batch(count=10, files=FILES):
+    # str, category, int, float, none and object columns
+    return [LogRecord({'_record': 'line %s\n' % i, 'level': 'error' if i % 3 else 'warn', 'line': i,
+                       'latency': i / 4, 'tags': None, 'extra': {'i': [i]} if i % 2 else 'e%s' % i},
+                      files[i % len(files)]) for i in range(count)]
+
+
+def segment_exists(batch):
+    return os.path.exists(os.path.join(SEGMENT_DIR, batch.name))
+
+
+@pytest.fixture
+def session():
+    session = start_transport()
+    yield session
+    remove_segments(session)
+
+
+@pytest.mark.parametrize('files', [FILES, FILES[:1]])
+def test_records_round_trip(session, files):
+    batch = make_batch(files=files)
+    shared = share_batch(batch, session)
+    assert len(shared) > 0 and segment_exists(shared)
+    records = list(load_batch(shared))
+    # segment is unlinked once loaded, columns are read from the attached mapping
+    assert not segment_exists(shared)
+    assert all(type(one) is SharedRecord for one in records)
+    assert [one['level'] for one in records] == [one['level'] for one in batch]
+    assert [one['filename'] for one in records] == [one['filename'] for one in batch]
+    assert 'latency' in records[0] and 'filename' in records[0] and 'other' not in records[0]
+    assert [dict(one) for one in records] == [dict(one) for one in batch]
+    assert [list(one) for one in records] == [list(one) for one in batch]
+
+
+def test_records_changed_after_load(session):
+    records = list(load_batch(share_batch(make_batch(), session)))
+    first, second = records[0], records[1]
+    first['tags'].add('x')
+    assert first['tags'] == {'x'} and second['tags'] == set()
+    first['level'] = 'info'
+    del second['filename']
+    assert first['level'] == 'info' and records[2]['level'] == 'error'
+    assert 'filename' not in second and records[3]['filename'] == 'b.log'
+    copied = pickle.loads(pickle.dumps(first))
+    assert type(copied) is LogRecord and dict(copied) == dict(first)
+
+
+def test_other_batches_pickled(session):
+    batch = [{'level': 'error'}, {'level': 'warn'}]
+    assert load_batch(share_batch(batch, session)) == batch
+    # records of different fields
+    records = make_batch(2)
+    del records[1]['extra']
+    assert [dict(one) for one in load_batch(share_batch(records, session))] == [dict(one) for one in records]
+    assert load_batch(share_batch([], session)) == []
+
+
+def test_values_with_separator_kept(session):
+    batch = [LogRecord({'content': value, 'count': count}, FILES[0])
+             for value, count in [('a\x00b', 1), ('\udcff', 2 ** 70), ('', -1)]]
+    assert [dict(one) for one in load_batch(share_batch(batch, session))] == [dict(one) for one in batch]
+
+
+def test_segments_removed_by_session(session):
+    other = start_transport()
+    mine = share_batch(make_batch(), session)
+    kept = share_batch(make_batch(), other)
+    remove_segments(session)
+    # segments of other sessions (e.g. another dl process) are left to their consumer
+    assert not segment_exists(mine) and segment_exists(kept)
+    assert len(list(load_batch(kept))) == 10
+
+
+def test_shared_memory_run_same_as_queue(workspace):
+    for index in range(4):
+        workspace.write_log('f{}.log'.format(index), count=300, seed=index)
+    before = set(os.listdir(SEGMENT_DIR))
+    # files are printed in order of finished batches
+    expected = sorted(workspace.run('--workers', '2'))
+    assert len(expected) >= 1200
+    assert sorted(workspace.run('--workers', '2', '--shared-memory')) == expected
+    args = ['--workers', '2', '--format', '{level} {filename} {latency}']
+    assert sorted(workspace.run(*args, '--shared-memory')) == sorted(workspace.run(*args))
+    assert set(os.listdir(SEGMENT_DIR)) == before
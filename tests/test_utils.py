@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from deep_log import utils
+from deep_log.distinct import fingerprint
+
+
+def test_fingerprint_by_name_or_file(tmp_path):
+    file_name = str(tmp_path / 'a.log')
+    with open(file_name, 'wb') as f:
+        f.write(b'x' * (utils.FINGERPRINT_SIZE + 10))
+    with open(file_name, 'rb') as f:
+        f.seek(100)
+        assert utils.get_fingerprint(f, 50) == utils.get_fingerprint(file_name, 50)
+    # leading bytes only
+    assert utils.get_fingerprint(file_name, utils.FINGERPRINT_SIZE) == utils.get_fingerprint(file_name, 10 ** 9)
+    assert utils.get_fingerprint(file_name, 10) != utils.get_fingerprint(file_name, 11)
+
+
+@pytest.mark.parametrize('suffix', ['.json', '.json.gz'])
+def test_cache_saved_and_loaded(tmp_path, suffix):
+    cache_file = utils.get_cache_file(str(tmp_path / 'cache'), '/var/log/a.log', suffix)
+    assert cache_file.endswith(suffix) and utils.load_cache(cache_file, 'test') is None
+    utils.save_cache(cache_file, {'blocks': [1, 2]})
+    assert utils.load_cache(cache_file, 'test') == {'blocks': [1, 2]}
+    assert os.listdir(str(tmp_path / 'cache')) == [os.path.basename(cache_file)]
+
+
+def test_cache_saved_by_own_temp_file(tmp_path):
+    cache_file = str(tmp_path / 'a.json')
+    utils.save_cache(cache_file, {'count': 1})
+    # temp file of another process saving same cache file is left alone
+    os.mkdir(cache_file + '.tmp')
+    utils.save_cache(cache_file, {'count': 2})
+    with pytest.raises(TypeError):
+        utils.save_cache(cache_file, {'count': object()})
+    assert utils.load_cache(cache_file, 'test') == {'count': 2}
+    assert sorted(os.listdir(str(tmp_path))) == ['a.json', 'a.json.tmp']
+
+
+def test_broken_cache_ignored(tmp_path, caplog):
+    cache_file = str(tmp_path / 'a.json')
+    with open(cache_file, 'w') as f:
+        f.write('{"blocks": [')
+    assert utils.load_cache(cache_file, 'zone map') is None
+    assert 'zone map' in caplog.text
+
+
+@pytest.mark.parametrize('key', [lambda value: 'token-{}'.format(value), lambda value: fingerprint((value,))])
+def test_bloom_filter_sized_for_capacity(key):
+    keys = [key(one) for one in range(1000)]
+    bloom = utils.BloomFilter(capacity=len(keys), error_rate=0.01)
+    # false positives while filling up
+    found = sum(1 for one in keys if bloom.add(one))
+    assert found < 20 and bloom.count == len(keys) - found
+    assert all(one in bloom for one in keys)
+    assert bloom.add(keys[0]) and bloom.count == len(keys) - found
+    assert bloom.error_rate() < 0.02
+    assert sum(1 for one in range(1000, 11000) if key(one) in bloom) < 300
+    # persisted filter keeps its keys
+    assert all(one in utils.BloomFilter.from_dict(bloom.to_dict()) for one in keys)
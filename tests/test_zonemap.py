@@ -0,0 +1,19 @@
+from deep_log.dsl import extract_block_constraints
+
+
+def test_internal_fields_not_constrained():
+    assert extract_block_constraints("_line_number > 100 and _size > 0 and tags == 'a'") == []
+    assert extract_block_constraints("_line_number > 100 and level == 'error'") == [
+        ('values', 'level', frozenset(['error']))]
+
+
+def test_same_results_once_indexed(workspace):
+    workspace.write_log('a.log', count=500)
+    args = ['-m', '{_line_number} {content}', '--zone-map', '--zone-block-size', '4']
+    for query in ["_line_number > 100", "_line_number > 100 and level == 'error'", "latency >= 900",
+                  "'worker 42 ' in _record"]:
+        expected = workspace.run('-l', query, '-m', '{_line_number} {content}')
+        assert expected
+        # first run builds zone map, second one skips blocks by it
+        assert workspace.run('-l', query, *args) == expected
+        assert workspace.run('-l', query, *args) == expected